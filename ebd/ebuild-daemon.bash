@@ -349,23 +349,28 @@ __ebd_process_ebuild_phases() {
 }
 
 __ebd_process_metadata() {
+	local __data
+	__ebd_read_size "$1" __data
+	__ebd_run_metadata "${2:-depend}" "${__data}"
+}
+
+# Run a metadata phase ($1) after evaluating each remaining arg as an env
+# fragment, in order.
+__ebd_run_metadata() {
 	# protect the env.
 	# note the local usage is redundant in light of it, but prefer to write it this
 	# way so that if someone ever drops the (), it'll still not bleed out.
 	(
 		# Heavy QA checks (IFS, shopt, etc) are suppressed for speed
 		declare -r PKGCORE_QA_SUPPRESSED=false
-		# Wipe __mode; it bleeds from our parent.
-		unset -v __mode
-		local __data
-		local __ret
-		__ebd_read_size "$1" __data
+		# Wipe __mode and batch state; they bleed from our parent.
+		unset -v __mode __data __size __i __ebd_batch_prefix __ebd_batch_envs
+		local __env
 		local IFS=$'\0'
-		eval "$__data"
-		__ret=$?
-		unset -v __data
-		[[ ${__ret} -ne 0 ]] && exit 1
-		unset -v __ret
+		for __env in "${@:2}"; do
+			eval "${__env}" || exit 1
+		done
+		unset -v __env
 		local IFS=$' \t\n'
 
 		if [[ -n ${PKGCORE_METADATA_PATH} ]]; then
@@ -373,12 +378,32 @@ __ebd_process_metadata() {
 		fi
 
 		PKGCORE_SANDBOX_PID=${PPID}
-		__execute_phases "${2:-depend}" && exit 0
+		__execute_phases "$1" && exit 0
 		__ebd_process_sandbox_results
 		exit 1
 	)
 }
 
+# Source metadata for a batch of ebuilds; args are the number of ebuilds and
+# the size of the env prefix shared by all of them.  The whole batch is read
+# before processing starts since inherit requests reuse the same pipe.
+__ebd_process_metadata_batch() {
+	local __ebd_batch_prefix __size __i
+	local -a __ebd_batch_envs
+	__ebd_read_size "$2" __ebd_batch_prefix
+	for (( __i=0; __i < $1; __i++ )); do
+		__ebd_read_line __size
+		__ebd_read_size "${__size}" "__ebd_batch_envs[${__i}]"
+	done
+	for (( __i=0; __i < $1; __i++ )); do
+		if __ebd_run_metadata depend "${__ebd_batch_prefix}" "${__ebd_batch_envs[${__i}]}"; then
+			__ebd_write_line "metadata_done succeeded"
+		else
+			__ebd_write_line "metadata_done failed"
+		fi
+	done
+}
+
 __make_preloaded_eclass_func() {
 	eval "__preloaded_eclass_$1() {
 		$2
@@ -426,6 +451,13 @@ __ebd_main_loop() {
 				__ebd_write_line "preload_eclass ${success}"
 				unset -v e x success
 				;;
+			preload_eclass_bundle\ *)
+				if source "${com#preload_eclass_bundle }"; then
+					__ebd_write_line "preload_eclass_bundle succeeded"
+				else
+					__ebd_write_line "preload_eclass_bundle failed"
+				fi
+				;;
 			clear_preloaded_eclasses)
 				unset -v PKGCORE_PRELOADED_ECLASSES
 				declare -A PKGCORE_PRELOADED_ECLASSES
@@ -436,6 +468,10 @@ __ebd_main_loop() {
 				__ebd_read_size "${line}" PKGCORE_METADATA_PATH
 				__ebd_write_line "metadata_path_received"
 				;;
+			gen_metadata_batch\ *)
+				__ebd_process_metadata_batch ${com#gen_metadata_batch }
+				__ebd_write_line "phases succeeded"
+				;;
 			gen_metadata\ *|gen_ebuild_env\ *)
 				local __mode="depend"
 				[[ ${com} == gen_ebuild_env* ]] && __mode="generate_env"
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""Benchmark the resolver against synthetic or snapshotted repos."""
+
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+
+try:
+    from snakeoil.cli import arghparse
+    from pkgcore.ebuild.atom import atom
+    from pkgcore.ebuild.cpv import CPV
+    from pkgcore.resolver import benchmark
+    from pkgcore.util import commandline
+except ImportError:
+    print('Cannot import pkgcore!', file=sys.stderr)
+    print('Verify it is properly installed and/or PYTHONPATH is set correctly.', file=sys.stderr)
+    if '--debug' not in sys.argv:
+        print('Add --debug to the commandline for a traceback.', file=sys.stderr)
+    else:
+        raise
+    sys.exit(1)
+
+
+argparser = commandline.ArgumentParser(
+    config=False, domain=False, color=False, version=False, description=__doc__)
+
+synthetic = argparser.add_argument_group(
+    'synthetic repo', 'shape of the generated repo, used if no snapshot is given')
+synthetic.add_argument('--chains', type=int, default=10, help='dependency chains')
+synthetic.add_argument('--depth', type=int, default=10, help='length of each chain')
+synthetic.add_argument('--fanout', type=int, default=50,
+                       help='deps of the pkg fanning out')
+synthetic.add_argument('--blockers', type=int, default=10, help='blocking pkgs')
+synthetic.add_argument('--slot-conflicts', type=int, default=10,
+                       help='libraries with conflicting consumers')
+synthetic.add_argument('--versions', type=int, default=2,
+                       help='versions of each pkg')
+
+snapshot = argparser.add_argument_group('snapshot repo')
+snapshot.add_argument('--md5-cache', metavar='PATH', type=arghparse.existent_path,
+                      help='repo, or md5-cache dir, to load the repo from')
+snapshot.add_argument('--vdb', metavar='PATH', type=arghparse.existent_path,
+                      help='copy of a vdb to load the installed pkgs from')
+snapshot.add_argument('--installed-fraction', type=float, default=0.2,
+                      help='without --vdb, portion of the repo\'s pkgs to install')
+
+run = argparser.add_argument_group('run')
+run.add_argument('-s', '--scenario', action='append', dest='scenarios',
+                 choices=sorted(benchmark.scenarios),
+                 help='scenario to run, defaults to all of them')
+run.add_argument('-a', '--atom', action='append', dest='atoms', type=atom,
+                 help='atom to resolve, defaults to every installed pkg')
+run.add_argument('-n', '--runs', type=int, default=3,
+                 help='times to run each scenario')
+run.add_argument('--json', metavar='FILE', type=argparse.FileType('w'),
+                 help='write the results as JSON')
+run.add_argument('--baseline', metavar='FILE', type=argparse.FileType('r'),
+                 help='JSON results to check for regressions against')
+run.add_argument('--tolerance', type=float, default=0.2,
+                 help='slowdown or memory growth allowed against the baseline')
+run.add_argument('--no-fork', dest='fork', action='store_false', default=True,
+                 help='run scenarios in this process; memory use is then '
+                      'cumulative across scenarios')
+
+
+@argparser.bind_main_func
+def main(options, out, err):
+    if options.md5_cache:
+        repo = benchmark.load_md5_cache(options.md5_cache)
+        if options.vdb:
+            vdb = benchmark.load_vdb(options.vdb)
+        else:
+            vdb = benchmark.installed_subset(repo, options.installed_fraction)
+        atoms = sorted(set(CPV(x, versioned=True).key for x in vdb))
+        atoms = [atom(x) for x in atoms]
+    else:
+        repo, vdb, atoms = benchmark.synthetic_metadata(
+            chains=options.chains, depth=options.depth, fanout=options.fanout,
+            blockers=options.blockers, slot_conflicts=options.slot_conflicts,
+            versions=options.versions)
+    if options.atoms:
+        atoms = options.atoms
+    out.write('%i pkgs, %i installed, resolving %i atoms' % (
+        len(repo), len(vdb), len(atoms)))
+
+    results = []
+    for result in benchmark.run(repo, vdb, atoms, names=options.scenarios,
+                                runs=options.runs, fork=options.fork):
+        out.write(str(result))
+        results.append(result)
+
+    if options.json is not None:
+        with options.json as f:
+            json.dump({x.name: x.to_dict() for x in results}, f,
+                      indent=1, sort_keys=True)
+            f.write('\n')
+
+    ret = 0
+    if options.baseline is not None:
+        with options.baseline as f:
+            baseline = json.load(f)
+        for result, field, old in benchmark.compare(
+                baseline, results, options.tolerance):
+            if field == 'best':
+                err.write('%s regressed: %.3fs, was %.3fs' % (
+                    result.name, result.best, old))
+            else:
+                err.write('%s regressed: %i KiB peak rss growth, was %i KiB' % (
+                    result.name, result.peak_rss, old))
+            ret = 1
+    return ret
+
+
+if __name__ == '__main__':
+    commandline.main(argparser)
@@ -10,11 +10,12 @@ local binpkg repositories
 
 __all__ = ("PackagesCacheV0", "PackagesCacheV1")
 
+from functools import partial
 from itertools import izip
 import os
 
 from snakeoil.demandload import demandload
-from snakeoil.mappings import ImmutableDict, StackedDict
+from snakeoil.mappings import DictMixin, ImmutableDict, StackedDict
 from snakeoil.weakrefs import WeakRefFinalizer
 
 from pkgcore import cache
@@ -23,9 +24,11 @@ demandload(
     'errno',
     'operator:itemgetter',
     'time:time',
-    'snakeoil.chksum:get_chksums',
+    'snakeoil.chksum:get_chksums,LazilyHashedPath',
     'snakeoil.containers:RefCountingSet',
     'snakeoil.fileutils:AtomicWriteFile,readlines',
+    'snakeoil.osutils:stat_mtime_long',
+    'pkgcore.binpkg.xpak:scan_binpkgs',
     'pkgcore.log:logger',
     'pkgcore.restrictions.packages:AlwaysTrue',
 )
@@ -52,6 +55,80 @@ class CacheEntry(StackedDict):
             return default
 
 
+class LazyCacheEntries(DictMixin):
+    """Mapping of cpv to cache entry, decoding Packages records on demand.
+
+    Records not yet decoded are tracked by their offset in the Packages file;
+    iterating over items decodes the remainder in a single pass.
+    """
+
+    def __init__(self, location, offsets, decode):
+        """
+        :param location: path of the Packages file
+        :param offsets: mapping of cpv to the offset of its record
+        :param decode: callable taking a record's raw mapping, returning
+            the cpv and cache entry
+        """
+        self._location = location
+        self._offsets = dict(offsets)
+        self._decode = decode
+        self._entries = {}
+
+    def _read(self, handle, cpv):
+        handle.seek(self._offsets[cpv])
+        found, entry = self._decode(dict(
+            _iter_till_empty_newline(x.strip() for x in handle)))
+        if found != cpv:
+            self._offsets.pop(cpv, None)
+            logger.warning(
+                "binpkg cache index is stale, %s was expected at its offset "
+                "in %r, found %s", cpv, self._location, found)
+            raise KeyError(cpv)
+        # store the entry before dropping the offset so concurrent lookups
+        # always find one or the other.
+        self._entries[cpv] = entry
+        self._offsets.pop(cpv, None)
+        return entry
+
+    def __getitem__(self, cpv):
+        entry = self._entries.get(cpv)
+        if entry is None:
+            if cpv not in self._offsets:
+                raise KeyError(cpv)
+            with open(self._location, 'rb') as f:
+                entry = self._read(f, cpv)
+        return entry
+
+    def __setitem__(self, cpv, entry):
+        self._offsets.pop(cpv, None)
+        self._entries[cpv] = entry
+
+    def __delitem__(self, cpv):
+        if self._offsets.pop(cpv, None) is None:
+            del self._entries[cpv]
+
+    def __contains__(self, cpv):
+        return cpv in self._entries or cpv in self._offsets
+
+    def __len__(self):
+        return len(self._entries) + len(self._offsets)
+
+    def iterkeys(self):
+        return iter(self._entries.keys() + self._offsets.keys())
+
+    def iteritems(self):
+        if self._offsets:
+            with open(self._location, 'rb') as f:
+                for cpv, _ in sorted(self._offsets.items(), key=itemgetter(1)):
+                    try:
+                        self._read(f, cpv)
+                    except KeyError:
+                        # stale index; the entry is dropped, and regenerated
+                        # on next access.
+                        pass
+        return self._entries.iteritems()
+
+
 def find_best_savings(stream, line_prefix):
     rcs = RefCountingSet(stream)
     line_overhead = len(line_prefix)
@@ -106,8 +183,16 @@ class PackagesCacheV0(cache.bulk):
 
     version = 0
 
+    _index_magic = 'pkgcore-packages-index 1'
+
     def __init__(self, location, *args, **kwds):
         self._location = location
+        self._index_location = location + '.index'
+        # state of the Packages file as last read or written; used to
+        # check it's safe to append to.
+        self._disk_stat = None
+        self._disk_offsets = {}
+        self._header_fields = {}
         vkeys = {'CPV'}
         vkeys.update(self._deserialized_defaults)
         vkeys.update(x.upper() for x in self._stored_chfs)
@@ -122,43 +207,173 @@ class PackagesCacheV0(cache.bulk):
             (self._header_mangling_map.get(k, k), v)
             for k, v in _iter_till_empty_newline(handle))
 
+    def _read_header(self, handle):
+        """Read the preamble, tracking where each value lies for updating.
+
+        :return: offset of the first record
+        """
+        offset = 0
+        lines = []
+        self._header_fields = {}
+        for line in handle:
+            start, offset = offset, offset + len(line)
+            stripped = line.strip()
+            if not stripped:
+                break
+            lines.append(stripped)
+            key, value = stripped.split(':', 1)
+            value = value.strip()
+            if value:
+                self._header_fields[key] = (
+                    start + line.index(value, line.index(':') + 1), len(value))
+        self.preamble = self.read_preamble(lines)
+        return offset
+
+    def _decode_entry(self, raw_d, defaults):
+        vkeys = self._known_keys
+        d = {k: v for k, v in raw_d.iteritems() if k in vkeys}
+        if not d:
+            return None, None
+        cpv = d.pop("CPV", None)
+        if cpv is None:
+            cpv = "%s/%s" % (d.pop("CATEGORY"), d.pop("PF"))
+
+        if 'USE' in d:
+            d.setdefault('IUSE', d.get('USE', ''))
+        for src, dst in self._deserialize_map.iteritems():
+            if src in d:
+                d.setdefault(dst, d.pop(src))
+        return cpv, CacheEntry(d, defaults)
+
+    def _scan_offsets(self, handle, offset):
+        """Find the offset of each record without decoding them.
+
+        :return: tuple of the mapping of cpv to record offset, and whether
+            the file is intact, i.e. safe to append to; it isn't if its
+            package count doesn't match the records or the last record is
+            unterminated, both left by an interrupted append.  An
+            unterminated trailing record beyond the count is dropped.
+        """
+        offsets = {}
+        count = 0
+        start = None
+        keys = {}
+        for line in handle:
+            stripped = line.strip()
+            if stripped:
+                if start is None:
+                    start = offset
+                key, _, value = stripped.partition(':')
+                if key in ('CPV', 'CATEGORY', 'PF'):
+                    keys[key] = value.strip()
+            elif start is None:
+                # an empty record ends the file
+                break
+            else:
+                count += 1
+                offsets[keys.get('CPV') or '%s/%s' % (
+                    keys.get('CATEGORY'), keys.get('PF'))] = start
+                start = None
+                keys = {}
+            offset += len(line)
+        expected = int(self.preamble.get('PACKAGES', -1))
+        # an unterminated record can't be appended after, so either way the
+        # file is rewritten on the next update.
+        intact = start is None
+        if start is None:
+            pass
+        elif expected == -1 or count < expected:
+            # the last record just lacks its terminating empty line
+            count += 1
+            offsets[keys.get('CPV') or '%s/%s' % (
+                keys.get('CATEGORY'), keys.get('PF'))] = start
+        else:
+            logger.warning(
+                "dropping truncated record at offset %i of %r", start,
+                self._location)
+        if expected not in (-1, count):
+            logger.warning(
+                "binpkg Packages cache %r lists %i packages, but has %i; "
+                "it'll be rewritten on the next update", self._location,
+                expected, count)
+            intact = False
+        return offsets, intact
+
+    @staticmethod
+    def _stat_key(st):
+        return st.st_mtime, st.st_size, st.st_ino
+
+    def _read_index(self, st):
+        """Return the offsets from the index, or None if it's stale."""
+        try:
+            with open(self._index_location, 'rb') as f:
+                if f.readline().strip() != self._index_magic:
+                    return None
+                mtime, size = f.readline().split()
+                if float(mtime) != st.st_mtime or int(size) != st.st_size:
+                    return None
+                offsets = {}
+                for line in f:
+                    cpv, offset = line.split()
+                    offsets[cpv] = int(offset)
+                return offsets
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except ValueError:
+            pass
+        return None
+
+    def _write_index(self, offsets, st):
+        handler = None
+        try:
+            try:
+                handler = AtomicWriteFile(self._index_location)
+                handler.write("%s\n%r %i\n" % (
+                    self._index_magic, st.st_mtime, st.st_size))
+                for cpv, offset in sorted(offsets.iteritems(), key=itemgetter(1)):
+                    handler.write("%s %i\n" % (cpv, offset))
+                handler.close()
+            except EnvironmentError as e:
+                if e.errno not in (errno.EACCES, errno.EROFS):
+                    raise
+                # the index is only an optimization
+                logger.debug(
+                    "failed writing binpkg Packages index to %r: %s",
+                    self._index_location, e)
+        finally:
+            if handler is not None:
+                handler.discard()
+
     def _read_data(self):
         try:
-            handle = self._handle()
+            handle = open(self._location, 'rb')
         except EnvironmentError as e:
             if e.errno == errno.ENOENT:
                 return {}
             raise
-        self.preamble = self.read_preamble(handle)
+        with handle:
+            st = os.fstat(handle.fileno())
+            offset = self._read_header(handle)
+            offsets = self._read_index(st)
+            intact = True
+            if offsets is None:
+                handle.seek(offset)
+                offsets, intact = self._scan_offsets(handle, offset)
+            if intact:
+                self._write_index(offsets, st)
+        # a damaged file is never appended to, forcing a full rewrite.
+        self._disk_stat = self._stat_key(st) if intact else None
+        self._disk_offsets = offsets
 
         defaults = dict(self._deserialized_defaults.iteritems())
         defaults.update((k, v) for k, v in self.preamble.iteritems()
                         if k in self.deserialized_inheritable)
         defaults = ImmutableDict(defaults)
 
-        pkgs = {}
-        count = 0
-        vkeys = self._known_keys
-        while True:
-            raw_d = dict(_iter_till_empty_newline(handle))
-
-            d = {k: v for k, v in raw_d.iteritems() if k in vkeys}
-            if not d:
-                break
-            count += 1
-            cpv = d.pop("CPV", None)
-            if cpv is None:
-                cpv = "%s/%s" % (d.pop("CATEGORY"), d.pop("PF"))
-
-            if 'USE' in d:
-                d.setdefault('IUSE', d.get('USE', ''))
-            for src, dst in self._deserialize_map.iteritems():
-                if src in d:
-                    d.setdefault(dst, d.pop(src))
-
-            pkgs[cpv] = CacheEntry(d, defaults)
-        assert count == int(self.preamble.get('PACKAGES', count))
-        return pkgs
+        return LazyCacheEntries(
+            self._location, offsets,
+            partial(self._decode_entry, defaults=defaults))
 
     @classmethod
     def _assemble_preamble_dict(cls, target_dicts):
@@ -198,11 +413,13 @@ class PackagesCacheV0(cache.bulk):
         return d
 
     def _write_data(self):
+        if self._append_data():
+            return
         handler = None
         try:
             try:
                 handler = AtomicWriteFile(self._location)
-                self._serialize_to_handle(self.data.items(), handler)
+                offsets = self._serialize_to_handle(self.data.items(), handler)
                 handler.close()
             except EnvironmentError as e:
                 if e.errno != errno.EACCES:
@@ -210,26 +427,105 @@ class PackagesCacheV0(cache.bulk):
                 logger.error(
                     "failed writing binpkg Packages cache to %r; permissions issue %s",
                     self._location, e)
+                return
         finally:
             if handler is not None:
                 handler.discard()
+        with open(self._location, 'rb') as f:
+            st = os.fstat(f.fileno())
+            self._read_header(f)
+        self._disk_stat = self._stat_key(st)
+        self._disk_offsets = offsets
+        self._write_index(offsets, st)
+
+    def _append_data(self):
+        """Append records for new pkgs rather than rewriting the file.
+
+        This is only done if the pending updates solely add pkgs, the file is
+        as last read or written, and its header counts can be updated in
+        place.  The preamble isn't reoptimized for the new records; the next
+        full write handles that.
+
+        :return: True if the updates were appended
+        """
+        if self._disk_stat is None:
+            return False
+        updates = {}
+        for cpv, value in self._pending_updates:
+            if value is None or cpv in self._disk_offsets:
+                return False
+            updates[cpv] = value
+        header = {
+            'PACKAGES': str(len(self._disk_offsets) + len(updates)),
+            'TIMESTAMP': str(int(time()))}
+        for key, value in header.iteritems():
+            field = self._header_fields.get(key)
+            if field is None or len(value) > field[1]:
+                return False
+            header[key] = (field[0], value.ljust(field[1]))
+        try:
+            handle = open(self._location, 'r+b')
+        except EnvironmentError as e:
+            if e.errno != errno.EACCES:
+                raise
+            return False
+        with handle:
+            if self._stat_key(os.fstat(handle.fileno())) != self._disk_stat:
+                return False
+            handle.seek(0, 2)
+            # records only inherit the preamble values the reader does.
+            preamble = {k: v for k, v in self.preamble.iteritems()
+                        if k in self.deserialized_inheritable}
+            offsets = self._serialize_records(
+                sorted(updates.iteritems()), handle.write, preamble,
+                handle.tell())
+            # the records have to hit the disk before the header counts them;
+            # if interrupted before that, readers see extra or truncated
+            # trailing records and force a full rewrite.
+            handle.flush()
+            os.fsync(handle.fileno())
+            for offset, value in header.itervalues():
+                handle.seek(offset)
+                handle.write(value)
+            handle.flush()
+            st = os.fstat(handle.fileno())
+        self._disk_stat = self._stat_key(st)
+        preamble = dict(self.preamble)
+        preamble.update((k, v.strip()) for k, (_, v) in header.iteritems())
+        self.preamble = ImmutableDict(preamble)
+        self._disk_offsets.update(offsets)
+        self._write_index(self._disk_offsets, st)
+        return True
 
     def _serialize_to_handle(self, data, handler):
+        """Write the cache, returning a mapping of cpv to record offset."""
         preamble = self._assemble_preamble_dict(data)
 
         convert_key = self._serialize_map.get
 
+        position = 0
         for key in sorted(preamble):
-            handler.write("%s: %s\n" % (convert_key(key, key), preamble[key]))
+            line = "%s: %s\n" % (convert_key(key, key), preamble[key])
+            handler.write(line)
+            position += len(line)
         handler.write('\n')
 
+        return self._serialize_records(
+            sorted(data, key=itemgetter(0)), handler.write, preamble,
+            position + 1)
+
+    def _serialize_records(self, data, write, preamble, position):
+        convert_key = self._serialize_map.get
+
         spacer = ' '
         if self.version != 0:
             spacer = ''
 
         vkeys = self._known_keys
-        for cpv, pkg_data in sorted(data, key=itemgetter(0)):
-            handler.write("CPV:%s%s\n" % (spacer, cpv))
+        offsets = {}
+        for cpv, pkg_data in data:
+            offsets[cpv] = position
+            lines = ["CPV:%s%s\n" % (spacer, cpv)]
             data = [(convert_key(key, key), value)
                     for key, value in pkg_data.iteritems()]
             for write_key, value in sorted(data):
@@ -239,24 +535,70 @@ class PackagesCacheV0(cache.bulk):
                 if write_key in preamble:
                     if value != preamble[write_key]:
                         if value:
-                            handler.write("%s:%s%s\n" % (write_key, spacer, value))
+                            lines.append("%s:%s%s\n" % (write_key, spacer, value))
                         else:
-                            handler.write("%s:\n" % (write_key,))
+                            lines.append("%s:\n" % (write_key,))
                 elif value:
-                    handler.write("%s:%s%s\n" % (write_key, spacer, value))
-            handler.write('\n')
-
-    def update_from_xpak(self, pkg, xpak):
+                    lines.append("%s:%s%s\n" % (write_key, spacer, value))
+            lines.append('\n')
+            record = ''.join(lines)
+            write(record)
+            position += len(record)
+        return offsets
+
+    def update_from_xpak(self, pkg, xpak, chksums=None):
+        """Update the entry of a pkg from its xpak.
+
+        :param chksums: mapping of chksum type to the chksums of the binpkg
+            already known; any others are computed from the file
+        """
         # invert the lookups here; if you do .iteritems() on an xpak,
         # it'll load up the contents in full.
         new_dict = {k: xpak[k] for k in self._known_keys if k in xpak}
         new_dict['_chf_'] = xpak._chf_
-        chfs = [x for x in self._stored_chfs if x != 'mtime']
-        for key, value in izip(chfs, get_chksums(pkg.path, *chfs)):
+        values = dict(chksums) if chksums else {}
+        missing = [x for x in self._file_chfs if x not in values]
+        values.update(izip(missing, get_chksums(pkg.path, *missing)))
+        return self._update_entry(pkg.cpvstr, new_dict, values)
+
+    def update_from_binpkgs(self, binpkgs, threads=None):
+        """Update the entries of many pkgs, scanning their binpkgs in bulk.
+
+        Each binpkg is opened once to both read its xpak and chksum it, the
+        scans are spread across a pool of threads, and the cache is written
+        out once at the end.
+
+        :param binpkgs: iterable of (cpv string, binpkg path) pairs
+        :param threads: number of threads to scan with, defaults to the
+            cpu count
+        :return: mapping of cpv string to the error raised scanning its binpkg
+        """
+        cpvs = {path: cpvstr for cpvstr, path in binpkgs}
+        results, errors = scan_binpkgs(
+            cpvs, self._known_keys, self._file_chfs, threads=threads)
+        sync_rate = self.sync_rate
+        self.set_sync_rate(len(results) + 1)
+        try:
+            for path, (new_dict, chksums, st) in results.iteritems():
+                new_dict['_chf_'] = LazilyHashedPath(
+                    path, mtime=stat_mtime_long(path, st))
+                self._update_entry(cpvs[path], new_dict, chksums)
+        finally:
+            self.set_sync_rate(sync_rate)
+        self.commit()
+        return {cpvs[k]: v for k, v in errors.iteritems()}
+
+    @property
+    def _file_chfs(self):
+        return tuple(x for x in self._stored_chfs if x != 'mtime')
+
+    def _update_entry(self, cpvstr, new_dict, chksums):
+        for key in self._file_chfs:
+            value = chksums[key]
             if key != 'size':
                 value = "%x" % (value,)
             new_dict[key.upper()] = value
-        self[pkg.cpvstr] = new_dict
+        self[cpvstr] = new_dict
         return new_dict
 
     def update_from_repo(self, repo):
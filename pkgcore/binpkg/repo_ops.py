@@ -12,15 +12,17 @@ modify a binpkg repository operation- changing how it installs, or changing how
 it uninstalls, or adding a new operation (cleaning/cache regen for example).
 """
 
-__all__ = ("install", "uninstall", "replace", "operations")
+__all__ = ("install", "uninstall", "replace", "operations", "write_binpkg")
 
 import os
 
+from snakeoil.chksum import get_handlers
 from snakeoil.compression import compress_data
 from snakeoil.demandload import demandload
 from snakeoil.klass import steal_docs
 from snakeoil.osutils import pjoin, unlink_if_exists, ensure_dirs
 
+from pkgcore import operations as _operations_mod
 from pkgcore.binpkg import xpak
 from pkgcore.ebuild.conditionals import stringify_boolean
 from pkgcore.fs import tar
@@ -75,6 +77,46 @@ def generate_attr_dict(pkg, portage_compatible=True):
     return d
 
 
+class _chksum_writer(object):
+    """File-like writing through to a handle, checksumming what's written."""
+
+    def __init__(self, handle, chfs):
+        self._handle = handle
+        self._chfs = tuple(chfs)
+        handlers = get_handlers(self._chfs)
+        self._hashers = [handlers[x].new()() for x in self._chfs]
+
+    def write(self, data):
+        for hasher in self._hashers:
+            hasher.update(data)
+        self._handle.write(data)
+
+    def chksums(self):
+        return {k: long(h.hexdigest(), 16)
+                for k, h in zip(self._chfs, self._hashers)}
+
+
+def write_binpkg(path, contents, xpak_data, compressor='bzip2',
+                 parallelize=True, chfs=('size', 'sha1', 'md5')):
+    """Write a binpkg in a single pass over its contents.
+
+    The tarball is streamed through the compressor, and the xpak appended,
+    while checksumming the file as it's written.
+
+    :param contents: :obj:`pkgcore.fs.contents.contentsSet`, or an iterable
+        of fs objs, see :obj:`pkgcore.fs.tar.write_stream`
+    :param xpak_data: mapping to write into the xpak
+    :param chfs: chksum types to compute
+    :return: mapping of chksum type to the binpkg's chksum
+    """
+    with open(path, 'wb') as f:
+        handle = _chksum_writer(f, chfs)
+        tar.write_stream(contents, handle, compressor=compressor,
+                         parallelize=parallelize)
+        xpak.Xpak.write_xpak(handle, xpak_data)
+    return handle.chksums()
+
+
 class install(repo_interfaces.install):
 
     @steal_docs(repo_interfaces.install)
@@ -91,22 +133,18 @@ class install(repo_interfaces.install):
             ".tmp.%i.%s" % (os.getpid(), os.path.basename(final_path)))
 
         self.tmp_path, self.final_path = tmp_path, final_path
+        self.chksums = None
 
         if not ensure_dirs(os.path.dirname(tmp_path), mode=0755):
             raise repo_interfaces.Failure(
                 "failed creating directory %r" %
                 os.path.dirname(tmp_path))
         try:
-            start("generating tarball: %s" % tmp_path)
-            tar.write_set(
-                pkg.contents, tmp_path, compressor='bzip2',
-                parallelize=True)
-            end("tarball created", True)
-            start("writing Xpak")
-            # ok... got a tarball.  now add xpak.
-            xpak.Xpak.write_xpak(tmp_path, generate_attr_dict(pkg))
-            end("wrote Xpak", True)
-            # ok... we tagged the xpak on.
+            start("generating binpkg: %s" % tmp_path)
+            self.chksums = write_binpkg(
+                tmp_path, pkg.contents, generate_attr_dict(pkg),
+                compressor='bzip2', parallelize=True)
+            end("binpkg created", True)
             os.chmod(tmp_path, 0644)
         except Exception as e:
             try:
@@ -120,6 +158,11 @@ class install(repo_interfaces.install):
         os.rename(self.tmp_path, self.final_path)
         return True
 
+    def _notify_repo_add(self):
+        # hand over the chksums so the Packages cache needn't reread the file
+        self.repo.notify_add_package(self.new_pkg, chksums=self.chksums)
+        return True
+
 
 class uninstall(repo_interfaces.uninstall):
 
@@ -145,6 +188,14 @@ class replace(install, uninstall, repo_interfaces.replace):
 
 class operations(repo_interfaces.operations):
 
+    @_operations_mod.is_standalone
+    def _cmd_api_regen_cache(self, observer=None, threads=1, **options):
+        # the metadata is all in the xpaks; rather than pulling it per pkg,
+        # scan the stale binpkgs in bulk.
+        self.repo._update_cache(threads=threads)
+        self._cmd_implementation_clean_cache()
+        self.repo.operations.run_if_supported("flush_cache")
+
     def _cmd_implementation_install(self, *args):
         return install(self.repo, *args)
 
@@ -13,7 +13,7 @@ from snakeoil.compatibility import raise_from
 from snakeoil.demandload import demandload
 from snakeoil.klass import jit_attr, jit_attr_named, alias_attr
 from snakeoil.mappings import DictMixin, StackedDict
-from snakeoil.osutils import listdir_dirs, listdir_files, access
+from snakeoil.osutils import listdir_dirs, listdir_files, access, stat_mtime_long
 from snakeoil.osutils import pjoin
 
 from pkgcore.binpkg import repo_ops
@@ -34,7 +34,8 @@ demandload(
     "pkgcore.ebuild:ebd",
     "pkgcore.fs.contents:offset_rewriter,contentsSet",
     "pkgcore.fs.livefs:scan",
-    "pkgcore.fs.tar:generate_contents",
+    "pkgcore.log:logger",
+    "pkgcore.fs.tar:archive_member_source,extract_files,generate_contents",
     "pkgcore.merge:engine",
     "pkgcore.package:base@pkg_base",
     "pkgcore.repository:wrapper",
@@ -61,7 +62,14 @@ class force_unpacking(triggers.base):
         merge_cset = cset
         if engine.offset != '/':
             merge_cset = cset.change_offset(engine.offset, '/')
-        merge_contents(merge_cset, offset=op.env["D"])
+        # files still backed by the binpkg are extracted in a single pass
+        # over it, rather than seeking to each in turn.
+        archived = contentsSet(
+            x for x in merge_cset.iterfiles()
+            if isinstance(x.data, archive_member_source))
+        merge_contents(merge_cset.difference(archived), offset=op.env["D"])
+        extract_files(archived, op.env["D"],
+                      ensure_perms=get_plugin("fs_ops.ensure_perms"))
 
         # ok.  they're on disk.
         # now to avoid going back to the binpkg, we rewrite
@@ -326,23 +334,62 @@ class tree(prototype.tree):
 
     _get_ebuild_path = _get_path
 
-    def _get_metadata(self, pkg, force=False):
+    def _get_metadata(self, pkg, force=False, chksums=None):
         xpak = StackedXpakDict(self, pkg)
-        try:
-            if force:
-                raise KeyError
-            cache_data = self.cache[pkg.cpvstr]
-            if int(cache_data['mtime']) != int(xpak.mtime):
-                raise KeyError
-        except KeyError:
-            cache_data = self.cache.update_from_xpak(pkg, xpak)
+        cache_data = None
+        if not force:
+            cache_data = self._fresh_cache_entry(pkg.cpvstr, xpak.mtime)
+        if cache_data is None:
+            cache_data = self.cache.update_from_xpak(pkg, xpak, chksums=chksums)
         obj = StackedCache(cache_data, xpak)
         return obj
 
-    def notify_add_package(self, pkg):
+    def _fresh_cache_entry(self, cpvstr, mtime):
+        """Return the cache entry of a pkg if it matches mtime, else None."""
+        try:
+            cache_data = self.cache[cpvstr]
+        except KeyError:
+            return None
+        # entries we write store the mtime under the cache's chf key, those
+        # from a Packages file written elsewhere under MTIME.
+        cached = cache_data.get('mtime')
+        if cached is None:
+            cached = cache_data.get(self.cache._chf_key)
+        if cached is None or int(cached) != int(mtime):
+            return None
+        return cache_data
+
+    def _update_cache(self, threads=None):
+        """Refresh stale Packages cache entries, scanning their binpkgs in bulk.
+
+        :param threads: number of threads to scan with, defaults to the
+            cpu count
+        """
+        # work from the versions rather than pkgs; instantiating the latter
+        # pulls their metadata one by one.
+        stale = []
+        for (category, package), versions in self.versions.iteritems():
+            for ver in versions:
+                pf = "%s-%s" % (package, ver)
+                cpvstr = "%s/%s" % (category, pf)
+                path = pjoin(self.base, category, pf + self.extension)
+                if self._fresh_cache_entry(cpvstr, stat_mtime_long(path)) is None:
+                    stale.append((cpvstr, path))
+        if not stale:
+            return
+        errors = self.cache.update_from_binpkgs(stale, threads=threads)
+        for cpvstr, e in sorted(errors.iteritems()):
+            logger.error("failed reading binpkg for %s: %s", cpvstr, e)
+
+    def notify_add_package(self, pkg, chksums=None):
+        """
+        :param chksums: mapping of chksum type to the chksums of the
+            binpkg, if known
+        """
         prototype.tree.notify_add_package(self, pkg)
         # XXX horrible hack.
-        self._get_metadata(self.match(pkg.versioned_atom)[0], force=True)
+        self._get_metadata(self.match(pkg.versioned_atom)[0], force=True,
+                           chksums=chksums)
         self.cache.commit()
 
     def notify_remove_package(self, pkg):
@@ -5,7 +5,7 @@
 XPAK container support
 """
 
-__all__ = ("MalformedXpak", "Xpak")
+__all__ = ("MalformedXpak", "Xpak", "scan_binpkg", "scan_binpkgs")
 
 from collections import OrderedDict
 
@@ -17,7 +17,10 @@ from snakeoil.mappings import autoconvert_py3k_methods_metaclass
 
 demandload(
     "errno",
+    "mmap",
     "os",
+    "snakeoil.chksum:get_handlers",
+    "pkgcore.util.thread_pool:map_async",
 )
 
 # format is:
@@ -81,11 +84,16 @@ class Xpak(object):
         """
         write an xpak dict to disk; overwriting an xpak if it exists
 
-        :param target_source: string path, or \
-          :obj:`snakeoil.data_source.base` derivative
+        :param target_source: string path, \
+          :obj:`snakeoil.data_source.base` derivative, or a file object \
+          open for writing that the xpak is appended to
         :param data: mapping instance to write into the xpak.
-        :return: xpak instance
+        :return: xpak instance, None if target_source was a file object
         """
+        if hasattr(target_source, 'write'):
+            target_source.write(cls._serialize(data))
+            return None
+
         try:
             old_xpak = cls(target_source)
             # force access
@@ -105,6 +113,20 @@ class Xpak(object):
                 f = target_source.bytes_fileobj(writable=True)
                 f.seek(0, 2)
                 start = f.tell()
+        if source_is_path:
+            # rb+ required since A) binary, B) w truncates from the getgo
+            handle = open(target_source, "r+b")
+        else:
+            handle = target_source.bytes_fileobj(writable=True)
+
+        handle.seek(start, 0)
+        handle.write(cls._serialize(data))
+        handle.truncate()
+        handle.close()
+        return Xpak(target_source)
+
+    @classmethod
+    def _serialize(cls, data):
         new_index = []
         new_data = []
         cur_pos = 0
@@ -119,12 +141,6 @@ class Xpak(object):
             new_data.append(val)
             cur_pos += len(val)
 
-        if source_is_path:
-            # rb+ required since A) binary, B) w truncates from the getgo
-            handle = open(target_source, "r+b")
-        else:
-            handle = target_source.bytes_fileobj(writable=True)
-
         joiner = ''
         if compatibility.is_py3k:
             # can't do str.join(bytes), thus this.
@@ -134,21 +150,16 @@ class Xpak(object):
         new_index = joiner.join(new_index)
         new_data = joiner.join(new_data)
 
-        handle.seek(start, 0)
-        cls.header.write(
-            handle, cls.header_pre_magic, len(new_index), len(new_data))
-
-        handle.write(struct.pack(
-            ">%is%is" % (len(new_index), len(new_data)), new_index, new_data))
-
-        # the +8 is for the longs for new_index/new_data
-        cls.trailer.write(
-            handle, cls.trailer_pre_magic,
-            len(new_index) + len(new_data) + cls.trailer.size + 8,
-            cls.trailer_post_magic)
-        handle.truncate()
-        handle.close()
-        return Xpak(target_source)
+        return joiner.join((
+            cls.header.pack(
+                cls.header_pre_magic, len(new_index), len(new_data)),
+            struct.pack(
+                ">%is%is" % (len(new_index), len(new_data)), new_index, new_data),
+            # the +8 is for the longs for new_index/new_data
+            cls.trailer.pack(
+                cls.trailer_pre_magic,
+                len(new_index) + len(new_data) + cls.trailer.size + 8,
+                cls.trailer_post_magic)))
 
     @klass.jit_attr
     def keys_dict(self):
@@ -285,3 +296,76 @@ class Xpak(object):
         if needs_decoding:
             return r.decode()
         return r
+
+
+def scan_binpkg(path, keys=None, chfs=(), blocksize=(1 << 20)):
+    """Read a binpkg's xpak, and optionally chksum it, with a single open.
+
+    The binpkg is mmapped, so the xpak index and values are read without
+    further syscalls; chksumming then walks the same mapping.
+
+    :param keys: xpak keys to read, defaults to all of them; any missing from
+        the xpak are skipped
+    :param chfs: chksum types to compute for the binpkg
+    :return: mapping of xpak key to value, mapping of chksum type to
+        chksum, and the stat result of the binpkg
+    """
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if not st.st_size:
+            raise MalformedXpak("%r is empty" % (path,))
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        try:
+            xpak = Xpak(mapping)
+            keys_dict = xpak.keys_dict
+            if keys is None:
+                keys = keys_dict
+            data = {k: xpak[k] for k in keys if k in keys_dict}
+        except MalformedXpak as e:
+            # Xpak only knows the mapping it was handed, not the binpkg.
+            msg = e.msg.replace(repr(mapping), repr(path))
+            if msg == e.msg:
+                msg = "%r: %s" % (path, msg)
+            raise_from(MalformedXpak(msg))
+        except ValueError as e:
+            # seeking outside the mapping, from a short or corrupt trailer.
+            raise_from(MalformedXpak("%r: %s" % (path, e)))
+        chksums = {}
+        if chfs:
+            handlers = get_handlers(chfs)
+            hashers = [(k, handlers[k].new()()) for k in chfs]
+            for offset in xrange(0, st.st_size, blocksize):
+                block = mapping[offset:offset + blocksize]
+                for _, hasher in hashers:
+                    hasher.update(block)
+            chksums = {k: long(h.hexdigest(), 16) for k, h in hashers}
+    finally:
+        mapping.close()
+    return data, chksums, st
+
+
+def _scan_worker(queue, keys, chfs, results, errors):
+    for path in queue:
+        try:
+            results[path] = scan_binpkg(path, keys, chfs)
+        except (EnvironmentError, MalformedXpak) as e:
+            errors[path] = e
+
+
+def scan_binpkgs(paths, keys=None, chfs=(), threads=None):
+    """Scan binpkgs via :obj:`scan_binpkg` across a pool of threads.
+
+    :param threads: number of threads to use, defaults to the cpu count
+    :return: mapping of path to the results of scanning it, and mapping of
+        path to the error raised scanning it
+    """
+    paths = list(paths)
+    results = {}
+    errors = {}
+    if threads == 1:
+        _scan_worker(iter(paths), keys, chfs, results, errors)
+    else:
+        map_async(paths, _scan_worker, keys, chfs, results, errors,
+                  threads=threads)
+    return results, errors
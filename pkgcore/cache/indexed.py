@@ -0,0 +1,395 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+single file backend with an on-disk cpv index
+
+All entries live in one append only data file; a sidecar index maps each cpv
+to the offset of its newest record.  Lookups mmap the data file and only
+decode the requested entry, so walking a whole tree costs one mmap plus
+index lookups instead of an open/read/close per package.
+
+Data file layout::
+
+    pkgcore-indexed-cache <version> <generation>\\n
+    <cpv>\\t<length>\\n<length bytes of key=value lines>
+    <cpv>\\t-1\\n                  (deletion)
+    ...
+
+Index layout::
+
+    pkgcore-indexed-cache-index <version> <generation> <data size> <dead bytes>\\n
+    <cpv>\\t<offset>\\t<length>\\n
+    ...
+
+The index is only a hint; if it's missing, stale, or belongs to a different
+generation of the data file it's rebuilt by scanning the data file.
+
+Writes are buffered up to the sync rate; anything still pending when the
+interpreter exits is committed then.
+"""
+
+__all__ = ("database",)
+
+import atexit
+import errno
+import fcntl
+import mmap
+import os
+import uuid
+import weakref
+
+from snakeoil import compatibility
+from snakeoil.compatibility import raise_from
+from snakeoil.demandload import demandload
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import pjoin
+
+from pkgcore.cache import fs_template, errors
+from pkgcore.config import ConfigHint
+
+demandload('pkgcore.log:logger')
+
+if compatibility.is_py3k:
+    def _encode(s):
+        return s.encode('utf8')
+
+    def _decode(s):
+        return s.decode('utf8')
+else:
+    _encode = _decode = lambda s: s
+
+
+def _record_size(cpv, length):
+    """Size of a data record, header included."""
+    return len(_encode('%s\t%i\n' % (cpv, length))) + length
+
+
+# writable instances, committed at exit so entries generated on cache misses
+# outside of a regen aren't lost.
+_writable_caches = weakref.WeakSet()
+
+
+def _commit_pending():
+    for cache in list(_writable_caches):
+        try:
+            cache.commit()
+        except errors.CacheError as e:
+            logger.warning("failed committing cache %r: %s", cache.location, e)
+
+atexit.register(_commit_pending)
+
+
+class database(fs_template.FsBased):
+    """Stores all cache entries in a single indexed, append only file."""
+
+    pkgcore_config_type = ConfigHint(
+        {'readonly': 'bool', 'location': 'str', 'label': 'str',
+         'auxdbkeys': 'list'},
+        required=['location'],
+        positional=['location'],
+        typename='cache')
+
+    autocommits = False
+    default_sync_rate = 100
+    eclass_chf_types = ('eclassdir', 'mtime')
+
+    magic = 'pkgcore-indexed-cache'
+    index_magic = 'pkgcore-indexed-cache-index'
+    version = 1
+    data_filename = 'metadata.db'
+    index_filename = 'metadata.idx'
+    # compact on commit once this fraction of the data file is dead records
+    compaction_threshold = 0.5
+
+    def __init__(self, *args, **config):
+        super(database, self).__init__(*args, **config)
+        self._data_path = pjoin(self.location, self.data_filename)
+        self._index_path = pjoin(self.location, self.index_filename)
+        self._pending = {}
+        self._reset()
+        if not self.readonly:
+            _writable_caches.add(self)
+
+    def _reset(self):
+        self._index = None
+        self._map = None
+        self._generation = None
+        self._data_size = 0
+        self._dead = 0
+
+    def _load(self):
+        """Map the data file and load its index, rebuilding it as needed."""
+        self._reset()
+        try:
+            f = open(self._data_path, 'rb')
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise_from(errors.InitializationError(self.__class__, e))
+            self._index = {}
+            return self._index
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size:
+                self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+        if self._map is None:
+            self._index = {}
+            return self._index
+
+        end = self._map.find(b'\n')
+        header = _decode(self._map[:end]).split()
+        if (end == -1 or len(header) != 3 or header[0] != self.magic or
+                header[1] != str(self.version)):
+            raise errors.InitializationError(
+                self.__class__, 'invalid data file header: %r' % (self._data_path,))
+        self._generation = header[2]
+
+        index, pos = self._read_index(size)
+        if index is None:
+            index, pos = {}, end + 1
+        self._index = index
+        self._scan(pos, size)
+        return self._index
+
+    def _read_index(self, size):
+        try:
+            with open(self._index_path, 'r') as f:
+                header = f.readline().split()
+                if (len(header) != 5 or header[0] != self.index_magic or
+                        header[1] != str(self.version) or
+                        header[2] != self._generation):
+                    return None, None
+                data_size, dead = int(header[3]), int(header[4])
+                if data_size > size:
+                    return None, None
+                index = {}
+                for line in f:
+                    cpv, offset, length = line.rstrip('\n').split('\t')
+                    index[cpv] = (int(offset), int(length))
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise_from(errors.InitializationError(self.__class__, e))
+            return None, None
+        except ValueError:
+            # corrupted index; the data file is authoritative.
+            return None, None
+        self._dead = dead
+        return index, data_size
+
+    def _scan(self, pos, size):
+        """Pick up records appended after ``pos``, updating the index."""
+        m, index = self._map, self._index
+        while pos < size:
+            end = m.find(b'\n', pos, size)
+            if end == -1:
+                break
+            try:
+                cpv, length = _decode(m[pos:end]).rsplit('\t', 1)
+                length = int(length)
+            except ValueError:
+                raise errors.GeneralCacheCorruption(
+                    'invalid record header at offset %i in %r' %
+                    (pos, self._data_path))
+            old = index.pop(cpv, None)
+            if old is not None:
+                self._dead += _record_size(cpv, old[1])
+            if length < 0:
+                self._dead += end + 1 - pos
+                pos = end + 1
+                continue
+            if end + 1 + length > size:
+                # truncated write from an interrupted commit; ignore it.
+                break
+            index[cpv] = (end + 1, length)
+            pos = end + 1 + length
+        self._data_size = pos
+
+    def _get_index(self):
+        if self._index is None:
+            self._load()
+        return self._index
+
+    def _getitem(self, cpv):
+        if cpv in self._pending:
+            data = self._pending[cpv]
+            if data is None:
+                raise KeyError(cpv)
+        else:
+            offset, length = self._get_index()[cpv]
+            data = _decode(self._map[offset:offset + length])
+        try:
+            return self._parse_data(data.split('\n'))
+        except (KeyError, ValueError) as e:
+            raise_from(errors.CacheCorruption(cpv, e))
+
+    def _parse_data(self, data):
+        d = self._cdict_kls()
+        known = self._known_keys
+        for x in data:
+            if not x:
+                continue
+            k, v = x.split("=", 1)
+            if k in known:
+                d[k] = v
+        d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+        return d
+
+    def _setitem(self, cpv, values):
+        known = self._known_keys
+        self._pending[cpv] = ''.join(
+            "%s=%s\n" % (k, v) for k, v in sorted(values.iteritems())
+            if k in known)
+
+    def _delitem(self, cpv):
+        if cpv not in self:
+            raise KeyError(cpv)
+        self._pending[cpv] = None
+
+    def __contains__(self, cpv):
+        if cpv in self._pending:
+            return self._pending[cpv] is not None
+        return cpv in self._get_index()
+
+    def iterkeys(self):
+        pending = self._pending
+        for cpv in self._get_index():
+            if cpv not in pending:
+                yield cpv
+        for cpv, data in pending.items():
+            if data is not None:
+                yield cpv
+
+    def _lock_data_file(self):
+        """Open the data file for appending, holding an exclusive lock.
+
+        Compaction replaces the data file, so after acquiring the lock make
+        sure it's still the file at our path; otherwise retry on the new one.
+        """
+        if not self._ensure_dirs():
+            raise errors.GeneralCacheCorruption(
+                'error creating directory %r' % (self.location,))
+        while True:
+            f = None
+            try:
+                f = open(self._data_path, 'ab')
+                fcntl.lockf(f, fcntl.LOCK_EX)
+                if os.fstat(f.fileno()).st_ino == os.stat(self._data_path).st_ino:
+                    return f
+            except EnvironmentError as e:
+                if e.errno != errno.ENOENT:
+                    raise_from(errors.GeneralCacheCorruption(e))
+            if f is not None:
+                f.close()
+
+    def commit(self, force=False):
+        # appending only ever writes pending entries, so there's nothing for
+        # force to do without them.
+        if self.readonly or not self._pending:
+            return
+        f = self._lock_data_file()
+        try:
+            # another writer may have appended or compacted since we last
+            # looked; reload so our offsets and dead counts are accurate.
+            index = self._load()
+            if self._map is None:
+                self._generation = uuid.uuid4().hex
+                f.write(_encode('%s %i %s\n' % (
+                    self.magic, self.version, self._generation)))
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            for cpv, data in sorted(self._pending.iteritems()):
+                old = index.pop(cpv, None)
+                if old is not None:
+                    self._dead += _record_size(cpv, old[1])
+                if data is None:
+                    if old is not None:
+                        record = _encode('%s\t-1\n' % (cpv,))
+                        f.write(record)
+                        pos += len(record)
+                        self._dead += len(record)
+                    continue
+                data = _encode(data)
+                header = _encode('%s\t%i\n' % (cpv, len(data)))
+                f.write(header)
+                f.write(data)
+                index[cpv] = (pos + len(header), len(data))
+                pos += len(header) + len(data)
+            f.flush()
+            self._data_size = pos
+            self._pending = {}
+            self._ensure_access(self._data_path)
+            if self._dead > pos * self.compaction_threshold:
+                self._compact()
+            else:
+                self._write_index()
+        except EnvironmentError as e:
+            raise_from(errors.GeneralCacheCorruption(e))
+        finally:
+            f.close()
+        # drop the stale mapping; the next access remaps the grown file.
+        self._reset()
+
+    def _write_index(self):
+        f = AtomicWriteFile(self._index_path, perms=self._perms, gid=self._gid)
+        try:
+            f.write('%s %i %s %i %i\n' % (
+                self.index_magic, self.version, self._generation,
+                self._data_size, self._dead))
+            for cpv, (offset, length) in sorted(self._index.iteritems()):
+                f.write('%s\t%i\t%i\n' % (cpv, offset, length))
+        except:
+            f.discard()
+            raise
+        f.close()
+
+    def _compact(self):
+        """Rewrite the data file without dead records.
+
+        The new data file gets a fresh generation, so readers holding the old
+        index regenerate it rather than trusting stale offsets.
+        """
+        # reopen to see everything we just appended.
+        index = self._load()
+        m = self._map
+        generation = uuid.uuid4().hex
+        f = AtomicWriteFile(self._data_path, binary=True,
+                            perms=self._perms, gid=self._gid)
+        new_index = {}
+        try:
+            header = _encode('%s %i %s\n' % (self.magic, self.version, generation))
+            f.write(header)
+            pos = len(header)
+            for cpv, (offset, length) in sorted(index.iteritems()):
+                record = _encode('%s\t%i\n' % (cpv, length))
+                f.write(record)
+                f.write(m[offset:offset + length])
+                new_index[cpv] = (pos + len(record), length)
+                pos += len(record) + length
+        except:
+            f.discard()
+            raise
+        f.close()
+        self._index = new_index
+        self._generation = generation
+        self._data_size = pos
+        self._dead = 0
+        self._write_index()
+
+    def compact(self):
+        """Commit pending updates and rewrite the data file without dead records."""
+        if self.readonly:
+            raise errors.ReadOnly()
+        self.commit()
+        if not os.path.exists(self._data_path):
+            return
+        f = self._lock_data_file()
+        try:
+            self._compact()
+        except EnvironmentError as e:
+            raise_from(errors.GeneralCacheCorruption(e))
+        finally:
+            f.close()
+        self._reset()
@@ -48,6 +48,10 @@ DATA_PATH = _GET_CONST('DATA_PATH', osp.dirname(osp.dirname(osp.realpath(__file_
                        allow_environment_override=True)
 CONFIG_PATH = _GET_CONST('CONFIG_PATH', '%(DATA_PATH)s/config')
 PATH_FORCED_PREPEND = _GET_CONST('INJECTED_BIN_PATH', ('%(DATA_PATH)s/bin',))
+USER_CACHE_PATH = _GET_CONST(
+    'USER_CACHE_PATH',
+    osp.join(os.environ.get('XDG_CACHE_HOME', osp.expanduser('~/.cache')), 'pkgcore'),
+    allow_environment_override=True)
 
 SANDBOX_BINARY = _GET_CONST('SANDBOX_BINARY', '/usr/bin/sandbox')
 BASH_BINARY = _GET_CONST('BASH_BINARY', '/bin/bash')
@@ -29,5 +29,8 @@ WORLD_FILE = '/var/lib/portage/world'
 EBD_PATH = const._GET_CONST('EBD_PATH', '%(DATA_PATH)s/ebd')
 EBUILD_DAEMON_PATH = pjoin(EBD_PATH, "ebuild-daemon.bash")
 EBUILD_HELPERS_PATH = pjoin(EBD_PATH, "helpers")
+ECLASS_FUNC_CACHE_PATH = pjoin(const.USER_CACHE_PATH, "eclass-funcs")
+PLAN_CACHE_PATH = pjoin(const.USER_CACHE_PATH, "plans")
+REGEN_SNAPSHOT_PATH = pjoin(const.USER_CACHE_PATH, "regen-snapshots")
 
 PKGCORE_DEBUG_VARS = ("PKGCORE_DEBUG", "PKGCORE_PERF_DEBUG")
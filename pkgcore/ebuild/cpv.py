@@ -8,6 +8,7 @@
 __all__ = ("CPV", "versioned_CPV", "unversioned_CPV")
 
 from itertools import izip
+from struct import pack
 
 from snakeoil.compatibility import cmp
 from snakeoil.demandload import demandload, demand_compile_regexp
@@ -70,7 +71,7 @@ class _native_CPV(object):
     """
 
     __slots__ = ("__weakref__", "cpvstr", "key", "category", "package",
-        "version", "revision", "fullver")
+        "version", "revision", "fullver", "_version_key")
 
     # if native is being used, forget trying to reuse strings.
     def __init__(self, *a, **kwds):
@@ -160,6 +161,16 @@ class _native_CPV(object):
     def __hash__(self):
         return hash(self.cpvstr)
 
+    @property
+    def version_key(self):
+        """String ordering like the version and revision, see :obj:`version_key`."""
+        try:
+            return self._version_key
+        except AttributeError:
+            key = native_version_key(self.version, self.revision)
+            object.__setattr__(self, '_version_key', key)
+            return key
+
     def __repr__(self):
         return '<%s cpvstr=%s @%#8x>' % (
              self.__class__.__name__, getattr(self, 'cpvstr', None), id(self))
@@ -306,6 +317,80 @@ def native_ver_cmp(ver1, rev1, ver2, rev2):
     # The revision holds the final difference.
     return cmp(rev1, rev2)
 
+# suffix ordering: alpha < beta < pre < rc < no suffix < p
+_suffix_key = {"alpha": "\x01", "beta": "\x02", "pre": "\x03", "rc": "\x04",
+               "p": "\x06"}
+_suffix_end = "\x05"
+
+
+def _int_key(digits):
+    # length prefixed so longer numbers sort higher
+    return pack(">H", len(digits)) + digits
+
+
+def native_version_key(version, revision):
+    """Generate a string that sorts like :obj:`ver_cmp` orders versions.
+
+    Comparing the keys of two versions, as plain strings, gives the same
+    result as :obj:`ver_cmp` on them; sorting by key avoids reparsing the
+    versions for each comparison.  The C implementation generates identical
+    keys.
+
+    :return: str key, or None if version is None
+    """
+    if version is None:
+        return None
+    parts = version.split("_")
+    ver_parts = parts[0].split(".")
+    letter = "\x00"
+    if ver_parts[-1][-1].isalpha():
+        letter = ver_parts[-1][-1]
+        ver_parts[-1] = ver_parts[-1][:-1]
+    l = []
+    for x in ver_parts:
+        if x[0] == "0":
+            # compared as floats, 1.02 < 1.1; see native_ver_cmp
+            l.append("\x01%s\x00" % x.rstrip("0"))
+        else:
+            l.append("\x02" + _int_key(x))
+    l.append("\x00" + letter)
+    for x in parts[1:]:
+        match = suffix_regexp.match(x)
+        l.append(_suffix_key[match.group(1)] +
+                 _int_key(str(int("0" + match.group(2)))))
+    l.append(_suffix_end)
+    l.append(_int_key(str(revision or 0)))
+    return "".join(l)
+
+
+def sort_key(cpv):
+    """Key sorting cpvs, and pkgs, in the same order comparing them does."""
+    return cpv.category, cpv.package, cpv.version_key
+
+
+def cpv_sorter(reverse=False):
+    """Create a sorter ordering cpvs, and pkgs, by :obj:`sort_key`.
+
+    Usable as an itermatch sorter; repos also sort category and package names
+    with it, those are sorted as is.  The ordering is declared for multiplex
+    repos to merge their repos' results by, see
+    :obj:`pkgcore.repository.multiplex.key_sorter`.
+    """
+    def sorter(iterable):
+        l = list(iterable)
+        if l and hasattr(l[0], 'version_key'):
+            l.sort(key=sort_key, reverse=reverse)
+        else:
+            l.sort(reverse=reverse)
+        return l
+    sorter.sort_key = sort_key
+    sorter.sort_reverse = reverse
+    return sorter
+
+
+sorted_cpvs = cpv_sorter()
+
+
 fake_cat = "fake"
 fake_pkg = "pkg"
 def cpy_ver_cmp(ver1, rev1, ver2, rev2):
@@ -186,6 +186,8 @@ class domain(config_domain):
         self.profile = profile
         pkg_masks, pkg_unmasks, pkg_keywords, pkg_licenses = [], [], [], []
         pkg_use, self.bashrcs = [], []
+        # user config files the domain was built from
+        self.config_files = []
 
         self.ebuild_hook_dir = settings.pop("ebuild_hook_dir", None)
 
@@ -209,6 +211,7 @@ class domain(config_domain):
                     for fs_obj in iter_scan(fp, follow_symlinks=True):
                         if not fs_obj.is_reg or '/.' in fs_obj.location:
                             continue
+                        self.config_files.append(fs_obj.location)
                         val.extend(
                             action(x) for x in
                             iter_read_bash(fs_obj.location, allow_line_cont=True))
@@ -8,7 +8,7 @@ package class for buildable ebuilds
 __all__ = ("base", "package", "package_factory")
 
 from functools import partial
-from itertools import imap, chain
+from itertools import imap, chain, izip
 import os
 
 from pkgcore.cache import errors as cache_errors
@@ -22,7 +22,7 @@ from pkgcore.package import metadata
 from pkgcore.package.errors import MissingChksum
 from pkgcore.restrictions import boolean, values
 
-from snakeoil import klass
+from snakeoil import compatibility, klass
 from snakeoil.compatibility import intern
 from snakeoil.demandload import demandload, demand_compile_regexp
 
@@ -332,7 +332,7 @@ class package_factory(metadata.factory):
     def _get_ebuild_mtime(self, pkg):
         return os.stat(self._get_ebuild_path(pkg)).st_mtime
 
-    def _get_metadata(self, pkg, ebp=None, force_regen=False):
+    def _get_cached_metadata(self, pkg, force_regen=False):
         caches = self._cache
         if force_regen:
             caches = ()
@@ -351,10 +351,74 @@ class package_factory(metadata.factory):
                     logger.warning("caught cache error: %s" % e)
                     del e
                     continue
+        return None
 
+    def _get_metadata(self, pkg, ebp=None, force_regen=False):
+        data = self._get_cached_metadata(pkg, force_regen=force_regen)
+        if data is not None:
+            return data
         # no cache entries, regen
         return self._update_metadata(pkg, ebp=ebp)
 
+    def _get_metadata_batch(self, pkgs, ebp=None, force_regen=False):
+        """Get metadata for multiple packages, sourcing cache misses in one batch.
+
+        :return: list with the metadata for each package, or the exception
+            raised while generating it
+
+        If the batch request fails as a whole, the misses are retried one by
+        one so only the packages actually at fault fail.
+        """
+        results = []
+        misses = []
+        for pkg in pkgs:
+            try:
+                data = self._get_cached_metadata(pkg, force_regen=force_regen)
+                if data is None and not pkg.eapi.is_supported:
+                    data = {'EAPI': str(pkg.eapi)}
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                data = e
+            if data is None:
+                misses.append((len(results), pkg))
+            results.append(data)
+
+        if not misses:
+            return results
+        try:
+            with processor.reuse_or_request(ebp) as my_proc:
+                generated = my_proc.get_keys_batch(
+                    [pkg for i, pkg in misses], self._ecache)
+        except compatibility.IGNORED_EXCEPTIONS:
+            raise
+        except Exception as e:
+            logger.warning(
+                "batched metadata regen of %i packages failed, retrying them "
+                "individually: %s", len(misses), e)
+            for i, pkg in misses:
+                try:
+                    # the batch's processor was discarded; use a fresh one.
+                    results[i] = self._update_metadata(pkg)
+                except compatibility.IGNORED_EXCEPTIONS:
+                    raise
+                except Exception as e:
+                    results[i] = e
+            return results
+
+        for (i, pkg), mydata in izip(misses, generated):
+            try:
+                if mydata is None or isinstance(mydata, Exception):
+                    raise metadata_errors.MetadataException(
+                        pkg, 'data', 'failed sourcing ebuild%s' % (
+                            '' if mydata is None else ': %s' % (mydata,)))
+                results[i] = self._store_metadata(pkg, mydata)
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                results[i] = e
+        return results
+
     def _update_metadata(self, pkg, ebp=None):
         parsed_eapi = pkg.eapi
         if not parsed_eapi.is_supported:
@@ -363,6 +427,11 @@ class package_factory(metadata.factory):
         with processor.reuse_or_request(ebp) as my_proc:
             mydata = my_proc.get_keys(pkg, self._ecache)
 
+        return self._store_metadata(pkg, mydata)
+
+    def _store_metadata(self, pkg, mydata):
+        """Normalize freshly sourced metadata and write it to the cache."""
+        parsed_eapi = pkg.eapi
         inherited = mydata.pop("INHERITED", None)
         # Rewrite defined_phases as needed, since we now know the EAPI.
         eapi = get_eapi(mydata["EAPI"])
@@ -0,0 +1,163 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+on disk cache of eclasses precompiled into bash functions
+
+Preloading eclasses into an ebuild daemon normally means syntax checking and
+transferring each eclass individually, in every new daemon.  Instead the
+function definitions for a whole eclass stack are written to a single bundle,
+keyed by the checksums of the eclasses it contains, which any later daemon can
+source in one step.
+"""
+
+__all__ = ("EclassFuncCache", "get_cache")
+
+import errno
+import hashlib
+import os
+import tempfile
+import time
+
+from snakeoil.demandload import demandload
+from snakeoil.osutils import ensure_dirs, listdir_files, pjoin
+
+from pkgcore import const
+from pkgcore.ebuild import const as e_const
+
+demandload(
+    'snakeoil:fileutils',
+    'pkgcore.spawn:spawn',
+    'pkgcore.log:logger',
+)
+
+
+class CacheStats(object):
+
+    __slots__ = ('hits', 'misses', 'time_saved')
+
+    def __init__(self):
+        self.hits = self.misses = 0
+        self.time_saved = 0.0
+
+    def __str__(self):
+        return "eclass function cache: %i hits, %i misses, %.2f seconds saved" % (
+            self.hits, self.misses, self.time_saved)
+
+
+class EclassFuncCache(object):
+    """Directory of precompiled eclass function bundles.
+
+    :ivar stats: :obj:`CacheStats` instance tracking bundle hits and misses,
+        and the compile time hits avoided.
+    """
+
+    header = '# pkgcore eclass functions; compile time %f\n'
+    suffix = '.bash'
+    # bundles to keep around; older ones are for outdated eclass stacks
+    max_bundles = 10
+
+    def __init__(self, location):
+        self.location = location
+        self.stats = CacheStats()
+
+    def _key(self, eclasses):
+        chf = hashlib.md5()
+        for eclass, data in eclasses:
+            chf.update(('%s %x\n' % (eclass, data.md5)).encode())
+        return chf.hexdigest()
+
+    def bundle(self, eclasses):
+        """Get the path of a bundle defining the given eclasses' functions.
+
+        :param eclasses: sequence of (eclass name, eclass data) pairs, eclass
+            data being what an :obj:`pkgcore.ebuild.eclass_cache` returns
+        :return: bundle path, or None if one couldn't be created
+        """
+        eclasses = sorted(eclasses)
+        try:
+            path = pjoin(self.location, self._key(eclasses) + self.suffix)
+            with open(path, 'r') as f:
+                compile_time = float(f.readline().rsplit(None, 1)[-1])
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("failed reading eclass function cache: %s", e)
+                return None
+        except ValueError:
+            pass
+        else:
+            self.stats.hits += 1
+            self.stats.time_saved += compile_time
+            # keep recently used bundles from being pruned
+            try:
+                os.utime(path, None)
+            except EnvironmentError:
+                pass
+            return path
+
+        self.stats.misses += 1
+        try:
+            return self._compile(path, eclasses)
+        except EnvironmentError as e:
+            logger.warning("failed writing eclass function cache: %s", e)
+            return None
+
+    def _compile(self, path, eclasses):
+        start = time.time()
+        if not ensure_dirs(self.location, mode=0755):
+            return None
+        chunks = []
+        for eclass, data in eclasses:
+            with open(data.path, 'r') as f:
+                text = f.read()
+            # matches what the daemon's __make_preloaded_eclass_func generates
+            chunks.append(
+                "__preloaded_eclass_%s() {\n%s\n}\n"
+                "PKGCORE_PRELOADED_ECLASSES[%s]=__preloaded_eclass_%s\n" %
+                (eclass, text, eclass, eclass))
+
+        body = ''.join(chunks)
+        fd, tmp = tempfile.mkstemp(prefix='.', dir=self.location)
+        os.close(fd)
+        try:
+            os.chmod(tmp, 0644)
+            fileutils.write_file(tmp, 'w', body)
+            # one syntax check for the whole stack; if something is broken
+            # let the per eclass preloading point out what.
+            if spawn([const.BASH_BINARY, '-n', tmp], fd_pipes={1: 1, 2: 2}) != 0:
+                return None
+            fileutils.write_file(
+                tmp, 'w', (self.header % (time.time() - start)) + body)
+            os.rename(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        self._prune()
+        return path
+
+    def _prune(self):
+        bundles = []
+        for x in listdir_files(self.location):
+            if x.endswith(self.suffix):
+                p = pjoin(self.location, x)
+                try:
+                    bundles.append((os.stat(p).st_mtime, p))
+                except EnvironmentError:
+                    continue
+        bundles.sort(reverse=True)
+        for mtime, p in bundles[self.max_bundles:]:
+            try:
+                os.unlink(p)
+            except EnvironmentError:
+                pass
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the shared :obj:`EclassFuncCache` instance."""
+    global _cache
+    if _cache is None:
+        _cache = EclassFuncCache(e_const.ECLASS_FUNC_CACHE_PATH)
+    return _cache
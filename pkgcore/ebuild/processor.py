@@ -42,7 +42,10 @@ import contextlib
 import errno
 from functools import partial
 import os
+import select
 import signal
+import sys
+import threading
 
 from pkgcore import const, os_data
 from pkgcore.ebuild import const as e_const
@@ -60,10 +63,15 @@ demandload(
     'traceback',
     'snakeoil:fileutils',
     'snakeoil:process',
+    'pkgcore.ebuild:eclass_func_cache',
     'pkgcore.log:logger',
 )
 
 
+def _in_main_thread():
+    return isinstance(threading.current_thread(), threading._MainThread)
+
+
 def _single_thread_allowed(functor):
     def _inner(*args, **kwds):
         _acquire_global_ebp_lock()
@@ -426,13 +434,29 @@ class EbuildProcessor(object):
     def _timeout_ebp(self, signum, frame):
         raise TimeoutError("ebp for pid '%i' appears dead, timing out" % self.pid)
 
+    def _wait_readable(self, timeout):
+        """Thread-safe alternative to the SIGALRM timeout used by :obj:`expect`."""
+        while True:
+            try:
+                readable = select.select([self.ebd_read], [], [], timeout)[0]
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+            if not readable:
+                self._timeout_ebp(None, None)
+            return
+
     def expect(self, want, async=False, flush=False, timeout=0):
         """Read from the daemon, check if the returned string is expected.
 
         :param want: string we're expecting
         :return: boolean, was what was read == want?
         """
-        if timeout:
+        # signal handlers can only be installed from the main thread; workers
+        # (the parallel merge scheduler for example) poll the pipe instead.
+        use_alarm = timeout and _in_main_thread()
+        if use_alarm:
             signal.signal(signal.SIGALRM, self._timeout_ebp)
             signal.setitimer(signal.ITIMER_REAL, timeout)
 
@@ -443,11 +467,13 @@ class EbuildProcessor(object):
             self.ebd_write.flush()
         if not self._outstanding_expects:
             try:
+                if timeout and not use_alarm:
+                    self._wait_readable(timeout)
                 return want == self.read().rstrip('\n')
             except TimeoutError:
                 return False
             finally:
-                if timeout:
+                if use_alarm:
                     signal.signal(signal.SIGALRM, signal.SIG_DFL)
                     signal.alarm(0)
 
@@ -516,7 +542,7 @@ class EbuildProcessor(object):
     def clear_preloaded_eclasses(self):
         if self.is_alive:
             self.write("clear_preloaded_eclasses")
-            if not self.expect("clear_preload_eclasses succeeded", flush=True):
+            if not self.expect("clear_preloaded_eclasses succeeded", flush=True):
                 self.shutdown_processor()
                 return False
         self._preloaded_eclasses.clear()
@@ -537,10 +563,19 @@ class EbuildProcessor(object):
             i = ((eclass, ec[eclass]) for eclass in limited_to)
         else:
             i = cache.eclasses.iteritems()
-        for eclass, data in i:
-            if data.path != self._preloaded_eclasses.get(eclass):
-                if self._preload_eclass(data.path, async=True):
+        pending = [(eclass, data) for eclass, data in i
+                   if data.path != self._preloaded_eclasses.get(eclass)]
+        if pending and not limited_to:
+            # full preloads go through the shared on disk cache so the stack
+            # is sourced in one step, and only compiled once across daemons.
+            bundle = eclass_func_cache.get_cache().bundle(pending)
+            if bundle is not None and self._preload_eclass_bundle(bundle):
+                for eclass, data in pending:
                     self._preloaded_eclasses[eclass] = data.path
+                pending = []
+        for eclass, data in pending:
+            if self._preload_eclass(data.path, async=True):
+                self._preloaded_eclasses[eclass] = data.path
         if not async:
             return self._consume_async_expects()
         return True
@@ -570,6 +605,16 @@ class EbuildProcessor(object):
             return True
         return False
 
+    def _preload_eclass_bundle(self, path):
+        """Source a bundle of precompiled eclass functions.
+
+        :param path: filepath of a bundle from
+            :obj:`pkgcore.ebuild.eclass_func_cache`
+        :return: boolean, True for success
+        """
+        self.write("preload_eclass_bundle %s" % path)
+        return self.expect("preload_eclass_bundle succeeded", flush=True)
+
     def lock(self):
         """Lock the processor.
 
@@ -603,12 +648,18 @@ class EbuildProcessor(object):
             # thrown only if failure occurred instantiation.
             return False
 
-    def shutdown_processor(self, ignore_keyboard_interrupt=False):
-        """Tell the daemon to shut itself down, and mark this instance as dead."""
-        kill = False
+    def shutdown_processor(self, ignore_keyboard_interrupt=False, force=False):
+        """Tell the daemon to shut itself down, and mark this instance as dead.
+
+        :param force: kill the daemon outright; required if the pipe may hold
+            leftovers from an aborted request
+        """
+        kill = force
         try:
             if self.pid is None:
                 return
+            elif kill:
+                pass
             elif self.is_alive:
                 self.write("shutdown_daemon", disable_runtime_exceptions=True)
                 self.ebd_write.close()
@@ -795,6 +846,99 @@ class EbuildProcessor(object):
 
         return metadata_keys
 
+    def get_keys_batch(self, packages, eclass_cache):
+        """
+        request the metadata be regenerated for multiple ebuilds at once
+
+        The whole batch is sent in one request, with the env settings shared
+        by every package (EAPI specific settings for example) only
+        transferred once, and the daemon streams back the metadata for each.
+
+        :param packages: sequence of :obj:`pkgcore.ebuild.ebuild_src.package`
+            instances to regenerate
+        :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache` instance to use
+            for eclass access
+        :return: list of metadata dicts in the same order as packages; for
+            any package whose sourcing failed, the exception explaining why
+            if known, None otherwise
+
+        If the request fails as a whole, the processor is shut down since the
+        rest of the batch's replies are still in the pipe.
+        """
+        if not packages:
+            return []
+        self._ensure_metadata_paths(const.HOST_NONROOT_PATHS)
+
+        envs = [expected_ebuild_env(pkg, depends=True) for pkg in packages]
+        shared = dict(envs[0])
+        for env in envs[1:]:
+            for k, v in shared.items():
+                if env.get(k) != v:
+                    del shared[k]
+        prefix = self._generate_env_str(shared)
+        self.write("gen_metadata_batch %i %i\n%s" % (len(envs), len(prefix), prefix),
+                   append_newline=False, flush=False)
+        for env in envs:
+            data = self._generate_env_str(
+                {k: v for k, v in env.iteritems() if k not in shared})
+            self.write("%i\n%s" % (len(data), data), append_newline=False,
+                       flush=False)
+        self.ebd_write.flush()
+
+        results = [{}]
+        errors = {}
+
+        def request_inherit(self, line):
+            try:
+                inherit_handler(eclass_cache, self, line, updates=updates)
+            except UnhandledCommand as e:
+                # the daemon fails this package and carries on with the batch
+                errors[len(results) - 1] = e
+
+        def receive_key(self, line):
+            line = line.split("=", 1)
+            if len(line) != 2:
+                raise FinishedProcessing(True)
+            results[-1][line[0]] = line[1]
+
+        def metadata_done(self, line):
+            if line.strip() != 'succeeded':
+                results[-1] = None
+            results.append({})
+
+        updates = None
+        if self._eclass_caching:
+            updates = set()
+        commands = {
+            "key": receive_key,
+            "metadata_done": metadata_done,
+            "request_inherit": request_inherit,
+        }
+        try:
+            val = self.generic_handler(additional_commands=commands)
+        except:
+            exc_info = sys.exc_info()
+            self.shutdown_processor(ignore_keyboard_interrupt=True, force=True)
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        if not val:
+            logger.error("returned val from gen_metadata_batch was '%s'", str(val))
+            raise Exception(val)
+
+        if updates:
+            self.preload_eclasses(eclass_cache, limited_to=updates, async=True)
+
+        # drop the placeholder for the non-existent package after the last
+        results.pop()
+        for i, e in errors.iteritems():
+            if i < len(results):
+                results[i] = e
+        if len(results) != len(packages):
+            raise InternalError(
+                None, "expected metadata for %i packages, got %i" %
+                (len(packages), len(results)))
+        return results
+
     # this basically handles all hijacks from the daemon, whether
     # confcache or portageq.
     def generic_handler(self, additional_commands=None):
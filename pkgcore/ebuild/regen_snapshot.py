@@ -0,0 +1,251 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+incremental metadata regeneration support
+
+After each regen a snapshot of every ebuild's and eclass's mtime, size and
+md5 is recorded, along with the eclasses each ebuild inherited.  The next
+regen diffs the tree (or a git diff range) against it, expands changed
+eclasses to every ebuild inheriting them, and only visits those packages;
+:obj:`pkgcore.cache.base.validate_entry` still has the final say for each
+visited package.
+"""
+
+__all__ = ("Snapshot", "IncrementalRegen", "git_changed_files")
+
+import errno
+import os
+
+from snakeoil.chksum import get_handler
+from snakeoil.compatibility import raise_from
+from snakeoil.demandload import demandload
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import ensure_dirs
+
+from pkgcore.cache import errors as cache_errors
+
+demandload(
+    'subprocess',
+    'pkgcore.log:logger',
+)
+
+_md5 = get_handler('md5')
+
+
+def _file_state(path, md5=None):
+    """Return (mtime, size, md5) for path; md5 is computed if not given."""
+    st = os.stat(path)
+    if md5 is None:
+        md5 = _md5.long2str(_md5(path))
+    return (long(st.st_mtime), st.st_size, md5)
+
+
+def _changed(path, old):
+    """Check if a file differs from its snapshot state.
+
+    The md5 is only consulted when the cheap stat data differs, so a
+    touched but unmodified file isn't treated as changed.
+
+    :return: tuple of (changed boolean, current state)
+    """
+    try:
+        st = os.stat(path)
+    except EnvironmentError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return True, None
+    if old is None:
+        return True, _file_state(path)
+    mtime, size, md5 = old
+    if long(st.st_mtime) == mtime and st.st_size == size:
+        return False, old
+    if st.st_size != size:
+        return True, _file_state(path)
+    state = _file_state(path)
+    return state[2] != md5, state
+
+
+class Snapshot(object):
+    """On disk record of ebuild and eclass state as of the last regen."""
+
+    magic = 'pkgcore-regen-snapshot'
+    version = 1
+
+    def __init__(self, ebuilds=None, eclasses=None):
+        # cpv -> (mtime, size, md5, inherited eclasses)
+        self.ebuilds = {} if ebuilds is None else ebuilds
+        # eclass -> (mtime, size, md5)
+        self.eclasses = {} if eclasses is None else eclasses
+
+    @classmethod
+    def load(cls, path):
+        """Load a snapshot, returning None if it doesn't exist or is invalid."""
+        ebuilds, eclasses = {}, {}
+        try:
+            with open(path, 'r') as f:
+                header = f.readline().split()
+                if header != [cls.magic, str(cls.version)]:
+                    return None
+                for line in f:
+                    l = line.rstrip('\n').split('\t')
+                    if l[0] == 'ebuild':
+                        ebuilds[l[1]] = (
+                            long(l[2]), int(l[3]), l[4], tuple(l[5].split()))
+                    elif l[0] == 'eclass':
+                        eclasses[l[1]] = (long(l[2]), int(l[3]), l[4])
+                    else:
+                        raise ValueError(line)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        except (IndexError, ValueError) as e:
+            logger.warning("ignoring invalid regen snapshot %r: %s", path, e)
+            return None
+        return cls(ebuilds, eclasses)
+
+    def write(self, path):
+        f = AtomicWriteFile(path)
+        try:
+            f.write('%s %i\n' % (self.magic, self.version))
+            for eclass, (mtime, size, md5) in sorted(self.eclasses.iteritems()):
+                f.write('eclass\t%s\t%i\t%i\t%s\n' % (eclass, mtime, size, md5))
+            for cpv, (mtime, size, md5, inherited) in sorted(self.ebuilds.iteritems()):
+                f.write('ebuild\t%s\t%i\t%i\t%s\t%s\n' % (
+                    cpv, mtime, size, md5, ' '.join(inherited)))
+        except:
+            f.discard()
+            raise
+        f.close()
+
+    def inheriting(self, eclasses):
+        """Return the cpvs that inherited any of the given eclasses.
+
+        Cache entries record the full, transitive inherit list, so the
+        reverse inherit closure is a direct lookup.
+        """
+        eclasses = frozenset(eclasses)
+        if not eclasses:
+            return set()
+        return set(cpv for cpv, data in self.ebuilds.iteritems()
+                   if not eclasses.isdisjoint(data[3]))
+
+
+def git_changed_files(location, git_range):
+    """List the files changed in a git diff range, relative to location."""
+    try:
+        out = subprocess.check_output(
+            ['git', 'diff', '--name-only', '--relative', '--no-renames',
+             git_range, '--'],
+            cwd=location)
+    except (EnvironmentError, subprocess.CalledProcessError) as e:
+        raise_from(cache_errors.CacheError(
+            "failed running git diff %s in %r: %s" % (git_range, location, e)))
+    return out.decode().splitlines()
+
+
+class IncrementalRegen(object):
+    """Track which packages a regen has to visit, and snapshot the results.
+
+    Iterating over an instance yields the packages to regen; every package
+    when no usable snapshot exists or ``incremental`` is disabled.  Regen
+    helpers report each package via :obj:`record`, and :obj:`finish` writes
+    the new snapshot.
+
+    :param repo: :obj:`pkgcore.ebuild.repository._UnconfiguredTree` instance
+    :param path: snapshot file location
+    :param incremental: if False, visit every package and only write a snapshot
+    :param git_range: optional git diff range (``old..new``) to derive
+        changed ebuilds and eclasses from instead of checking the tree
+    """
+
+    def __init__(self, repo, path, incremental=True, git_range=None):
+        self.repo = repo
+        self.path = path
+        self._old = Snapshot.load(path) if incremental else None
+        self._new = Snapshot()
+        # changes are only trusted from git when there's a baseline to apply
+        # them to.
+        self._git_changes = None
+        if git_range is not None and self._old is not None:
+            self._git_changes = git_changed_files(repo.location, git_range)
+        self._eclasses = self._check_eclasses()
+
+    def _check_eclasses(self):
+        """Return the set of eclasses changed since the snapshot."""
+        old = {} if self._old is None else self._old.eclasses
+        changed = set()
+        if self._git_changes is not None:
+            changed.update(
+                os.path.basename(x)[:-len('.eclass')] for x in self._git_changes
+                if x.startswith('eclass/') and x.endswith('.eclass'))
+        current = self.repo.eclass_cache.eclasses
+        local = self.repo.location.rstrip(os.sep) + os.sep
+        for eclass, data in current.iteritems():
+            # eclasses inherited from masters aren't covered by our git repo
+            if self._git_changes is None or not data.path.startswith(local):
+                is_changed, state = _changed(data.path, old.get(eclass))
+            else:
+                state = old.get(eclass)
+                is_changed = state is None or eclass in changed
+                if is_changed:
+                    state = _file_state(data.path)
+            if is_changed:
+                changed.add(eclass)
+            if state is not None:
+                self._new.eclasses[eclass] = state
+        changed.update(frozenset(old).difference(current))
+        return changed
+
+    def _targets(self):
+        old = self._old
+        if old is None:
+            return list(self.repo)
+        affected = old.inheriting(self._eclasses)
+        if self._git_changes is not None:
+            for path in self._git_changes:
+                if path.endswith('.ebuild') and path.count('/') == 2:
+                    cat, _, ebuild = path.split('/')
+                    affected.add('%s/%s' % (cat, ebuild[:-len('.ebuild')]))
+        l = []
+        for pkg in self.repo:
+            cpv = pkg.cpvstr
+            data = old.ebuilds.get(cpv)
+            if data is None or cpv in affected:
+                l.append(pkg)
+                continue
+            if self._git_changes is None and _changed(pkg.path, data[:3])[0]:
+                l.append(pkg)
+                continue
+            # untouched; carry the snapshot entry forward.
+            self._new.ebuilds[cpv] = data
+        return l
+
+    def __iter__(self):
+        return iter(self._targets())
+
+    def ebuild_state(self, pkg):
+        """Grab an ebuild's state; done prior to sourcing so that
+        modifications racing the regen are caught next time."""
+        try:
+            return _file_state(pkg.path)
+        except EnvironmentError:
+            return None
+
+    def record(self, pkg, state, data):
+        """Note a successfully processed package."""
+        if state is None:
+            return
+        inherited = tuple(sorted(data.get('_eclasses_', ())))
+        self._new.ebuilds[pkg.cpvstr] = state + (inherited,)
+
+    def finish(self):
+        try:
+            if not ensure_dirs(os.path.dirname(self.path), mode=0755):
+                logger.warning(
+                    "failed creating regen snapshot dir for %r", self.path)
+                return
+            self._new.write(self.path)
+        except EnvironmentError as e:
+            logger.warning("failed writing regen snapshot %r: %s", self.path, e)
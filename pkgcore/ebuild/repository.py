@@ -8,7 +8,7 @@ Ebuild repository, specific to gentoo ebuild trees.
 __all__ = ("tree",)
 
 from functools import partial
-from itertools import imap, ifilterfalse
+from itertools import imap, ifilterfalse, izip
 import os
 import stat
 
@@ -30,6 +30,7 @@ from pkgcore.repository import prototype, errors, configured
 
 demandload(
     'errno',
+    'hashlib:sha1',
     'operator:attrgetter',
     'random:shuffle',
     'snakeoil.chksum:get_chksums',
@@ -37,6 +38,7 @@ demandload(
     'snakeoil.sequences:iflatten_instance',
     'pkgcore:fetch',
     'pkgcore.ebuild:cpv,digest,ebd,repo_objs,atom,restricts,profiles,processor',
+    'pkgcore.ebuild:regen_snapshot,const@e_const',
     'pkgcore.ebuild:errors@ebuild_errors',
     'pkgcore.fs.livefs:sorted_scan',
     'pkgcore.log:logger',
@@ -522,20 +524,86 @@ class _UnconfiguredTree(prototype.tree):
     def _regen_operation_helper(self, **kwds):
         return _RegenOpHelper(
             self, force=bool(kwds.get('force', False)),
-            eclass_caching=bool(kwds.get('eclass_caching', True)))
+            eclass_caching=bool(kwds.get('eclass_caching', True)),
+            tracker=kwds.get('tracker'), batch_size=kwds.get('batch_size'))
+
+    def _regen_tracker(self, force=False, incremental=False, git_range=None,
+                       **kwds):
+        """Create the tracker driving (incremental) regen, if possible.
+
+        The snapshot describes the first writable cache and is stored in the
+        user's cache dir; regen of repos without a writable cache simply
+        visits every package.  Snapshots are only recorded when incremental
+        regen is requested or a previous snapshot has to be kept current,
+        so a plain regen doesn't pay for checksumming the tree.
+        """
+        for cache in self.cache:
+            location = getattr(cache, 'location', None)
+            if not cache.readonly and location is not None:
+                break
+        else:
+            return None
+        path = pjoin(e_const.REGEN_SNAPSHOT_PATH,
+                     sha1(os.path.normpath(location)).hexdigest())
+        if not incremental and not os.path.exists(path):
+            return None
+        return regen_snapshot.IncrementalRegen(
+            self, path, incremental=(incremental and not force),
+            git_range=git_range)
 
 
 class _RegenOpHelper(object):
 
-    def __init__(self, repo, force=False, eclass_caching=True):
+    # number of packages sourced per ebuild daemon request
+    batch_size = 16
+
+    def __init__(self, repo, force=False, eclass_caching=True, tracker=None,
+                 batch_size=None):
         self.force = force
         self.eclass_caching = eclass_caching
+        self.tracker = tracker
+        self.package_factory = repo.package_class
+        self.eclass_cache = repo.eclass_cache
+        if batch_size is not None:
+            self.batch_size = batch_size
+        self.ebp = None
+        self._request_processor()
+
+    def _request_processor(self):
         self.ebp = processor.request_ebuild_processor()
-        if eclass_caching:
+        if self.eclass_caching:
             self.ebp.allow_eclass_caching()
+            # this processor lives for the whole regen; load every eclass
+            # up front rather than on first inherit.
+            self.ebp.preload_eclasses(self.eclass_cache)
+
+    def _check_processor(self):
+        """Replace the processor if a failed request discarded it."""
+        if self.ebp.pid is None:
+            processor.release_ebuild_processor(self.ebp)
+            self._request_processor()
 
     def __call__(self, pkg):
-        return pkg._fetch_metadata(ebp=self.ebp, force_regen=self.force)
+        self._check_processor()
+        if self.tracker is None:
+            return pkg._fetch_metadata(ebp=self.ebp, force_regen=self.force)
+        state = self.tracker.ebuild_state(pkg)
+        data = pkg._fetch_metadata(ebp=self.ebp, force_regen=self.force)
+        self.tracker.record(pkg, state, data)
+        return data
+
+    def regen_batch(self, pkgs):
+        self._check_processor()
+        states = None
+        if self.tracker is not None:
+            states = [self.tracker.ebuild_state(pkg) for pkg in pkgs]
+        results = self.package_factory._get_metadata_batch(
+            pkgs, ebp=self.ebp, force_regen=self.force)
+        if states is not None:
+            for pkg, state, data in izip(pkgs, states, results):
+                if not isinstance(data, Exception):
+                    self.tracker.record(pkg, state, data)
+        return results
 
     def finish(self):
         if self.eclass_caching:
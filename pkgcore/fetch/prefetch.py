@@ -0,0 +1,148 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+fetcher wrapper fetching distfiles in the background, ahead of their use
+"""
+
+__all__ = ("prefetcher",)
+
+import threading
+import Queue
+
+from snakeoil import klass
+from snakeoil.demandload import demandload
+
+from pkgcore.fetch import base
+
+demandload(
+    'pkgcore.util.thread_pool:reclaim_threads',
+)
+
+
+# marks files dropped from the queue before being fetched
+_dropped = object()
+
+
+class _entry(object):
+
+    __slots__ = ("fetchable", "done", "path", "error")
+
+    def __init__(self, fetchable):
+        self.fetchable = fetchable
+        self.done = threading.Event()
+        self.path = self.error = None
+
+
+class prefetcher(base.fetcher):
+    """Wrap a fetcher, fetching queued files with a pool of worker threads.
+
+    Files are fetched in the order they were queued; asking for a queued
+    file blocks until its fetch finished, files that weren't queued are
+    fetched directly.  Each distfile is only fetched once, so packages
+    sharing a distfile don't race writing it.
+
+    :param fetcher: :obj:`pkgcore.fetch.base.fetcher` instance to wrap
+    :param threads: number of files to fetch at once
+    """
+
+    def __init__(self, fetcher, threads=2):
+        base.fetcher.__init__(self)
+        self._fetcher = fetcher
+        self._threads = max(threads, 1)
+        self._workers = []
+        self._queue = Queue.Queue()
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    distdir = klass.alias_attr("_fetcher.distdir")
+
+    def _worker(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            try:
+                entry.path = self._fetcher(entry.fetchable)
+            except Exception as e:
+                entry.error = e
+            finally:
+                entry.done.set()
+
+    def queue(self, fetchables):
+        """Queue files to be fetched in the background."""
+        with self._lock:
+            for fetchable in fetchables:
+                if fetchable.filename in self._entries:
+                    continue
+                entry = self._entries[fetchable.filename] = _entry(fetchable)
+                self._queue.put(entry)
+            while len(self._workers) < self._threads:
+                t = threading.Thread(target=self._worker)
+                t.daemon = True
+                t.start()
+                self._workers.append(t)
+
+    def __call__(self, fetchable):
+        with self._lock:
+            entry = self._entries.get(fetchable.filename)
+        if entry is None or entry.fetchable.chksums != fetchable.chksums:
+            return self._fetcher(fetchable)
+        # a timeout keeps the wait interruptible
+        while not entry.done.wait(1):
+            pass
+        if entry.error is not None:
+            return self._retry(fetchable, entry)
+        if entry.path is _dropped:
+            return self._fetcher(fetchable)
+        return entry.path
+
+    def _retry(self, fetchable, failed):
+        """Fetch a file in the foreground after its background fetch failed.
+
+        Errors may well be transient, so rather than failing every package
+        using the file, each asking for it gets a fetch attempt of its own.
+        Concurrent callers share a single attempt.
+        """
+        with self._lock:
+            if self._entries.get(fetchable.filename) is not failed:
+                entry = None
+            else:
+                entry = self._entries[fetchable.filename] = _entry(fetchable)
+        if entry is None:
+            # another caller is already retrying it
+            return self(fetchable)
+        try:
+            entry.path = self._fetcher(fetchable)
+        except Exception as e:
+            entry.error = e
+            raise
+        finally:
+            entry.done.set()
+        return entry.path
+
+    def fetch(self, fetchable):
+        return self(fetchable)
+
+    def get_path(self, fetchable):
+        return self._fetcher.get_path(fetchable)
+
+    def get_storage_path(self):
+        return self._fetcher.get_storage_path()
+
+    def shutdown(self):
+        """Drop files not yet being fetched, and wait for the workers."""
+        with self._lock:
+            while True:
+                try:
+                    entry = self._queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if entry is not None:
+                    del self._entries[entry.fetchable.filename]
+                    entry.path = _dropped
+                    entry.done.set()
+            workers, self._workers = self._workers, []
+        for x in workers:
+            self._queue.put(None)
+        reclaim_threads(workers)
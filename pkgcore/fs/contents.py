@@ -5,12 +5,14 @@
 contents set- container of fs objects
 """
 
+from array import array
 from functools import partial
 from itertools import ifilter
 from operator import attrgetter
 
 from snakeoil.demandload import demandload
 from snakeoil.klass import generic_equality, alias_method
+from snakeoil.mappings import DictMixin
 from snakeoil.osutils import normpath, pjoin
 
 from pkgcore.fs import fs
@@ -205,6 +207,10 @@ class contentsSet(object):
     def __iter__(self):
         return self._dict.itervalues()
 
+    def iterlocations(self):
+        """Iterate over the locations of the fs objects in the set."""
+        return iter(self._dict)
+
     def __len__(self):
         return len(self._dict)
 
@@ -407,3 +413,234 @@ class OrderedContentsSet(contentsSet):
         if add_missing_directories:
             self.add_missing_directories()
         self.mutable = mutable
+
+
+_missing = object()
+
+
+class _PackedEntries(DictMixin):
+    """Mapping of location to fs object, backed by a sorted packed table.
+
+    Entries are held serialized as ``location\\0kind\\0data`` lines in a
+    single string, with an array of line offsets for binary searching by
+    location; fs objects are only created when an entry is accessed.
+    Modifications are tracked separately, leaving the table itself untouched
+    so copies can share it.
+
+    :param entries: iterable of (location, kind, data) tuples; for duplicate
+        locations the last one wins
+    :param parse: callable taking (location, kind, data) and returning the
+        fs object for that entry
+    """
+
+    __slots__ = ('_blob', '_offsets', '_removed', '_added', '_parse')
+    __externally_mutable__ = True
+
+    # kind -> fs object attribute, for filtering without parsing entries
+    kind_attrs = {
+        'obj': 'is_reg', 'dir': 'is_dir', 'sym': 'is_sym', 'dev': 'is_dev',
+        'fif': 'is_fifo',
+    }
+
+    def __init__(self, entries=(), parse=None):
+        d = {}
+        for location, kind, data in entries:
+            d[location] = (kind, data)
+        offsets = array('L', [0])
+        chunks = []
+        pos = 0
+        for location in sorted(d):
+            line = '%s\0%s\0%s\n' % ((location,) + d[location])
+            chunks.append(line)
+            pos += len(line)
+            offsets.append(pos)
+        self._blob = ''.join(chunks)
+        self._offsets = offsets
+        self._parse = parse
+        # locations in the table that were removed or shadowed by _added
+        self._removed = set()
+        self._added = {}
+
+    def copy(self):
+        obj = self.__class__.__new__(self.__class__)
+        obj._blob, obj._offsets, obj._parse = self._blob, self._offsets, self._parse
+        obj._removed = set(self._removed)
+        obj._added = self._added.copy()
+        return obj
+
+    def _location(self, i):
+        start = self._offsets[i]
+        return self._blob[start:self._blob.index('\0', start)]
+
+    def _find(self, location):
+        """Return the table index of a location, or -1 if it isn't there."""
+        lo, hi = 0, len(self._offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._location(mid) < location:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._offsets) - 1 and self._location(lo) == location:
+            return lo
+        return -1
+
+    def _in_table(self, location):
+        return location not in self._removed and self._find(location) != -1
+
+    def _entry(self, i):
+        return self._blob[self._offsets[i]:self._offsets[i + 1] - 1].split('\0')
+
+    def __getitem__(self, location):
+        obj = self._added.get(location, _missing)
+        if obj is not _missing:
+            return obj
+        if location in self._removed:
+            raise KeyError(location)
+        i = self._find(location)
+        if i == -1:
+            raise KeyError(location)
+        return self._parse(*self._entry(i))
+
+    def __setitem__(self, location, obj):
+        if location not in self._added and self._in_table(location):
+            self._removed.add(location)
+        self._added[location] = obj
+
+    def __delitem__(self, location):
+        if self._added.pop(location, _missing) is not _missing:
+            return
+        if not self._in_table(location):
+            raise KeyError(location)
+        self._removed.add(location)
+
+    def __contains__(self, location):
+        return location in self._added or self._in_table(location)
+
+    def __len__(self):
+        return len(self._offsets) - 1 - len(self._removed) + len(self._added)
+
+    def pop(self, location, default=_missing):
+        try:
+            obj = self[location]
+        except KeyError:
+            if default is _missing:
+                raise
+            return default
+        del self[location]
+        return obj
+
+    def discard(self, location):
+        """Remove a location if present, without creating its fs object."""
+        if self._added.pop(location, _missing) is _missing and \
+                self._in_table(location):
+            self._removed.add(location)
+
+    def clear(self):
+        self._blob = ''
+        self._offsets = array('L', [0])
+        self._removed.clear()
+        self._added.clear()
+
+    def _iter_table(self):
+        removed = self._removed
+        for i in xrange(len(self._offsets) - 1):
+            entry = self._entry(i)
+            if entry[0] not in removed:
+                yield entry
+
+    def iterkeys(self):
+        for entry in self._iter_table():
+            yield entry[0]
+        for location in self._added:
+            yield location
+
+    def itervalues(self, kind=None, invert=False):
+        """Iterate over the fs objects, optionally just those of one kind.
+
+        :param kind: CONTENTS style entry type (``obj``, ``dir``, ...) to
+            filter on, without parsing the entries that don't match
+        :param invert: if True, yield everything not of the given kind
+        """
+        parse = self._parse
+        for entry in self._iter_table():
+            if kind is None or (entry[1] == kind) != invert:
+                yield parse(*entry)
+        if kind is None:
+            for obj in self._added.itervalues():
+                yield obj
+        else:
+            attr = self.kind_attrs[kind]
+            for obj in self._added.itervalues():
+                if getattr(obj, attr) != invert:
+                    yield obj
+
+    def iteritems(self):
+        for obj in self.itervalues():
+            yield obj.location, obj
+
+
+class PackedContentsSet(contentsSet):
+    """:obj:`contentsSet` holding its entries serialized until they're used.
+
+    Large sets, the contents of installed packages in particular, are far
+    cheaper to hold as a sorted table of their serialized entries than as a
+    dict of fs objects; membership tests and iterating over locations or a
+    single kind of entry never create objects for the rest.
+
+    :param entries: iterable of (location, kind, data) tuples, see
+        :obj:`_PackedEntries`
+    :param parse: callable converting an entry into an fs object
+    """
+
+    def __init__(self, entries=(), parse=None, mutable=True):
+        contentsSet.__init__(self, mutable=True)
+        self._dict = _PackedEntries(entries, parse)
+        self.mutable = mutable
+
+    def clone(self, empty=False):
+        if empty:
+            return contentsSet(mutable=True)
+        obj = self.__class__.__new__(self.__class__)
+        obj.__dict__.update(self.__dict__)
+        obj._dict = self._dict.copy()
+        obj.mutable = True
+        return obj
+
+    def discard(self, obj):
+        if fs.isfs_obj(obj):
+            self._dict.discard(obj.location)
+        else:
+            self._dict.discard(obj)
+
+    def difference(self, other):
+        if not hasattr(other, '__contains__'):
+            other = set(self._convert_loc(other))
+        # removals are cheap, and the table is shared.
+        cset = self.clone()
+        if len(other) < len(self):
+            for x in self._convert_loc(other):
+                cset.discard(normpath(x))
+        else:
+            for x in self.iterlocations():
+                if x in other:
+                    cset.discard(x)
+        cset.mutable = self.mutable
+        return cset
+
+    def iterfiles(self, invert=False):
+        return self._dict.itervalues('obj', invert)
+
+    def iterdirs(self, invert=False):
+        return self._dict.itervalues('dir', invert)
+
+    def itersymlinks(self, invert=False):
+        return self._dict.itervalues('sym', invert)
+
+    iterlinks = alias_method('itersymlinks')
+
+    def iterdevs(self, invert=False):
+        return self._dict.itervalues('dev', invert)
+
+    def iterfifos(self, invert=False):
+        return self._dict.itervalues('fif', invert)
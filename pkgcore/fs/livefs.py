@@ -215,9 +215,15 @@ def intersect(cset, realpath=False):
         f2 = _realpath_dir()
     else:
         f2 = lambda x:x
-    for x in cset:
+    # csets can provide their locations without creating every fs object
+    iterlocations = getattr(cset, 'iterlocations', None)
+    if iterlocations is not None:
+        locations = iterlocations()
+    else:
+        locations = (x.location for x in cset)
+    for location in locations:
         try:
-            yield f(f2(x.location))
+            yield f(f2(location))
         except OSError as oe:
             if oe.errno not in (errno.ENOENT, errno.ENOTDIR):
                 raise
@@ -8,10 +8,14 @@ Shouldn't be accessed directly for the most part, use
 :mod:`pkgcore.plugins` to get at these ops.
 """
 
+import ctypes
 import errno
+import fcntl
 from functools import partial
 import os
 
+from snakeoil.data_source import local_source
+from snakeoil.demandload import demandload
 from snakeoil.osutils import ensure_dirs, pjoin, unlink_if_exists
 
 from pkgcore.const import CP_BINARY
@@ -20,6 +24,10 @@ from pkgcore.fs.livefs import gen_obj
 from pkgcore.plugin import get_plugin
 from pkgcore.spawn import spawn
 
+demandload(
+    'pkgcore.util.thread_pool:map_async',
+)
+
 
 __all__ = [
     "merge_contents", "unmerge_contents", "default_ensure_perms",
@@ -148,13 +156,18 @@ def default_copyfile(obj, mkdirs=False):
                 raise
         existent = False
 
+    return _copy_obj(obj, existent, ensure_perms)
+
+
+def _copy_obj(obj, existent, ensure_perms, link=False):
+    """copy an obj whose location is known to exist or not; see default_copyfile"""
     if not existent:
         fp = obj.location
     else:
         fp = existent_fp = obj.location + "#new"
 
     if fs.isreg(obj):
-        obj.data.transfer_to_path(fp)
+        _copy_data(obj, fp, link=link)
     elif fs.issym(obj):
         os.symlink(obj.target, fp)
     elif fs.isfifo(obj):
@@ -173,6 +186,81 @@ def default_copyfile(obj, mkdirs=False):
         os.rename(existent_fp, obj.location)
     return True
 
+# ioctl cloning a file's extents, sharing them copy-on-write (btrfs, xfs)
+_FICLONE = 0x40049409
+# errnos signaling the fs can't clone or copy in kernel between the files
+_clone_unsupported = frozenset([
+    errno.EXDEV, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY, errno.ENOSYS])
+
+
+def _get_copy_file_range():
+    try:
+        func = ctypes.CDLL(None, use_errno=True).copy_file_range
+    except (AttributeError, OSError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                     ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint]
+    func.restype = ctypes.c_ssize_t
+    return func
+
+_copy_file_range = _get_copy_file_range()
+
+
+def _clone_file(source, path):
+    """Copy a file without passing its data through userspace.
+
+    The file is reflinked if the fs supports it, else copied with
+    copy_file_range.
+
+    :return: True if copied, False if neither works between the two paths
+    """
+    with open(source, 'rb') as src:
+        with open(path, 'wb') as trg:
+            try:
+                fcntl.ioctl(trg.fileno(), _FICLONE, src.fileno())
+                return True
+            except EnvironmentError as e:
+                if e.errno not in _clone_unsupported:
+                    raise
+            if _copy_file_range is None:
+                return False
+            size = remaining = os.fstat(src.fileno()).st_size
+            while remaining > 0:
+                ret = _copy_file_range(
+                    src.fileno(), None, trg.fileno(), None, remaining, 0)
+                if ret < 0:
+                    err = ctypes.get_errno()
+                    if err in _clone_unsupported and remaining == size:
+                        return False
+                    raise OSError(err, os.strerror(err), path)
+                elif ret == 0:
+                    # source shrank underneath us
+                    break
+                remaining -= ret
+    return True
+
+
+def _copy_data(obj, path, link=False):
+    """Write the data of a regular file obj to path.
+
+    Data on the local fs is hardlinked if link is True, else cloned if
+    possible, before falling back to copying it through userspace.
+    """
+    data = obj.data
+    if isinstance(data, local_source):
+        if link:
+            unlink_if_exists(path)
+            try:
+                os.link(data.path, path)
+                return
+            except EnvironmentError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+        if _clone_file(data.path, path):
+            return
+    data.transfer_to_path(path)
+
+
 def do_link(src, trg):
     try:
         os.link(src.location, trg.location)
@@ -207,16 +295,106 @@ def do_link(src, trg):
     return True
 
 
-def merge_contents(cset, offset=None, callback=None):
+# dirs receiving at least this many files are listed instead of statting
+# each file when checking what's already on the livefs
+_listdir_min = 16
+
+
+def _stat_targets(objs):
+    """Return each obj paired with whether its location exists.
+
+    Missing parent dirs are created.
+
+    :raise CannotOverwrite: if an obj's location is a dir
+    """
+    by_dir = {}
+    for obj in objs:
+        by_dir.setdefault(os.path.dirname(obj.location), []).append(obj)
+
+    l = []
+    for dirname, objs in by_dir.iteritems():
+        if dirname.strip(os.path.sep) and not os.path.exists(dirname):
+            if not ensure_dirs(dirname, mode=0750, minimal=True):
+                raise FailedCopy(objs[0], "failed creating %s" % (dirname,))
+            l.extend((x, False) for x in objs)
+            continue
+        if len(objs) >= _listdir_min:
+            names = frozenset(os.listdir(dirname))
+            present = []
+            for x in objs:
+                if os.path.basename(x.location) in names:
+                    present.append(x)
+                else:
+                    l.append((x, False))
+            objs = present
+        for x in objs:
+            try:
+                existing = gen_obj(x.location)
+            except OSError as oe:
+                if oe.errno != errno.ENOENT:
+                    raise
+                l.append((x, False))
+                continue
+            if fs.isdir(existing):
+                raise CannotOverwrite(x, existing)
+            l.append((x, True))
+    return l
+
+
+def _copy_worker(queue, ensure_perms, link, errors):
+    for obj, existent in queue:
+        if errors:
+            # something failed already, drain the queue
+            continue
+        try:
+            _copy_obj(obj, existent, ensure_perms, link=link)
+        except Exception as e:
+            errors.append(e)
+
+
+def _copy_files(objs, ensure_perms, threads=None, link=False):
+    """Copy regular files to the livefs using a pool of threads."""
+    targets = _stat_targets(objs)
+    errors = []
+    if threads == 1:
+        _copy_worker(iter(targets), ensure_perms, link, errors)
+    else:
+        map_async(targets, _copy_worker, ensure_perms, link, errors,
+                  threads=threads)
+    if errors:
+        raise errors[0]
+
+
+def _link_to_merged(obj, candidates):
+    """Try hardlinking obj to merged files sharing its inode in the image."""
+    # This logic could be made smarter- instead of
+    # blindly trying candidates, we could inspect the st_dev
+    # of the final location.  This however can be broken by
+    # overlayfs's potentially.  Brute force is in use either
+    # way.
+    return any(target._can_be_hardlinked(obj) and do_link(target, obj)
+               for target in candidates)
+
+
+def merge_contents(cset, offset=None, callback=None, threads=None,
+                   link_sources=False):
 
     """
     merge a :class:`pkgcore.fs.contents.contentsSet` instance to the livefs
 
+    Regular files are copied by a pool of threads, cloned rather than
+    copied where the fs allows it, as long as the fs_ops.copyfile plugin
+    isn't overridden.
+
     :param cset: :class:`pkgcore.fs.contents.contentsSet` instance
     :param offset: if not None, offset to prefix all locations with.
         Think of it as target dir.
     :param callback: callable to report each entry being merged; given a single arg,
         the fs object being merged.
+    :param threads: number of threads copying files, defaulting to the
+        number of cpus
+    :param link_sources: hardlink files to their source where possible,
+        only safe if the source is thrown away after merging
     :raise EnvironmentError: Thrown for permission failures.
     """
 
@@ -273,21 +451,25 @@ def merge_contents(cset, offset=None, callback=None):
     # to one time, assuming everything behaves, rather then per item.
     i = iterate(cset.iterdirs(invert=True))
     merged_inodes = {}
+    # regular files are left for the thread pool, those sharing an inode
+    # with one of them are hardlinked to it afterwards
+    parallel = copyfile is default_copyfile
+    files, linked = [], []
     while True:
         try:
             for x in i:
                 callback(x)
 
                 if x.is_reg:
-                    key = (x.dev, x.inode)
-                    # This logic could be made smarter- instead of
-                    # blindly trying candidates, we could inspect the st_dev
-                    # of the final location.  This however can be broken by
-                    # overlayfs's potentially.  Brute force is in use either
-                    # way.
-                    candidates = merged_inodes.setdefault(key, [])
-                    if any(target._can_be_hardlinked(x) and do_link(target, x)
-                            for target in candidates):
+                    candidates = merged_inodes.setdefault((x.dev, x.inode), [])
+                    if parallel:
+                        if candidates:
+                            linked.append(x)
+                        else:
+                            candidates.append(x)
+                            files.append(x)
+                        continue
+                    if _link_to_merged(x, candidates):
                         continue
                     candidates.append(x)
 
@@ -305,6 +487,14 @@ def merge_contents(cset, offset=None, callback=None):
                     raise
             except OSError:
                 raise cf
+
+    if files:
+        _copy_files(files, ensure_perms, threads=threads, link=link_sources)
+    for x in linked:
+        candidates = merged_inodes[(x.dev, x.inode)]
+        if not _link_to_merged(x, candidates):
+            candidates.append(x)
+            copyfile(x, mkdirs=True)
     return True
 
 
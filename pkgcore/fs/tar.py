@@ -5,14 +5,19 @@
 binpkg tar utilities
 """
 
+import bz2
 from functools import partial
+import gzip
 import itertools
 import os
+import shutil
 import stat
+import subprocess
+import threading
 
-from snakeoil import compression
-from snakeoil.compatibility import cmp, sorted_cmp
+from snakeoil import compression, process
 from snakeoil.data_source import invokable_data_source
+from snakeoil.osutils import pjoin
 from snakeoil.tar import tarfile
 
 from pkgcore.fs import contents
@@ -26,32 +31,171 @@ known_compressors = {
     None: tarfile.TarFile.open}
 
 
-def write_set(contents_set, filepath, compressor='bzip2', absolute_paths=False,
-              parallelize=False):
+class _stream_writer(object):
+    """File-like passing written data through to a handle, tracking its position."""
+
+    def __init__(self, handle):
+        self._handle = handle
+        self.position = 0
+
+    def write(self, data):
+        self.position += len(data)
+        self._handle.write(data)
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        pass
+
+
+class _native_compressor(_stream_writer):
+
+    def __init__(self, handle, compressor):
+        _stream_writer.__init__(self, handle)
+        self._compressor = compressor
+
+    def write(self, data):
+        self.position += len(data)
+        data = self._compressor.compress(data)
+        if data:
+            self._handle.write(data)
+
+    def close(self):
+        self._handle.write(self._compressor.flush())
+
+
+class _process_compressor(_stream_writer):
+    """Compress through an external binary, pumping its output into the handle."""
+
+    def __init__(self, handle, args):
+        _stream_writer.__init__(self, handle)
+        self._args = tuple(args)
+        with open(os.devnull, 'wb') as stderr:
+            self._process = subprocess.Popen(
+                args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=stderr, close_fds=True)
+        self._error = None
+        self._pump = threading.Thread(target=self._pump_output)
+        self._pump.start()
+
+    def _pump_output(self):
+        try:
+            for data in iter(partial(self._process.stdout.read, 65536), ''):
+                self._handle.write(data)
+        except Exception as e:
+            self._error = e
+            self._process.kill()
+
+    def write(self, data):
+        self.position += len(data)
+        self._process.stdin.write(data)
+
+    def close(self):
+        try:
+            self._process.stdin.close()
+        finally:
+            self._pump.join()
+            ret = self._process.wait()
+        if self._error is not None:
+            raise self._error
+        if ret != 0:
+            raise EnvironmentError(
+                "%s returned exit code %i" % (' '.join(self._args), ret))
+
+
+# compressor: (native compressor factory taking the level, parallel binaries)
+stream_compressors = {
+    'bzip2': (bz2.BZ2Compressor, ('lbzip2', 'pbzip2')),
+    'gzip': (None, ('pigz',)),
+    None: (None, ()),
+}
+
+
+def _find_parallel_binary(binaries):
+    for binary in binaries:
+        try:
+            return process.find_binary(binary)
+        except process.CommandNotFound:
+            continue
+    return None
+
+
+def compress_stream(compressor, handle, level=9, parallelize=False):
+    """Return a file-like compressing data written to it into handle.
+
+    :param compressor: key of :obj:`stream_compressors`, or a callable
+        taking the handle, level, and parallelize and returning a file-like
+    :param parallelize: if True, compress using a multithreaded binary
+        where one is available
+    """
     if compressor == 'bz2':
         compressor = 'bzip2'
+    elif compressor == 'gz':
+        compressor = 'gzip'
+    if callable(compressor):
+        return compressor(handle, level, parallelize)
+    native, binaries = stream_compressors[compressor]
+    if parallelize:
+        binary = _find_parallel_binary(binaries)
+        if binary is not None:
+            return _process_compressor(handle, [binary, '-%ic' % (level,)])
+    if compressor == 'gzip':
+        return gzip.GzipFile(fileobj=handle, mode='wb', compresslevel=level)
+    elif native is not None:
+        return _native_compressor(handle, native(level))
+    return _stream_writer(handle)
+
+
+def write_stream(contents_set, handle, compressor='bzip2', absolute_paths=False,
+                 parallelize=False, level=9):
+    """Tar and compress fs objs into a handle in a single pass.
 
+    :param contents_set: :obj:`pkgcore.fs.contents.contentsSet`, or an
+        iterable of fs objs as :obj:`pkgcore.fs.livefs.iter_scan` yields,
+        see :obj:`add_contents_to_tarfile`
+    :param handle: file-like the compressed tarball is written to
+    :param compressor: see :obj:`compress_stream`
+    """
     tar_handle = None
-    handle = compression.compress_handle(compressor, filepath,
-        parallelize=parallelize)
+    compressed = compress_stream(compressor, handle, level=level,
+                                 parallelize=parallelize)
     try:
-        tar_handle = tarfile.TarFile(name=filepath, fileobj=handle, mode='w')
-        add_contents_to_tarfile(contents_set, tar_handle)
+        tar_handle = tarfile.TarFile(fileobj=compressed, mode='w')
+        add_contents_to_tarfile(contents_set, tar_handle, absolute_paths)
     finally:
         if tar_handle is not None:
             tar_handle.close()
-        handle.close()
+        compressed.close()
+
+
+def write_set(contents_set, filepath, compressor='bzip2', absolute_paths=False,
+              parallelize=False):
+    with open(filepath, 'wb') as handle:
+        write_stream(contents_set, handle, compressor=compressor,
+                     absolute_paths=absolute_paths, parallelize=parallelize)
+
 
 def add_contents_to_tarfile(contents_set, tar_fd, absolute_paths=False):
-    # first add directories, then everything else
-    # this is just a pkgcore optimization, it prefers to see the dirs first.
-    dirs = contents_set.dirs()
-    dirs.sort()
-    for x in dirs:
-        tar_fd.addfile(fsobj_to_tarinfo(x, absolute_paths))
-    del dirs
+    """Add fs objs to a tarfile.
+
+    :param contents_set: :obj:`pkgcore.fs.contents.contentsSet`, or an
+        iterable of fs objs; the latter are added as they come, so
+        should yield dirs before their contents
+    """
     inodes = {}
-    for x in contents_set.iterdirs(invert=True):
+    if isinstance(contents_set, contents.contentsSet):
+        # first add directories, then everything else
+        # this is just a pkgcore optimization, it prefers to see the dirs first.
+        dirs = contents_set.dirs()
+        dirs.sort()
+        for x in dirs:
+            tar_fd.addfile(fsobj_to_tarinfo(x, absolute_paths))
+        del dirs
+        iterable = contents_set.iterdirs(invert=True)
+    else:
+        iterable = contents_set
+    for x in iterable:
         t = fsobj_to_tarinfo(x, absolute_paths)
         if t.isreg():
             key = (x.dev, x.inode)
@@ -71,6 +215,98 @@ def add_contents_to_tarfile(contents_set, tar_fd, absolute_paths=False):
             tar_fd.addfile(t)
 
 
+class archive_member_source(invokable_data_source):
+    """Data source for a file within a tarball.
+
+    Tracks the tarball and member it came from, so the data of many such
+    sources can be pulled in one pass over the tarball, see
+    :obj:`extract_files`.
+    """
+
+    __slots__ = ('archive', 'member')
+
+    def __init__(self, data, archive, member):
+        invokable_data_source.__init__(self, data)
+        self.archive = archive
+        self.member = member
+
+
+def extract_files(files, offset, compressor='bz2', parallelize=True,
+                  ensure_perms=None):
+    """Write the data of files sourced from tarballs beneath an offset.
+
+    Each tarball is read once, in order, rather than seeking to every member;
+    files with other data sources are ignored.  Parent directories are
+    expected to exist already, and hardlinked files are written as copies.
+
+    :param files: iterable of :obj:`pkgcore.fs.fs.fsFile` instances
+    :param offset: path the files' locations are relative to
+    :param compressor: compression of the tarballs
+    :param ensure_perms: if given, invoked with each written file, offset
+        to its on disk location
+    :return: list of the files written, offset to their on disk locations
+    """
+    if compressor == 'bz2':
+        compressor = 'bzip2'
+    elif compressor == 'gz':
+        compressor = 'gzip'
+
+    archives = {}
+    for obj in files:
+        if isinstance(obj.data, archive_member_source):
+            members = archives.setdefault(obj.data.archive, {})
+            members.setdefault(obj.data.member, []).append(obj)
+
+    psep = os.path.sep
+    written = []
+    for archive, members in archives.iteritems():
+        # on disk paths of files extracted so far, for hardlinks to copy.
+        paths = {}
+        handle = compression.decompress_handle(
+            compressor, archive, parallelize=parallelize)
+        try:
+            src_tar = tarfile.TarFile.open(
+                name=archive, fileobj=handle, mode='r|')
+            for member in src_tar:
+                objs = members.pop(member.name, None)
+                if objs is None:
+                    continue
+                path = pjoin(offset, objs[0].location.lstrip(psep))
+                if member.islnk():
+                    source = paths.get(
+                        os.path.abspath(pjoin(psep, member.linkname)))
+                    if source is None:
+                        # the target wasn't wanted; fall back to the source.
+                        members[member.name] = objs
+                        continue
+                    shutil.copyfile(source, path)
+                else:
+                    with open(path, 'wb') as f:
+                        shutil.copyfileobj(
+                            src_tar.extractfile(member), f, 65536)
+                paths[os.path.abspath(pjoin(psep, member.name))] = path
+                for obj in objs[1:]:
+                    shutil.copyfile(path, pjoin(offset, obj.location.lstrip(psep)))
+                written.extend(objs)
+        finally:
+            handle.close()
+
+        # whatever couldn't be streamed is pulled from its data source.
+        for objs in members.itervalues():
+            for obj in objs:
+                with open(pjoin(offset, obj.location.lstrip(psep)), 'wb') as f:
+                    shutil.copyfileobj(obj.data.bytes_fileobj(), f, 65536)
+                written.append(obj)
+
+    written = [obj.change_attributes(
+        location=pjoin(offset, obj.location.lstrip(psep)))
+        for obj in written]
+    if ensure_perms is not None:
+        for obj in written:
+            ensure_perms(obj)
+    return written
+
+
 def archive_to_fsobj(src_tar):
     psep = os.path.sep
     dev = _unique_inode()
@@ -79,6 +315,7 @@ def archive_to_fsobj(src_tar):
     # consistent inode numbers), we have to normalize the path lookup into this cache
     # via abspath(os.path.join('/', key))...
     inodes = {}
+    archive = getattr(src_tar, 'name', None)
     for member in src_tar:
         d = {
             "uid":member.uid, "gid":member.gid,
@@ -107,9 +344,11 @@ def archive_to_fsobj(src_tar):
             # to ensure 'y' is in the cache alongside it's target z to support 'x'
             # later lookup.
             inodes[location] = inode
-            d["data"] = invokable_data_source.wrap_function(partial(
-                src_tar.extractfile, member.name), returns_text=False,
-                returns_handle=True)
+            d["data"] = archive_member_source(
+                invokable_data_source.wrap_function(partial(
+                    src_tar.extractfile, member.name), returns_text=False,
+                    returns_handle=True).data,
+                archive, member.name)
             yield fsFile(location, **d)
         elif member.issym() or member.islnk():
             yield fsSymlink(location, member.linkname, **d)
@@ -178,68 +417,148 @@ def generate_contents(filepath, compressor="bz2", parallelize=True):
     return convert_archive(tar_handle)
 
 
-def convert_archive(archive):
-    # regarding the usage of del in this function... bear in mind these sets
-    # could easily have 10k -> 100k entries in extreme cases; thus the del
-    # usage, explicitly trying to ensure we don't keep refs long term.
-
-    # this one is a bit fun.
-    raw = list(archive_to_fsobj(archive))
-    # we use the data source as the unique key to get position.
-    files_ordering = list(enumerate(x for x in raw if x.is_reg))
-    files_ordering = {x.data: idx for idx, x in files_ordering}
-    t = contents.contentsSet(raw, mutable=True)
-    del raw, archive
-
-    # first rewrite affected syms.
-    raw_syms = t.links()
-    syms = contents.contentsSet(raw_syms)
-    while True:
-        for x in sorted(syms):
-            affected = syms.child_nodes(x.location)
-            if not affected:
+class _symlink_trie(object):
+    """Trie of symlinks by path component, for resolving paths through them.
+
+    Nodes are dicts of path component to child node; a symlink's node
+    additionally maps None to the symlink.
+    """
+
+    # same as the kernel's limit before ELOOP
+    max_hops = 40
+
+    def __init__(self, syms=()):
+        self._root = {}
+        for x in syms:
+            self.add(x)
+
+    def _node(self, location, create=False):
+        node = self._root
+        for part in location.split(os.path.sep)[1:]:
+            child = node.get(part)
+            if child is None:
+                if not create:
+                    return None
+                child = node[part] = {}
+            node = child
+        return node
+
+    def add(self, sym):
+        self._node(sym.location, create=True)[None] = sym
+
+    def remove(self, sym):
+        node = self._node(sym.location)
+        if node is not None and node.get(None) is sym:
+            del node[None]
+
+    def child_syms(self, location):
+        """Yield the symlinks beneath a location."""
+        node = self._node(location)
+        if node is None:
+            return
+        stack = [v for k, v in node.iteritems() if k is not None]
+        while stack:
+            node = stack.pop()
+            for k, v in node.iteritems():
+                if k is None:
+                    yield v
+                else:
+                    stack.append(v)
+
+    def resolve(self, location):
+        """Return location with symlinks among its parent dirs resolved.
+
+        Resolution is abandoned, returning location as is, on a symlink loop.
+        """
+        psep = os.path.sep
+        parts = location.split(psep)[1:]
+        node = self._root
+        hops = idx = 0
+        while idx < len(parts) - 1:
+            node = node.get(parts[idx])
+            if node is None:
+                break
+            sym = node.get(None)
+            if sym is None:
+                idx += 1
                 continue
-            syms.difference_update(affected)
-            syms.update(affected.change_offset(x.location, x.resolved_target))
-            del affected
-            break
-        else:
-            break
-
-    t.difference_update(raw_syms)
-    t.update(syms)
-
-    del raw_syms
-    syms = sorted(syms, reverse=True)
-    # ok, syms are correct.  now we get the rest.
-    # we shift the readds into a separate list so that we don't reinspect
-    # them on later runs; this slightly reduces the working set.
-    additions = []
-    for x in syms:
-        affected = t.child_nodes(x.location)
-        if not affected:
+            hops += 1
+            if hops > self.max_hops:
+                return location
+            parts = [x for x in sym.resolved_target.split(psep) if x] + \
+                parts[idx + 1:]
+            node = self._root
+            idx = 0
+        return psep + psep.join(parts)
+
+
+def _archive_sort_key(files_ordering, obj):
+    # dirs first, then syms and the like, then files in archive order.
+    if obj.is_dir:
+        return 0, obj.location
+    elif obj.is_reg:
+        return 2, files_ordering[obj.data]
+    return 1, obj.location
+
+
+def convert_archive(archive):
+    """Convert tar members into a contentsSet, resolving directory symlinks.
+
+    Anything within a directory symlink is relocated to where the symlink
+    resolves to, as extracting the archive would.
+    """
+    entries = {}
+    files_ordering = {}
+    for obj in archive_to_fsobj(archive):
+        if obj.is_reg:
+            files_ordering[obj.data] = len(files_ordering)
+        entries[obj.location] = obj
+    del archive
+
+    # first move symlinks living beneath other symlinks.  moving one can put
+    # others beneath it, so those are rechecked; the move limit guards
+    # against symlink loops.
+    syms = {k: v for k, v in entries.iteritems() if v.is_sym}
+    trie = _symlink_trie(syms.itervalues())
+    pending = sorted(syms.itervalues(), reverse=True)
+    moves = _symlink_trie.max_hops * len(pending)
+    while pending and moves:
+        sym = pending.pop()
+        location = trie.resolve(sym.location)
+        if location == sym.location or syms.get(sym.location) is not sym:
             continue
-        t.difference_update(affected)
-        additions.extend(affected.change_offset(x.location, x.resolved_target))
+        moves -= 1
+        trie.remove(sym)
+        del syms[sym.location]
+        sym = sym.change_attributes(location=location)
+        trie.add(sym)
+        syms[location] = sym
+        pending.extend(trie.child_syms(location))
 
-    t.update(additions)
+    # now relocate everything else; resolution is cached per directory
+    # since files are far more numerous than directories.
+    t = contents.contentsSet(mutable=True)
+    moved = []
+    resolved_dirs = {}
+    for location, obj in entries.iteritems():
+        if obj.is_sym:
+            continue
+        dirname, basename = os.path.split(location)
+        resolved = resolved_dirs.get(dirname)
+        if resolved is None:
+            resolved = resolved_dirs[dirname] = os.path.dirname(
+                trie.resolve(os.path.join(dirname, basename)))
+        if resolved == dirname:
+            t.add(obj)
+        else:
+            moved.append(obj.change_attributes(
+                location=os.path.join(resolved, basename)))
+    del entries, resolved_dirs
+    t.update(syms.itervalues())
+    t.update(moved)
+    del syms, moved
     t.add_missing_directories()
 
-    # finally... an insane sort.
-    def sort_func(x, y):
-        if x.is_dir:
-            if not y.is_dir:
-                return -1
-            return cmp(x, y)
-        elif y.is_dir:
-            return +1
-        elif x.is_reg:
-            if y.is_reg:
-                return cmp(files_ordering[x.data],
-                    files_ordering[y.data])
-            return +1
-        elif y.is_reg:
-            return -1
-        return cmp(x, y)
-
-    return contents.OrderedContentsSet(sorted_cmp(t, sort_func), mutable=False)
+    return contents.OrderedContentsSet(
+        sorted(t, key=partial(_archive_sort_key, files_ordering)),
+        mutable=False)
@@ -1,28 +1,152 @@
 # Copyright: 2011 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD 3 clause
 
+from collections import deque
+from itertools import islice, izip
+import threading
+import time
+
 from snakeoil import compatibility
 from snakeoil.demandload import demandload
 
 demandload(
-    'pkgcore.util.thread_pool:map_async',
+    'pkgcore.util.thread_pool:reclaim_threads',
 )
 
 
-def regen_iter(iterable, regen_func, observer, is_thread=False):
-    for x in iterable:
-        try:
-            regen_func(x)
-        except compatibility.IGNORED_EXCEPTIONS as e:
-            if isinstance(e, KeyboardInterrupt):
+class RegenStats(object):
+    """Throughput of a single regen worker (and thus ebuild processor)."""
+
+    __slots__ = ('worker', 'count', 'errors', 'elapsed')
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.count = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        if not self.elapsed:
+            return 0.0
+        return self.count / self.elapsed
+
+    def __str__(self):
+        return "worker %i: %i packages (%i failed) in %.2f seconds, %.1f/s" % (
+            self.worker, self.count, self.errors, self.elapsed, self.rate)
+
+
+def regen_iter(iterable, regen_func, observer, is_thread=False, stats=None):
+    """Regen each item, reporting failures to the observer.
+
+    If regen_func has a ``batch_size`` attribute above 1, items are handed to
+    its ``regen_batch`` method in chunks of that size instead; it must return
+    a result per item, with the exception raised for failed items.
+    """
+    batch_size = getattr(regen_func, 'batch_size', 1)
+    start = time.time()
+    try:
+        if batch_size > 1:
+            iterable = iter(iterable)
+            while True:
+                chunk = list(islice(iterable, batch_size))
+                if not chunk:
+                    break
+                try:
+                    results = regen_func.regen_batch(chunk)
+                except compatibility.IGNORED_EXCEPTIONS as e:
+                    if isinstance(e, KeyboardInterrupt):
+                        return
+                    raise
+                except Exception as e:
+                    results = [e] * len(chunk)
+                for x, result in izip(chunk, results):
+                    if isinstance(result, Exception):
+                        observer.error(
+                            "caught exception %s while processing %s", result, x)
+                        if stats is not None:
+                            stats.errors += 1
+                    if stats is not None:
+                        stats.count += 1
+            return
+        for x in iterable:
+            try:
+                regen_func(x)
+            except compatibility.IGNORED_EXCEPTIONS as e:
+                if isinstance(e, KeyboardInterrupt):
+                    return
+                raise
+            except Exception as e:
+                observer.error("caught exception %s while processing %s", e, x)
+                if stats is not None:
+                    stats.errors += 1
+            if stats is not None:
+                stats.count += 1
+    finally:
+        if stats is not None:
+            stats.elapsed = time.time() - start
+
+
+class _WorkQueues(object):
+    """Per worker package queues with work stealing.
+
+    The package stream is split into contiguous runs so each worker mostly
+    sees versions of the same packages, and thus the same eclasses.  A worker
+    that runs dry steals from the tail of the longest remaining queue.
+    """
+
+    def __init__(self, iterable, workers):
+        items = list(iterable)
+        workers = max(min(len(items), workers), 1)
+        chunk, extra = divmod(len(items), workers)
+        self.queues = []
+        start = 0
+        for i in xrange(workers):
+            end = start + chunk + (i < extra)
+            self.queues.append(deque(items[start:end]))
+            start = end
+
+    def __len__(self):
+        return len(self.queues)
+
+    def iter_worker(self, worker):
+        own = self.queues[worker]
+        while True:
+            # deque pops are atomic; losing a race just means trying the
+            # next victim.
+            try:
+                yield own.popleft()
+                continue
+            except IndexError:
+                pass
+            for victim in sorted(self.queues, key=len, reverse=True):
+                try:
+                    item = victim.pop()
+                    break
+                except IndexError:
+                    continue
+            else:
                 return
-            raise
-        except Exception as e:
-            observer.error("caught exception %s while processing %s", e, x)
+            yield item
 
 
 def regen_repository(repo, observer, threads=1, pkg_attr='keywords', **options):
+    """Regenerate the metadata cache for a repo.
+
+    Repos may provide a ``_regen_tracker`` hook returning an iterable of the
+    packages to regen; it's passed on to the repo's regen helpers as
+    ``tracker`` and its ``finish`` method is invoked once regen completes.
+
+    :return: list of :obj:`RegenStats`, one per worker
+    """
     helpers = []
+    pkgs = repo
+    tracker = None
+    if hasattr(repo, '_regen_tracker'):
+        tracker = repo._regen_tracker(**options)
+        if tracker is not None:
+            pkgs = tracker
+            options['tracker'] = tracker
 
     def _get_repo_helper():
         if not hasattr(repo, '_regen_operation_helper'):
@@ -33,13 +157,30 @@ def regen_repository(repo, observer, threads=1, pkg_attr='keywords', **options):
         return helper
 
     if threads == 1:
-        regen_iter(iter(repo), _get_repo_helper(), observer)
+        stats = [RegenStats(0)]
+        regen_iter(iter(pkgs), _get_repo_helper(), observer, stats=stats[0])
     else:
-        def get_args():
-            return (_get_repo_helper(), observer, True)
-        map_async(repo, regen_iter, per_thread_args=get_args)
+        queues = _WorkQueues(pkgs, threads)
+        stats = [RegenStats(i) for i in xrange(len(queues))]
+
+        def _worker(i):
+            # each worker owns its helper, and with it a long lived ebuild
+            # processor; set it up in the thread so preloading overlaps.
+            regen_iter(queues.iter_worker(i), _get_repo_helper(), observer,
+                       True, stats[i])
+
+        workers = [threading.Thread(target=_worker, args=(i,))
+                   for i in xrange(len(queues))]
+        try:
+            for x in workers:
+                x.start()
+        finally:
+            reclaim_threads(workers)
 
     for helper in helpers:
         f = getattr(helper, 'finish', None)
         if f is not None:
             f()
+    if tracker is not None:
+        tracker.finish()
+    return stats
@@ -240,18 +240,20 @@ class operations(sync_operations):
         cache = getattr(self.repo, 'cache', None)
         if not cache and not options.get('force', False):
             return
-        sync_rate = getattr(cache, 'sync_rate', None)
+        # batch cache writes for the duration of the regen; flushed below.
+        sync_rates = [(x, x.sync_rate) for x in self._get_caches()
+                      if getattr(x, 'sync_rate', None) is not None]
         try:
-            if sync_rate is not None:
-                cache.set_sync_rate(1000000)
+            for x, sync_rate in sync_rates:
+                x.set_sync_rate(1000000)
             ret = regen.regen_repository(
                 self.repo,
                 self._get_observer(observer), threads=threads, **options)
             self._cmd_implementation_clean_cache()
             return ret
         finally:
-            if sync_rate is not None:
-                cache.set_sync_rate(sync_rate)
+            for x, sync_rate in sync_rates:
+                x.set_sync_rate(sync_rate)
             self.repo.operations.run_if_supported("flush_cache")
 
     def _get_caches(self):
@@ -14,6 +14,9 @@ from pkgcore.ebuild import cpv
 from pkgcore.ebuild.atom import atom
 from pkgcore.package import base
 
+# number of times pkg metadata was pulled, see pkgcore.resolver.profile
+metadata_loads = 0
+
 
 def DeriveMetadataKls(original_kls):
     if getattr(original_kls, "_derived_metadata_kls", False):
@@ -56,6 +59,8 @@ def DeriveMetadataKls(original_kls):
             internal hook func to get the packages metadata, consumer
             of :obj:`_get_attr`
             """
+            global metadata_loads
+            metadata_loads += 1
             return self._fetch_metadata()
         _get_attr["data"] = _get_data
 
@@ -1,7 +1,10 @@
 # Copyright: 2006-2008 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD
 
-__all__ = ("nodeps_repo", "caching_repo")
+__all__ = ("nodeps_repo", "caching_repo", "cache_stats")
+
+from collections import OrderedDict
+from itertools import islice
 
 from snakeoil.iterables import caching_iter, iter_sort
 from snakeoil.klass import GetAttrProxy
@@ -44,6 +47,32 @@ class nodeps_repo(object):
         return self.itermatch(packages.AlwaysTrue)
 
 
+class cache_stats(object):
+    """Hit rate and evictions of a :obj:`caching_repo`."""
+
+    __slots__ = ("hits", "misses", "evictions")
+
+    def __init__(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def __iadd__(self, other):
+        self.hits += other.hits
+        self.misses += other.misses
+        self.evictions += other.evictions
+        return self
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return 100.0 * self.hits / total
+
+    def __str__(self):
+        return "%i hits, %i misses (%.1f%% hit rate), %i evictions" % (
+            self.hits, self.misses, self.hit_rate, self.evictions)
+
+
 class caching_repo(object):
 
     """
@@ -60,30 +89,66 @@ class caching_repo(object):
     hold instance in memory to avoid redoing work.
 
     Cost of this of course is that involved objects are forced to stay
-    in memory till the cache is cleared.  General use, not usually what
-    you want- if you're making a lot of random queries that are duplicates
-    (resolver does this for example), caching helps.
+    in memory till the cache is cleared, unless the cache is bounded; then
+    the least recently used queries are dropped once it holds too many
+    queries or pkgs.  General use, not usually what you want- if you're
+    making a lot of random queries that are duplicates (resolver does this
+    for example), caching helps.
     """
 
     operations_kls = operations_proxy
 
-    def __init__(self, db, strategy):
+    def __init__(self, db, strategy, max_entries=None, max_pkgs=None,
+                 pinned=None):
         """
         :param db: an instance supporting the repository protocol to cache
           queries from.
         :param strategy: forced sorting strategy for results.  If you don't
           need sorting, pass in iter.
+        :param max_entries: if set, the most queries to cache.
+        :param max_pkgs: if set, the most pkgs to hold in cached results;
+          results are counted as far as they were consumed when last used.
+        :param pinned: if set, callable given a pkg returning True if it's
+          in use; queries with pinned pkgs in their results aren't evicted.
+
+        The limits have to be given up front; without them no recency
+        information is tracked.
         """
         self.__db__ = db
         self.__strategy__ = strategy
-        self.__cache__ = {}
+        self.__bounded__ = max_entries is not None or max_pkgs is not None
+        self.__cache__ = OrderedDict() if self.__bounded__ else {}
+        self.__sizes__ = {}
+        self.__pkgs__ = 0
+        self.max_entries = max_entries
+        self.max_pkgs = max_pkgs
+        self.pinned = pinned
+        self.stats = cache_stats()
 
     def match(self, restrict):
-        v = self.__cache__.get(restrict)
+        cache = self.__cache__
+        if not self.__bounded__:
+            v = cache.get(restrict)
+            if v is None:
+                self.stats.misses += 1
+                v = cache[restrict] = caching_iter(
+                    self.__db__.itermatch(restrict, sorter=self.__strategy__))
+            else:
+                self.stats.hits += 1
+            return v
+        v = cache.pop(restrict, None)
         if v is None:
-            v = self.__cache__[restrict] = \
+            self.stats.misses += 1
+            v = cache[restrict] = \
                 caching_iter(
                     self.__db__.itermatch(restrict, sorter=self.__strategy__))
+            self.__sizes__[restrict] = 0
+            self._evict()
+        else:
+            self.stats.hits += 1
+            # move it to the most recently used end
+            cache[restrict] = v
+            self._update_size(restrict, v)
         return v
 
     def itermatch(self, restrict):
@@ -91,8 +156,45 @@ class caching_repo(object):
 
     __getattr__ = GetAttrProxy("__db__")
 
+    def _update_size(self, restrict, v):
+        size = len(v.cached_list)
+        self.__pkgs__ += size - self.__sizes__[restrict]
+        self.__sizes__[restrict] = size
+
+    def _full(self, entries, pkgs):
+        return ((self.max_entries is not None and entries > self.max_entries) or
+                (self.max_pkgs is not None and pkgs > self.max_pkgs))
+
+    def _evict(self):
+        cache = self.__cache__
+        entries = len(cache)
+        victims, pinned = [], []
+        freed = 0
+        # oldest first; the newest entry is about to be used so it's left be
+        for restrict, v in islice(cache.iteritems(), entries - 1):
+            self._update_size(restrict, v)
+            if not self._full(entries, self.__pkgs__ - freed):
+                break
+            if self.pinned is not None and any(
+                    self.pinned(pkg) for pkg in v.cached_list):
+                pinned.append(restrict)
+                continue
+            victims.append(restrict)
+            entries -= 1
+            freed += self.__sizes__[restrict]
+        for restrict in victims:
+            del cache[restrict]
+            self.__pkgs__ -= self.__sizes__.pop(restrict)
+        self.stats.evictions += len(victims)
+        # pinned entries are treated as recently used, so they aren't
+        # rescanned on every eviction
+        for restrict in pinned:
+            cache[restrict] = cache.pop(restrict)
+
     def clear(self):
         self.__cache__.clear()
+        self.__sizes__.clear()
+        self.__pkgs__ = 0
 
 
 class multiplex_sorting_repo(object):
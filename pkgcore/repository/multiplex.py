@@ -5,9 +5,10 @@
 repository that combines multiple repositories together
 """
 
-__all__ = ("tree", "operations")
+__all__ = ("tree", "operations", "key_sorter")
 
 from functools import partial
+from heapq import heapify, heappop, heapreplace
 from itertools import chain
 from operator import itemgetter
 
@@ -63,6 +64,80 @@ class operations(repo_interface.operations_proxy):
         return ret
 
 
+def key_sorter(key=None, reverse=False):
+    """Create an itermatch sorter that declares the ordering it sorts by.
+
+    Sorting is equivalent to ``sorted(iterable, key=key, reverse=reverse)``;
+    multiplex trees merge the sorted streams of their repos by that ordering
+    instead of comparing packages pairwise through the sorter.
+    """
+    sorter = partial(sorted, key=key, reverse=reverse)
+    sorter.sort_key = key
+    sorter.sort_reverse = reverse
+    return sorter
+
+
+def _sorter_ordering(sorter):
+    """Return the (key, reverse) ordering a sorter sorts by, or None if unknown."""
+    if sorter is sorted:
+        return None, False
+    if hasattr(sorter, 'sort_key'):
+        return sorter.sort_key, getattr(sorter, 'sort_reverse', False)
+    if isinstance(sorter, partial) and sorter.func is sorted and \
+            not sorter.args and \
+            not frozenset(sorter.keywords or ()).difference(('key', 'reverse')):
+        kwds = sorter.keywords or {}
+        return kwds.get('key'), kwds.get('reverse', False)
+    return None
+
+
+class _ReversedKey(object):
+    """Inverts the ordering of the wrapped key."""
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return self.key != other.key
+
+
+def merge_sorted(iterables, key=None, reverse=False):
+    """Merge iterables each already sorted by the given ordering.
+
+    Items comparing equal are yielded in the order of their iterables.
+    """
+    heap = []
+    for i, iterable in enumerate(iterables):
+        iterable = iter(iterable)
+        for item in iterable:
+            k = item if key is None else key(item)
+            if reverse:
+                k = _ReversedKey(k)
+            heap.append([k, i, item, iterable])
+            break
+    heapify(heap)
+    while heap:
+        entry = heap[0]
+        yield entry[2]
+        for item in entry[3]:
+            k = item if key is None else key(item)
+            if reverse:
+                k = _ReversedKey(k)
+            entry[0], entry[2] = k, item
+            heapreplace(heap, entry)
+            break
+        else:
+            heappop(heap)
+
+
 @configurable({'repositories': 'refs:repo'}, typename='repo')
 def config_tree(repositories):
     return tree(*repositories)
@@ -190,6 +265,15 @@ class tree(prototype.tree):
             return (match for repo in self.trees
                     for match in repo.itermatch(restrict, **kwds))
 
+        ordering = None
+        if not kwds.get("yield_none"):
+            ordering = _sorter_ordering(sorter)
+        if ordering is not None:
+            # each repo's stream is sorted already; k-way merge them.
+            return merge_sorted(
+                [repo.itermatch(restrict, **kwds) for repo in self.trees],
+                *ordering)
+
         # ugly, and a bit slow, but works.
         def f(x, y):
             l = sorter([x, y])
@@ -6,11 +6,14 @@ base repository template
 """
 
 __all__ = (
-    "CategoryIterValLazyDict", "PackageMapping", "VersionMapping", "tree"
+    "CategoryIterValLazyDict", "PackageMapping", "VersionMapping", "NameIndex",
+    "tree"
 )
 
+from bisect import bisect_left
 import os
 
+from snakeoil import klass
 from snakeoil.compatibility import is_py3k
 from snakeoil.mappings import LazyValDict, DictMixin
 from snakeoil.sequences import iflatten_instance
@@ -119,6 +122,84 @@ class VersionMapping(DictMixin):
             self._cache.pop(key, None)
 
 
+def regex_prefix(regex):
+    """Return the literal prefix every match of an anchored regex starts with.
+
+    Only simple regexes are handled, anything with alternation yields an
+    empty prefix.
+    """
+    if '|' in regex:
+        return ''
+    i = 1 if regex.startswith('^') else 0
+    prefix = []
+    while i < len(regex):
+        c = regex[i]
+        if c not in '.^$*+?{}[]()\\':
+            i += 1
+        elif c == '\\' and i + 1 < len(regex) and not regex[i + 1].isalnum():
+            c = regex[i + 1]
+            i += 2
+        else:
+            break
+        if i < len(regex) and regex[i] in '*?{':
+            # optional, and ends the literal run.
+            break
+        prefix.append(c)
+    return ''.join(prefix)
+
+
+class NameIndex(object):
+    """Sorted index of category or package names.
+
+    Exact, prefix glob, and anchored regex restrictions are answered via
+    binary searches; anything else falls back to matching every name.
+    """
+
+    __slots__ = ('names',)
+
+    def __init__(self, names):
+        self.names = tuple(sorted(names))
+
+    def _prefixed(self, prefix):
+        names = self.names
+        i = bisect_left(names, prefix)
+        l = []
+        while i < len(names) and names[i].startswith(prefix):
+            l.append(names[i])
+            i += 1
+        return l
+
+    def match(self, restrict):
+        """Return the sorted list of names matching a values restriction."""
+        if not restrict.negate:
+            if isinstance(restrict, values.StrExactMatch):
+                if getattr(restrict, 'case_sensitive', False):
+                    i = bisect_left(self.names, restrict.exact)
+                    if i < len(self.names) and self.names[i] == restrict.exact:
+                        return [restrict.exact]
+                    return []
+            elif isinstance(restrict, values.StrGlobMatch):
+                if restrict.prefix and not restrict.flags:
+                    return self._prefixed(restrict.glob)
+            elif isinstance(restrict, values.StrRegex):
+                if restrict.ismatch and not restrict.flags:
+                    prefix = regex_prefix(restrict.regex)
+                    if prefix:
+                        return [x for x in self._prefixed(prefix)
+                                if restrict.match(x)]
+        return [x for x in self.names if restrict.match(x)]
+
+    def match_any(self, restricts):
+        """Return the sorted list of names matching any of the restrictions."""
+        restricts = list(restricts)
+        if len(restricts) == 1:
+            return self.match(restricts[0])
+        matches = set()
+        for restrict in restricts:
+            matches.update(self.match(restrict))
+        return sorted(matches)
+
+
 class tree(object):
     """Template for all repository variants.
 
@@ -361,7 +442,6 @@ class tree(object):
             s.difference_update(l)
             e.update(x.exact for x in l)
         del l
-
         if restrict.negate:
             cat_exact = pkg_exact = ()
 
@@ -376,7 +456,9 @@ class tree(object):
                     return []
                 cats_iter = [c]
             else:
-                cat_restrict.add(values.ContainmentMatch(*cat_exact))
+                # exact lookups via the name index; ContainmentMatch would
+                # do substring matching against each category.
+                cat_restrict.update(values.StrExactMatch(x) for x in cat_exact)
                 cats_iter = sorter(self._cat_filter(cat_restrict))
         elif cat_restrict:
             cats_iter = self._cat_filter(
@@ -394,7 +476,7 @@ class tree(object):
                     (c, p)
                     for c in cats_iter for p in pkg_exact)
             else:
-                pkg_restrict.add(values.ContainmentMatch(*pkg_exact))
+                pkg_restrict.update(values.StrExactMatch(x) for x in pkg_exact)
 
         if pkg_restrict:
             return self._package_filter(
@@ -410,23 +492,50 @@ class tree(object):
             (c, p)
             for c in cats_iter for p in sorter(self.packages.get(c, ())))
 
+    @klass.jit_attr
+    def _name_indexes(self):
+        # None -> category index, category -> package index
+        return {}
+
+    def _name_index(self, category=None):
+        """Return the :obj:`NameIndex` for the categories, or a category's
+        packages."""
+        index = self._name_indexes.get(category)
+        if index is None:
+            if category is None:
+                index = NameIndex(self.categories)
+            else:
+                index = NameIndex(self.packages.get(category, ()))
+            self._name_indexes[category] = index
+        return index
+
     def _cat_filter(self, cat_restricts, negate=False):
-        sentinel = not negate
+        if not negate:
+            for x in self._name_index().match_any(cat_restricts):
+                yield x
+            return
         cats = [x.match for x in cat_restricts]
         for x in self.categories:
             for match in cats:
-                if match(x) == sentinel:
+                if not match(x):
                     yield x
                     break
 
     def _package_filter(self, cats_iter, pkg_restricts, negate=False):
-        sentinel = not negate
-        restricts = [x.match for x in pkg_restricts]
         pkgs_dict = self.packages
+        if not negate:
+            pkg_restricts = list(pkg_restricts)
+            for cat in cats_iter:
+                if cat not in pkgs_dict:
+                    continue
+                for pkg in self._name_index(cat).match_any(pkg_restricts):
+                    yield (cat, pkg)
+            return
+        restricts = [x.match for x in pkg_restricts]
         for cat in cats_iter:
             for pkg in pkgs_dict.get(cat, ()):
                 for match in restricts:
-                    if match(pkg) == sentinel:
+                    if not match(pkg):
                         yield (cat, pkg)
                         break
 
@@ -437,6 +546,7 @@ class tree(object):
         notify the repository that a pkg it provides is being removed
         """
         ver_key = (pkg.category, pkg.package)
+        self._name_indexes.clear()
         l = [x for x in self.versions[ver_key] if x != pkg.fullver]
         if not l:
             # dead package
@@ -453,6 +563,7 @@ class tree(object):
         notify the repository that a pkg is being added to it
         """
         ver_key = (pkg.category, pkg.package)
+        self._name_indexes.clear()
         s = set(self.versions.get(ver_key, ()))
         s.add(pkg.fullver)
         if pkg.category not in self.categories:
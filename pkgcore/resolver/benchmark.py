@@ -0,0 +1,424 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+resolver benchmarking against synthetic and snapshotted repositories
+
+Repos are held in memory as md5-cache style metadata mappings of cpv to
+KEY=VALUE data, so the same scenarios can run against generated trees of a
+given size and dependency shape (:obj:`synthetic_metadata`), or a frozen
+copy of a real tree's md5-cache and vdb (:obj:`load_md5_cache`,
+:obj:`load_vdb`).  Every run gets fresh repos, so pkg metadata is parsed
+as part of each run just like it would be in pmerge.
+
+USE conditionals are collapsed against USE if the entry has it (vdb
+entries), IUSE defaults otherwise; no visibility filtering is done beyond
+dropping pkgs of unsupported EAPIs.
+
+Each scenario runs in a forked child by default, so its memory use can be
+measured in isolation: the reported peak rss is how far the child's rss grew
+over what it inherited.
+"""
+
+__all__ = (
+    "metadata_repo", "synthetic_metadata", "load_md5_cache", "load_vdb",
+    "installed_subset", "benchmark_result", "run_scenario", "run",
+    "compare", "scenarios",
+)
+
+import cPickle
+import errno
+from functools import partial
+import os
+import random
+import resource
+from time import time
+import traceback
+
+from snakeoil.osutils import listdir_dirs, listdir_files, pjoin
+
+from pkgcore.ebuild import ebuild_src, resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.cpv import CPV
+from pkgcore.ebuild.eapi import get_eapi
+from pkgcore.ebuild.errors import InvalidCPV
+from pkgcore.package import metadata
+from pkgcore.repository.util import SimpleTree
+
+# keys needed for resolution; everything else in a cache entry is dropped
+metadata_keys = frozenset([
+    "EAPI", "SLOT", "DEPEND", "RDEPEND", "PDEPEND", "IUSE", "USE", "KEYWORDS",
+])
+
+
+def _evaluated_depset(key, pkg):
+    return ebuild_src.generate_depset(atom, key, False, pkg).evaluate_depset(pkg.use)
+
+
+def _get_use(pkg):
+    use = pkg.data.pop("USE", None)
+    if use is not None:
+        return frozenset(use.split())
+    return frozenset(x[1:] for x in pkg.iuse if x[0] == '+')
+
+
+class package(ebuild_src.base):
+    """ebuild pkg with its metadata held in memory"""
+
+    __slots__ = ("use",)
+
+    _get_attr = dict(ebuild_src.base._get_attr)
+    _get_attr["eapi"] = lambda s: get_eapi(s.data.pop("EAPI", "0").strip() or "0")
+    _get_attr["use"] = _get_use
+    _get_attr["depends"] = partial(_evaluated_depset, "DEPEND")
+    _get_attr["rdepends"] = partial(_evaluated_depset, "RDEPEND")
+    _get_attr["post_rdepends"] = partial(_evaluated_depset, "PDEPEND")
+
+    def _fetch_metadata(self):
+        return self._parent._get_metadata(self)
+
+
+class built_package(package):
+
+    __slots__ = ()
+    built = True
+
+
+class _factory(metadata.factory):
+
+    def __init__(self, parent_repo, data, built=False):
+        metadata.factory.__init__(self, parent_repo)
+        self._data = data
+        if built:
+            self.child_class = built_package
+        else:
+            self.child_class = package
+
+    def _get_metadata(self, pkg):
+        return dict(self._data[pkg.cpvstr])
+
+
+class metadata_repo(SimpleTree):
+    """In-memory repo of pkgs generated from md5-cache style metadata.
+
+    :param data: mapping of cpv string to metadata mapping
+    :param livefs: vdb if True, in which case pkgs are built
+    """
+
+    def __init__(self, data, livefs=False, repo_id=None):
+        cpv_dict = {}
+        for cpvstr in data:
+            cpv = CPV(cpvstr, versioned=True)
+            cpv_dict.setdefault(cpv.category, {}).setdefault(
+                cpv.package, []).append(cpv.fullver)
+        self._factory = _factory(self, data, built=livefs)
+        SimpleTree.__init__(self, cpv_dict, pkg_klass=self._factory.new_package,
+                            livefs=livefs, repo_id=repo_id)
+
+
+def _version(i):
+    return "%i.%i" % (i // 10 + 1, i % 10)
+
+
+def synthetic_metadata(chains=10, depth=10, fanout=50, blockers=10,
+                       slot_conflicts=10, versions=2, installed=True):
+    """Generate metadata for a repo and vdb of the given dependency shapes.
+
+    Each shape is generated into its own category:
+
+    - bench-chain: chains of pkgs each depending on the next, depth long
+    - bench-fanout: a pkg depending on fanout pkgs, all sharing a library
+    - bench-blocker: pkgs blocking older versions of a pkg they replace
+    - bench-slot: consumers of a library available in two slots, one
+      preferring a version conflicting with the other's in the same slot
+
+    :param versions: versions available in the repo of each pkg
+    :param installed: if True, the lowest version of each pkg is installed
+    :return: repo metadata, vdb metadata, and atoms of every pkg generated
+    """
+    pkgs = {}
+
+    def add(cpvstr, **kwds):
+        data = {"EAPI": "5", "SLOT": "0"}
+        data.update(kwds)
+        pkgs[cpvstr] = data
+
+    def add_versions(key, **kwds):
+        for i in xrange(versions):
+            add("%s-%s" % (key, _version(i)), **kwds)
+
+    for c in xrange(chains):
+        for d in xrange(depth):
+            deps = ""
+            if d + 1 < depth:
+                deps = ">=bench-chain/chain%i_%i-1.0" % (c, d + 1)
+            add_versions("bench-chain/chain%i_%i" % (c, d), DEPEND=deps, RDEPEND=deps)
+
+    if fanout:
+        add_versions("bench-fanout/lib")
+        for i in xrange(fanout):
+            add_versions("bench-fanout/leaf%i" % (i,), RDEPEND="bench-fanout/lib",
+                         IUSE="+lib", DEPEND="lib? ( bench-fanout/lib )")
+        add_versions("bench-fanout/root", RDEPEND=" ".join(
+            "bench-fanout/leaf%i" % (i,) for i in xrange(fanout)))
+
+    for i in xrange(blockers):
+        add_versions("bench-blocker/old%i" % (i,))
+        # the new pkg takes over from every version of the old one but the last
+        add_versions("bench-blocker/new%i" % (i,), RDEPEND="!<bench-blocker/old%i-%s" % (
+            i, _version(versions - 1)))
+
+    for i in xrange(slot_conflicts):
+        lib = "bench-slot/lib%i" % (i,)
+        for slot in ("1", "2"):
+            for v in xrange(versions + 1):
+                add("%s-%s.%i" % (lib, slot, v), SLOT=slot)
+        # a pulls in the highest version of slot 1, so b's preferred choice
+        # of an older one conflicts and it has to fall back to slot 2
+        add_versions("bench-slot/a%i" % (i,), RDEPEND=">=%s-1.0:1" % (lib,))
+        add_versions("bench-slot/b%i" % (i,), RDEPEND="|| ( <%s-1.%i:1 >=%s-2.0:2 )" % (
+            lib, versions, lib))
+        add_versions("bench-slot/top%i" % (i,), RDEPEND="bench-slot/a%i bench-slot/b%i" % (i, i))
+
+    vdb = installed_subset(pkgs) if installed else {}
+    for v in vdb.itervalues():
+        v["USE"] = " ".join(x[1:] for x in v.get("IUSE", "").split() if x[0] == '+')
+    targets = sorted(set(CPV(x, versioned=True).key for x in pkgs))
+    return pkgs, vdb, [atom(x) for x in targets]
+
+
+def installed_subset(data, fraction=1.0, seed=0):
+    """Return the metadata of the lowest version of a subset of the pkgs.
+
+    :param fraction: portion of the pkgs to pick
+    :param seed: seed for picking the same subset across runs
+    """
+    lowest = {}
+    for cpvstr in data:
+        cpv = CPV(cpvstr, versioned=True)
+        cur = lowest.get(cpv.key)
+        if cur is None or cpv < cur:
+            lowest[cpv.key] = cpv
+    keys = sorted(lowest)
+    if fraction < 1.0:
+        keys = sorted(random.Random(seed).sample(keys, int(len(keys) * fraction)))
+    return {lowest[k].cpvstr: dict(data[lowest[k].cpvstr]) for k in keys}
+
+
+def _keep_supported(data):
+    for cpvstr, d in data.items():
+        if not get_eapi(d.get("EAPI", "0").strip() or "0").is_supported:
+            del data[cpvstr]
+    return data
+
+
+def _iter_pkg_entries(location):
+    for category in listdir_dirs(location):
+        for entry in os.listdir(pjoin(location, category)):
+            cpvstr = "%s/%s" % (category, entry)
+            try:
+                CPV(cpvstr, versioned=True)
+            except InvalidCPV:
+                continue
+            yield cpvstr, pjoin(location, category, entry)
+
+
+def load_md5_cache(location):
+    """Load the metadata of an md5-cache snapshot.
+
+    :param location: either the repo the md5-cache belongs to, or the
+        md5-cache dir itself
+    :return: mapping of cpv string to metadata, pkgs of unsupported
+        EAPIs dropped
+    """
+    cache = pjoin(location, "metadata", "md5-cache")
+    if os.path.isdir(cache):
+        location = cache
+    data = {}
+    for cpvstr, path in _iter_pkg_entries(location):
+        with open(path) as f:
+            d = {}
+            for line in f:
+                k, _, v = line.rstrip("\n").partition("=")
+                if k in metadata_keys:
+                    d[k] = v
+        data[cpvstr] = d
+    return _keep_supported(data)
+
+
+def load_vdb(location):
+    """Load the metadata of a vdb snapshot, e.g. a copy of /var/db/pkg.
+
+    :return: mapping of cpv string to metadata
+    """
+    data = {}
+    for cpvstr, path in _iter_pkg_entries(location):
+        d = {}
+        for key in metadata_keys.intersection(listdir_files(path)):
+            try:
+                with open(pjoin(path, key)) as f:
+                    d[key] = ' '.join(f.read().split())
+            except EnvironmentError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        data[cpvstr] = d
+    return _keep_supported(data)
+
+
+class benchmark_result(object):
+    """Outcome of resolving a scenario, averaged over the runs."""
+
+    __slots__ = ("name", "runs", "time", "best", "ops", "failed",
+                 "metadata_loads", "queries", "peak_rss")
+
+    fields = __slots__
+
+    def __init__(self, name, runs, times, ops, failed, metadata_loads,
+                 queries, peak_rss):
+        self.name = name
+        self.runs = runs
+        self.time = sum(times) / len(times)
+        self.best = min(times)
+        self.ops = ops
+        self.failed = failed
+        self.metadata_loads = metadata_loads
+        self.queries = queries
+        # KiB the rss grew by while resolving
+        self.peak_rss = peak_rss
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.fields}
+
+    def __str__(self):
+        s = "%s: %.3fs (best %.3fs of %i), %i ops, %i queries, " \
+            "%i metadata loads, %i KiB peak rss growth" % (
+                self.name, self.time, self.best, self.runs, self.ops,
+                self.queries, self.metadata_loads, self.peak_rss)
+        if self.failed:
+            s += ", failed"
+        return s
+
+
+def _min_install(vdbs, dbs, **kwds):
+    return resolver.min_install_resolver(vdbs, dbs, **kwds)
+
+
+def _upgrade(vdbs, dbs, **kwds):
+    return resolver.upgrade_resolver(vdbs, dbs, **kwds)
+
+
+# name: (resolver factory, whether the vdb is used)
+scenarios = {
+    "upgrade": (_upgrade, True),
+    "min-install": (_min_install, True),
+    "fresh-install": (_min_install, False),
+}
+
+
+def _maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _resolve(name, repo_data, vdb_data, atoms, runs, kwds):
+    """Run a scenario, returning the args of its :obj:`benchmark_result`."""
+    factory, use_vdb = scenarios[name]
+    if not use_vdb:
+        vdb_data = {}
+    base_rss = _maxrss()
+    times = []
+    for _ in xrange(runs):
+        repo = metadata_repo(repo_data, repo_id="bench")
+        vdb = metadata_repo(vdb_data, livefs=True, repo_id="vdb")
+        loads = metadata.metadata_loads
+        start = time()
+        resolver_inst = factory([vdb], [repo], **kwds)
+        ret = resolver_inst.add_atoms(atoms, finalize=True)
+        times.append(time() - start)
+        loads = metadata.metadata_loads - loads
+    return (name, runs, times, len(list(resolver_inst.state.iter_ops())),
+            bool(ret), loads, resolver_inst.query_cache_stats.misses,
+            _maxrss() - base_rss)
+
+
+def _resolve_in_child(*args):
+    """Run :obj:`_resolve` in a forked child, returning its result."""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if not pid:
+        try:
+            os.close(rfd)
+            try:
+                data = (True, _resolve(*args))
+            except Exception:
+                data = (False, traceback.format_exc())
+            with os.fdopen(wfd, 'wb') as f:
+                cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    try:
+        with os.fdopen(rfd, 'rb') as f:
+            data = f.read()
+    finally:
+        status = os.waitpid(pid, 0)[1]
+    if not data:
+        raise RuntimeError(
+            "benchmark child died without a result, status %i" % (status,))
+    success, data = cPickle.loads(data)
+    if not success:
+        raise RuntimeError("benchmark child failed:\n%s" % (data,))
+    return data
+
+
+def run_scenario(name, repo_data, vdb_data, atoms, runs=1, fork=True, **kwds):
+    """Resolve atoms in a scenario, runs times over fresh repos.
+
+    :param name: key of :obj:`scenarios`
+    :param fork: if True, resolve in a child process so the memory use of
+        the scenario isn't affected by earlier ones
+    :param kwds: passed to the resolver
+    :return: :obj:`benchmark_result` instance
+    """
+    args = (name, repo_data, vdb_data, atoms, runs, kwds)
+    if fork:
+        return benchmark_result(*_resolve_in_child(*args))
+    return benchmark_result(*_resolve(*args))
+
+
+def run(repo_data, vdb_data, atoms, names=None, runs=1, **kwds):
+    """Run scenarios, yielding a :obj:`benchmark_result` for each.
+
+    :param names: scenarios to run, defaulting to all of them
+    :param kwds: passed to :obj:`run_scenario`
+    """
+    if names is None:
+        names = sorted(scenarios)
+    for name in names:
+        yield run_scenario(name, repo_data, vdb_data, atoms, runs=runs, **kwds)
+
+
+def compare(baseline, results, tolerance=0.2, rss_slack=1024):
+    """Yield the regressions of results against a baseline.
+
+    Both the best time and the peak rss growth are checked; baselines
+    lacking the latter only have their time checked.
+
+    :param baseline: mapping of scenario name to the :obj:`benchmark_result`
+        dict of a previous run
+    :param tolerance: fraction of slowdown or memory growth allowed before
+        a regression
+    :param rss_slack: KiB of memory growth always allowed, as the rss of
+        small scenarios is mostly noise
+    :return: tuples of result, the regressed field ("best" or "peak_rss"),
+        and the baseline value it regressed from
+    """
+    for result in results:
+        old = baseline.get(result.name)
+        if old is None:
+            continue
+        if result.best > old["best"] * (1 + tolerance):
+            yield result, "best", old["best"]
+        old_rss = old.get("peak_rss")
+        if (old_rss is not None and
+                result.peak_rss > old_rss * (1 + tolerance) + rss_slack):
+            yield result, "peak_rss", old_rss
@@ -3,19 +3,34 @@
 
 __all__ = ("PigeonHoledSlots",)
 
+from collections import OrderedDict
+
+from pkgcore.ebuild.atom import atom as atom_kls
 from pkgcore.restrictions import restriction
 
 # lil too getter/setter like for my tastes...
 
 
+def _limiter_slot(atom):
+    """Slot a limiter is confined to, or None if it can match any slot."""
+    if isinstance(atom, atom_kls):
+        return atom.slot
+    return None
+
+
 class PigeonHoledSlots(object):
     """class for tracking slotting to a specific atom/obj key
     no atoms present, just prevents conflicts of obj.key; atom present, assumes
     it's a blocker and ensures no obj matches the atom for that key
+
+    objs are indexed by key and by (key, slot), limiters by key and the slot
+    they're confined to, if any; each index maps id(x) to x in insertion
+    order so removal while backtracking doesn't rebuild anything.
     """
 
     def __init__(self):
         self.slot_dict = {}
+        self.slots = {}
         self.limiters = {}
 
     def fill_slotting(self, obj, force=False):
@@ -28,22 +43,35 @@ class PigeonHoledSlots(object):
 
         key = obj.key
         dslot = obj.slot
-        l.extend(x for x in self.slot_dict.get(key, ()) if x.slot == dslot)
+        l.extend(self.slots.get((key, dslot), {}).itervalues())
 
         if not l or force:
-            self.slot_dict.setdefault(key, []).append(obj)
+            d = self.slot_dict.get(key)
+            if d is None:
+                d = self.slot_dict[key] = OrderedDict()
+            d[id(obj)] = obj
+            d = self.slots.get((key, dslot))
+            if d is None:
+                d = self.slots[(key, dslot)] = OrderedDict()
+            d[id(obj)] = obj
         return l
 
     def get_conflicting_slot(self, pkg):
-        for x in self.slot_dict.get(pkg.key, ()):
-            if pkg.slot == x.slot:
-                return x
+        for x in self.slots.get((pkg.key, pkg.slot), {}).itervalues():
+            return x
         return None
 
     def find_atom_matches(self, atom, key=None):
         if key is None:
             key = atom.key
-        return filter(atom.match, self.slot_dict.get(key, ()))
+        slot = _limiter_slot(atom)
+        if slot is None:
+            d = self.slot_dict.get(key)
+        else:
+            d = self.slots.get((key, slot))
+        if not d:
+            return []
+        return filter(atom.match, d.itervalues())
 
     def add_limiter(self, atom, key=None):
         """add a limiter, returning any conflicting objs"""
@@ -54,37 +82,56 @@ class PigeonHoledSlots(object):
 
         if key is None:
             key = atom.key
-        self.limiters.setdefault(key, []).append(atom)
+        buckets = self.limiters.get(key)
+        if buckets is None:
+            buckets = self.limiters[key] = {}
+        slot = _limiter_slot(atom)
+        d = buckets.get(slot)
+        if d is None:
+            d = buckets[slot] = OrderedDict()
+        d[id(atom)] = atom
         return self.find_atom_matches(atom, key=key)
 
     def check_limiters(self, obj):
         """return any limiters conflicting w/ the passed in obj"""
-        key = obj.key
-        return [x for x in self.limiters.get(key, ()) if x.match(obj)]
+        buckets = self.limiters.get(obj.key)
+        if not buckets:
+            return []
+        l = [x for x in buckets.get(None, {}).itervalues() if x.match(obj)]
+        if obj.slot is not None:
+            l.extend(x for x in buckets.get(obj.slot, {}).itervalues()
+                     if x.match(obj))
+        return l
 
     def remove_slotting(self, obj):
         key = obj.key
         # let the key error be thrown if they screwed up.
-        l = [x for x in self.slot_dict[key] if x is not obj]
-        if len(l) == len(self.slot_dict[key]):
+        d = self.slot_dict[key]
+        if d.pop(id(obj), None) is None:
             raise KeyError("obj %s isn't slotted" % obj)
-        if l:
-            self.slot_dict[key] = l
-        else:
+        if not d:
             del self.slot_dict[key]
+        slot_key = (key, obj.slot)
+        d = self.slots[slot_key]
+        del d[id(obj)]
+        if not d:
+            del self.slots[slot_key]
 
     def remove_limiter(self, atom, key=None):
         if key is None:
             key = atom.key
-        l = [x for x in self.limiters[key] if x is not atom]
-        if len(l) == len(self.limiters[key]):
+        buckets = self.limiters[key]
+        slot = _limiter_slot(atom)
+        d = buckets.get(slot, {})
+        if d.pop(id(atom), None) is None:
             raise KeyError("obj %s isn't slotted" % atom)
-        if not l:
-            del self.limiters[key]
-        else:
-            self.limiters[key] = l
+        if not d:
+            del buckets[slot]
+            if not buckets:
+                del self.limiters[key]
 
     def __contains__(self, obj):
         if isinstance(obj, restriction.base):
-            return obj in self.limiters.get(obj.key, ())
-        return obj in self.slot_dict.get(obj.key, ())
+            d = self.limiters.get(obj.key, {}).get(_limiter_slot(obj), {})
+            return obj in d.itervalues()
+        return obj in self.slot_dict.get(obj.key, {}).itervalues()
@@ -9,16 +9,22 @@ import operator
 from itertools import chain, islice, ifilterfalse as filterfalse
 import sys
 
-from snakeoil.compatibility import cmp, sort_cmp
+from snakeoil.compatibility import IGNORED_EXCEPTIONS
+from snakeoil.demandload import demandload
 from snakeoil.iterables import caching_iter
 
 # XXX: hack; see insert_blockers
 from pkgcore.ebuild import atom as _atom
+from pkgcore.ebuild.cpv import cpv_sorter, sort_key
 from pkgcore.repository import misc, multiplex, visibility
 from pkgcore.resolver import state
 from pkgcore.resolver.choice_point import choice_point
 from pkgcore.restrictions import packages, values, restriction
 
+demandload(
+    'pkgcore.util.thread_pool:map_async',
+)
+
 limiters = set(["cycle"])
 
 
@@ -31,8 +37,8 @@ def dprint(handle, fmt, args=None, label=None):
 
 
 # iter/pkg sorting functions for selection strategy
-pkg_sort_highest = partial(sorted, reverse=True)
-pkg_sort_lowest = sorted
+pkg_sort_highest = cpv_sorter(reverse=True)
+pkg_sort_lowest = cpv_sorter()
 
 pkg_grabber = operator.itemgetter(0)
 
@@ -44,18 +50,10 @@ def highest_iter_sort(l, pkg_grabber=pkg_grabber):
     :param pkg_grabber: function to use as an attrgetter
     :return: sorted list of packages
     """
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return 1
-        elif y.repo.livefs:
-            return -1
-        return 0
-    sort_cmp(l, f, key=pkg_grabber, reverse=True)
+    def f(x):
+        pkg = pkg_grabber(x)
+        return sort_key(pkg), bool(getattr(pkg.repo, 'livefs', False))
+    l.sort(key=f, reverse=True)
     return l
 
 
@@ -66,18 +64,10 @@ def lowest_iter_sort(l, pkg_grabber=pkg_grabber):
     :param pkg_grabber: function to use as an attrgetter
     :return: sorted list of packages
     """
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return -1
-        elif y.repo.livefs:
-            return 1
-        return 0
-    sort_cmp(l, f, key=pkg_grabber)
+    def f(x):
+        pkg = pkg_grabber(x)
+        return sort_key(pkg), not getattr(pkg.repo, 'livefs', False)
+    l.sort(key=f)
     return l
 
 
@@ -91,11 +81,43 @@ class MutableContainmentRestriction(values.base):
         sf(self, 'match', self._blacklist.__contains__)
 
 
+def _preload_pkg_attrs(queue, attrs):
+    for pkg in queue:
+        for attr in attrs:
+            try:
+                getattr(pkg, attr)
+            except IGNORED_EXCEPTIONS:
+                raise
+            except Exception:
+                # it fails again when inserted, reporting it properly
+                pass
+
+
+class solution_cache_stats(object):
+    """Hit rate of the resolver's cache of failed resolutions."""
+
+    __slots__ = ("hits", "misses", "stored")
+
+    def __init__(self):
+        self.hits = self.misses = self.stored = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return 100.0 * self.hits / total
+
+    def __str__(self):
+        return "%i hits, %i misses (%.1f%% hit rate), %i failures cached" % (
+            self.hits, self.misses, self.hit_rate, self.stored)
+
+
 class resolver_frame(object):
 
     __slots__ = ("parent", "atom", "choices", "mode", "start_point", "dbs",
         "depth", "drop_cycles", "__weakref__", "ignored", "vdb_limited",
-        "events", "succeeded")
+        "events", "succeeded", "cycle_slots", "stack_dependent")
 
     def __init__(self, parent, mode, atom, choices, dbs, start_point, depth,
                  drop_cycles, ignored=False, vdb_limited=False):
@@ -112,6 +134,10 @@ class resolver_frame(object):
         self.vdb_limited = vdb_limited
         self.events = []
         self.succeeded = None
+        # (key, slot) pairs checked for cycles within this frame's subtree,
+        # and whether a cycle was found with a frame outside of it.
+        self.cycle_slots = set()
+        self.stack_dependent = False
 
     def reduce_solutions(self, nodes):
         if isinstance(nodes, (list, tuple)):
@@ -191,6 +217,8 @@ class resolver_stack(deque):
         frame = self.pop()
         frame.succeeded = bool(result)
         frame.parent.events.append(frame)
+        if self:
+            self[-1].cycle_slots.update(frame.cycle_slots)
 
     def slot_cycles(self, trg_frame, **kwds):
         pkg = trg_frame.current_pkg
@@ -231,7 +259,8 @@ class merge_plan(object):
                  global_strategy=None,
                  depset_reorder_strategy=None,
                  process_built_depends=False,
-                 drop_cycles=False, debug=False, debug_handle=None):
+                 drop_cycles=False, debug=False, debug_handle=None,
+                 max_cached_queries=None, max_cached_pkgs=None, profile=None):
 
         if debug_handle is None:
             debug_handle = sys.stdout
@@ -252,7 +281,12 @@ class merge_plan(object):
         self.depset_reorder = depset_reorder_strategy
         self.per_repo_strategy = per_repo_strategy
         self.total_ordering_strategy = global_strategy
-        self.all_raw_dbs = [misc.caching_repo(x, self.per_repo_strategy) for x in dbs]
+        # queries returning pkgs the plan holds are kept cached
+        self.all_raw_dbs = [
+            misc.caching_repo(
+                x, self.per_repo_strategy, max_entries=max_cached_queries,
+                max_pkgs=max_cached_pkgs, pinned=self._pkg_in_plan)
+            for x in dbs]
         self.all_dbs = global_strategy(self.all_raw_dbs)
         self.default_dbs = self.all_dbs
 
@@ -263,6 +297,9 @@ class merge_plan(object):
                 for x in self.all_raw_dbs if x.livefs])
 
         self.insoluble = set()
+        # failed resolutions, see _rec_add_atom
+        self.solution_cache = {}
+        self.solution_cache_stats = solution_cache_stats()
         self.vdb_preloaded = False
         self._ensure_livefs_is_loaded = \
             self._ensure_livefs_is_loaded_nonpreloaded
@@ -274,11 +311,29 @@ class merge_plan(object):
                 self._rec_add_atom)
             self._debugging_depth = 0
             self._debugging_drop_cycles = False
+        self._profile = profile
+        if profile is not None:
+            self._rec_add_atom = partial(self._profiling_rec_add_atom,
+                self._rec_add_atom)
+            self.notify_trying_choice = partial(self._profiling_notify,
+                profile.choice, self.notify_trying_choice)
+            self.state.backtrack = partial(self._profiling_backtrack,
+                self.state.backtrack)
 
     @property
     def forced_restrictions(self):
         return frozenset(self.state.forced_restrictions)
 
+    @property
+    def query_cache_stats(self):
+        stats = misc.cache_stats()
+        for repo in self.all_raw_dbs:
+            stats += repo.stats
+        return stats
+
+    def _pkg_in_plan(self, pkg):
+        return pkg in self.state.pkg_choices
+
     def reset(self, point=0):
         self.state.backtrack(point)
 
@@ -321,8 +376,23 @@ class merge_plan(object):
         self._dprint("%s%s%s%s%s", (t_viable.ljust(13), "  "*stack.depth, atom, s, t_msg))
         stack.add_event(("viable", viable, pre_solved, atom, msg))
 
-    def load_vdb_state(self):
-        for pkg in self.livefs_dbs:
+    def load_vdb_state(self, threads=None):
+        """Insert every installed pkg into the plan state.
+
+        The metadata the resolver needs is pulled for all pkgs up front by a
+        pool of threads, overlapping the vdb reads; inserting them into the
+        plan is then done in a single serial pass.
+
+        :param threads: number of threads pulling metadata, defaults to the
+            number of cpus; 1 pulls it serially as pkgs are inserted
+        """
+        # holding the pkgs keeps the repos' instance caches, and the metadata
+        # loaded into them, alive until they're inserted
+        pkgs = list(self.livefs_dbs)
+        if threads != 1:
+            map_async(pkgs, _preload_pkg_attrs, self._vdb_preload_attrs,
+                      threads=threads)
+        for pkg in pkgs:
             self._dprint("inserting %s", (pkg,), "vdb")
             ret = self.add_atom(pkg.versioned_atom)
             self._dprint("insertion of %s: %s", (pkg, ret), "vdb")
@@ -334,6 +404,9 @@ class merge_plan(object):
         self._ensure_livefs_is_loaded = \
             self._ensure_livefs_is_loaded_preloaded
 
+    # pkg attributes the resolver pulls while inserting installed pkgs
+    _vdb_preload_attrs = ("slot", "depends", "rdepends", "post_rdepends")
+
     def add_atoms(self, restricts, finalize=False):
         if restricts:
             stack = resolver_stack()
@@ -387,12 +460,63 @@ class merge_plan(object):
             self._debugging_drop_cycles = False
         return ret
 
+    def _profiling_rec_add_atom(self, func, atom, stack, dbs, **kwds):
+        self._profile.enter(atom, self.query_cache_stats.misses)
+        try:
+            return func(atom, stack, dbs, **kwds)
+        finally:
+            self._profile.exit(self.query_cache_stats.misses)
+
+    @staticmethod
+    def _profiling_notify(note, func, *args, **kwds):
+        note()
+        return func(*args, **kwds)
+
+    def _profiling_backtrack(self, func, state_pos):
+        self._profile.backtrack(len(self.state.plan) - state_pos)
+        return func(state_pos)
+
     def _rec_add_atom(self, atom, stack, dbs, mode="none", drop_cycles=False):
         """Add an atom.
 
+        Failures are cached: resolving the same atom again against the same
+        plan state fails the same way, as long as none of the frames on the
+        stack are for a slot the failed resolution checked for cycles.
+
         :return: False on no issues (inserted succesfully),
             else a list of the stack that screwed it up.
         """
+        if not stack:
+            return self._resolve_atom(atom, stack, dbs, mode, drop_cycles)
+
+        key = (atom, mode, dbs, drop_cycles, self.state.fingerprint)
+        cached = self.solution_cache.get(key)
+        if cached is not None:
+            frame, failure = cached
+            if not any(self._frame_slot(f) in frame.cycle_slots for f in stack):
+                self.solution_cache_stats.hits += 1
+                self._dprint("cached fail  %s%s", (stack.depth*2*" ", atom))
+                stack[-1].cycle_slots.update(frame.cycle_slots)
+                stack.add_event(frame)
+                return list(failure)
+
+        self.solution_cache_stats.misses += 1
+        ret = self._resolve_atom(atom, stack, dbs, mode, drop_cycles)
+        if ret:
+            frame = stack[-1].events[-1]
+            if not frame.stack_dependent:
+                self.solution_cache[key] = (frame, tuple(ret))
+                self.solution_cache_stats.stored += 1
+        return ret
+
+    @staticmethod
+    def _frame_slot(frame):
+        pkg = frame.current_pkg
+        if pkg is None:
+            return None
+        return pkg.key, pkg.slot
+
+    def _resolve_atom(self, atom, stack, dbs, mode, drop_cycles):
         assert hasattr(dbs, 'itermatch')
         limit_to_vdb = dbs == self.livefs_dbs
 
@@ -565,7 +689,12 @@ class merge_plan(object):
             value to return after collapsing the calling frame
         """
         force_vdb = False
+        cur_frame.cycle_slots.add(self._frame_slot(cur_frame))
         for frame in stack.slot_cycles(cur_frame, reverse=True):
+            # the outcome now depends on a frame outside the subtrees of
+            # those above it, so their failures can't be reused elsewhere.
+            for f in islice(stack, stack.index(frame) + 1, None):
+                f.stack_dependent = True
             if not any(f.mode == 'post_rdepends' for f in
                 islice(stack, stack.index(frame), stack.index(cur_frame))):
                 # exact same pkg.
@@ -790,6 +919,7 @@ class merge_plan(object):
     def free_caches(self):
         for repo in self.all_raw_dbs:
             repo.clear()
+        self.solution_cache.clear()
 
     # selection strategies for atom matches
 
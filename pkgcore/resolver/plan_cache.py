@@ -0,0 +1,230 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+persistent cache of resolved plans
+
+Resolving the same targets against an unchanged system gives the same plan,
+so the ops of a resolved plan are stored keyed by a fingerprint of what went
+into resolving it: the targets and resolver options, the domain's settings
+and user config files, the profile, and the state of the repos.  Repo state
+is taken from the mtimes and sizes of the entries in the top two levels of
+each repo (categories and package dirs for ebuild repos and the vdb,
+binpkgs), so syncing, adding or removing ebuilds, and (un)merging all
+invalidate it; editing an ebuild in place without touching its dir doesn't.
+"""
+
+__all__ = ("PlanCache", "fingerprint")
+
+import errno
+from hashlib import sha1
+import os
+
+from snakeoil.demandload import demandload
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import ensure_dirs, listdir, pjoin
+
+from pkgcore.resolver import state
+
+demandload(
+    'pkgcore.ebuild.atom:atom',
+    'pkgcore.log:logger',
+)
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except EnvironmentError as e:
+        if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+            raise
+        return None
+    return st.st_mtime, st.st_size
+
+
+def _tree_state(location, depth=2):
+    """Yield (path, mtime, size) for each entry up to depth levels down."""
+    yield location, _stat_key(location)
+    if not depth:
+        return
+    try:
+        names = sorted(listdir(location))
+    except EnvironmentError as e:
+        if e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+            raise
+        return
+    for name in names:
+        if name.startswith('.'):
+            continue
+        for x in _tree_state(pjoin(location, name), depth - 1):
+            yield x
+
+
+def _normalize(value):
+    """Convert a value to one with a stable repr."""
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_normalize(x) for x in value))
+    elif isinstance(value, (list, tuple)):
+        return tuple(_normalize(x) for x in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.iteritems()))
+    elif isinstance(value, type) or callable(value) and hasattr(value, '__name__'):
+        # classes and functions repr with their address
+        return '%s.%s' % (getattr(value, '__module__', None), value.__name__)
+    return value
+
+
+def _repo_locations(repo):
+    """Yield the on disk locations of a repo, descending into multiplexed ones."""
+    trees = getattr(repo, 'trees', None)
+    if trees is not None:
+        for tree in trees:
+            for x in _repo_locations(tree):
+                yield x
+        return
+    location = getattr(repo, 'location', None)
+    if isinstance(location, basestring):
+        yield location
+
+
+def fingerprint(domain, repos, atoms, options=()):
+    """Fingerprint what resolving a plan depends on.
+
+    :param domain: :obj:`pkgcore.ebuild.domain.domain` instance
+    :param repos: repos the resolver uses, source and installed
+    :param atoms: target atoms
+    :param options: anything else affecting resolution, e.g. resolver
+        options; sets, mappings, classes and functions are normalized,
+        anything else must have a stable repr
+    :return: hex digest
+    """
+    chf = sha1()
+    update = lambda x: chf.update(repr(x) + '\n')
+    update((PlanCache.magic, PlanCache.version))
+    update(_normalize(tuple(options)))
+    update(tuple(str(x) for x in atoms))
+    update(sorted((k, _normalize(v)) for k, v in domain.settings.iteritems()))
+    for path in getattr(domain, 'config_files', ()):
+        update((path, _stat_key(path)))
+    for node in domain.profile.stack:
+        for x in _tree_state(node.path, depth=1):
+            update(x)
+    for repo in repos:
+        update(getattr(repo, 'repo_id', None))
+        for location in _repo_locations(repo):
+            for x in _tree_state(location):
+                update(x)
+    return chf.hexdigest()
+
+
+class PlanCache(object):
+    """On disk cache of the ops of resolved plans.
+
+    :param location: directory plans are stored in
+    """
+
+    magic = 'pkgcore-plan'
+    version = 1
+    # plans kept around; older ones are pruned when storing a new one
+    max_plans = 10
+
+    def __init__(self, location):
+        self.location = location
+
+    def _path(self, key):
+        return pjoin(self.location, key)
+
+    def get(self, key, repos):
+        """Load a cached plan.
+
+        :param key: fingerprint of the plan
+        :param repos: repos to look the plan's pkgs up in
+        :return: :obj:`pkgcore.resolver.state.ops_sequence` instance, or
+            None if there's no usable cached plan
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                if f.readline().split() != [self.magic, str(self.version)]:
+                    return None
+                lines = [x.rstrip('\n').split('\t') for x in f]
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("failed reading cached plan %r: %s", path, e)
+            return None
+
+        repos = {repo.repo_id: repo for repo in repos}
+
+        def get_pkg(cpv, repo_id):
+            repo = repos.get(repo_id)
+            if repo is None:
+                return None
+            for pkg in repo.itermatch(atom('=%s' % (cpv,))):
+                if pkg.cpvstr == cpv:
+                    return pkg
+            return None
+
+        ops = []
+        try:
+            for l in lines:
+                desc, pkg = l[0], get_pkg(*l[1:3])
+                if pkg is None:
+                    return None
+                if desc == 'add':
+                    op = state.add_op(None, pkg)
+                elif desc == 'remove':
+                    op = state.remove_op(None, pkg)
+                elif desc == 'replace':
+                    op = state.replace_op(None, pkg)
+                    op.old_pkg = get_pkg(*l[3:5])
+                    if op.old_pkg is None:
+                        return None
+                else:
+                    raise ValueError("unknown op %r" % (desc,))
+                ops.append(op)
+        except (TypeError, ValueError) as e:
+            logger.warning("ignoring invalid cached plan %r: %s", path, e)
+            return None
+        # keep recently used plans from being pruned
+        try:
+            os.utime(path, None)
+        except EnvironmentError:
+            pass
+        return state.ops_sequence(ops)
+
+    def store(self, key, ops):
+        """Store the ops of a plan, returning False if that wasn't possible."""
+        try:
+            if not ensure_dirs(self.location, mode=0755):
+                return False
+            f = AtomicWriteFile(self._path(key))
+        except EnvironmentError as e:
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+                logger.warning("failed writing cached plan: %s", e)
+            return False
+        try:
+            f.write('%s %i\n' % (self.magic, self.version))
+            for op in ops:
+                l = [op.desc, op.pkg.cpvstr, op.pkg.repo.repo_id]
+                if op.desc == 'replace':
+                    l.extend((op.old_pkg.cpvstr, op.old_pkg.repo.repo_id))
+                f.write('\t'.join(l) + '\n')
+        except:
+            f.discard()
+            raise
+        f.close()
+        self._prune()
+        return True
+
+    def _prune(self):
+        try:
+            plans = [(os.stat(pjoin(self.location, x)).st_mtime, x)
+                     for x in listdir(self.location) if not x.startswith('.')]
+        except EnvironmentError:
+            return
+        plans.sort(reverse=True)
+        for mtime, name in plans[self.max_plans:]:
+            try:
+                os.unlink(pjoin(self.location, name))
+            except EnvironmentError:
+                pass
@@ -0,0 +1,138 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+resolver profiling, recording where resolution spends its time
+
+Stats are kept per atom resolved, aggregated over every time it was
+resolved: wall time (inclusive of resolving its deps, and exclusive),
+choices tried, ops backtracked over, repo queries issued, and pkg metadata
+loads triggered.  Queries and metadata loads are exclusive, i.e. those
+issued while resolving the atom's deps are charged to the deps.
+"""
+
+__all__ = ("atom_stats", "resolver_profile")
+
+import json
+from time import time
+
+from pkgcore.package import metadata
+
+
+class atom_stats(object):
+    """Resolution stats of a single atom."""
+
+    __slots__ = ("atom", "calls", "time", "self_time", "choices",
+                 "backtracks", "queries", "metadata_loads")
+
+    fields = __slots__
+
+    def __init__(self, atom):
+        self.atom = atom
+        self.calls = self.choices = self.backtracks = 0
+        self.queries = self.metadata_loads = 0
+        self.time = self.self_time = 0.0
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.fields}
+
+
+class _frame(object):
+
+    __slots__ = ("stats", "start", "children", "recursive")
+
+    def __init__(self, stats, start, recursive):
+        self.stats = stats
+        self.start = start
+        self.children = [0.0, 0, 0]
+        self.recursive = recursive
+
+
+class resolver_profile(object):
+    """Collect resolution stats from a :obj:`pkgcore.resolver.plan.merge_plan`.
+
+    Pass it as the profile argument of the resolver; afterwards
+    :obj:`write` dumps the stats as JSON and :obj:`summary` the atoms
+    taking the most time.
+
+    :param clock: callable returning the current time
+    """
+
+    def __init__(self, clock=time):
+        self.clock = clock
+        self.atoms = {}
+        self.total_time = 0.0
+        self._stack = []
+
+    def _counters(self, queries):
+        return self.clock(), queries, metadata.metadata_loads
+
+    def enter(self, atom, queries):
+        """Start resolving an atom.
+
+        :param queries: count of repo queries issued so far
+        """
+        key = str(atom)
+        stats = self.atoms.get(key)
+        if stats is None:
+            stats = self.atoms[key] = atom_stats(key)
+        stats.calls += 1
+        # only the outermost resolution of an atom counts towards its time
+        recursive = any(f.stats is stats for f in self._stack)
+        self._stack.append(_frame(stats, self._counters(queries), recursive))
+
+    def exit(self, queries):
+        """Finish resolving the last atom entered.
+
+        :param queries: count of repo queries issued so far
+        """
+        frame = self._stack.pop()
+        spent = [now - start for now, start in
+                 zip(self._counters(queries), frame.start)]
+        exclusive = [x - y for x, y in zip(spent, frame.children)]
+        stats = frame.stats
+        if not frame.recursive:
+            stats.time += spent[0]
+        stats.self_time += exclusive[0]
+        stats.queries += exclusive[1]
+        stats.metadata_loads += exclusive[2]
+        if self._stack:
+            children = self._stack[-1].children
+            for i, x in enumerate(spent):
+                children[i] += x
+        else:
+            self.total_time += spent[0]
+
+    def choice(self):
+        """Note a choice being tried for the current atom."""
+        if self._stack:
+            self._stack[-1].stats.choices += 1
+
+    def backtrack(self, ops):
+        """Note ops being backtracked over while resolving the current atom."""
+        if self._stack:
+            self._stack[-1].stats.backtracks += ops
+
+    def sorted_stats(self, key='self_time'):
+        return sorted(self.atoms.itervalues(),
+                      key=lambda x: getattr(x, key), reverse=True)
+
+    def write(self, handle):
+        """Write the stats as JSON."""
+        json.dump({
+            'total_time': self.total_time,
+            'atoms': [x.to_dict() for x in self.sorted_stats()],
+        }, handle, indent=1, sort_keys=True)
+        handle.write('\n')
+
+    def summary(self, limit=10, key='self_time'):
+        """Yield lines summarizing the atoms costing the most."""
+        yield "resolution took %.2f seconds, %i atoms resolved" % (
+            self.total_time, len(self.atoms))
+        yield "%8s %8s %6s %7s %9s %8s %8s  %s" % (
+            'self', 'total', 'calls', 'choices', 'backtrack', 'queries',
+            'metadata', 'atom')
+        for x in self.sorted_stats(key)[:limit]:
+            yield "%8.3f %8.3f %6i %7i %9i %8i %8i  %s" % (
+                x.self_time, x.time, x.calls, x.choices, x.backtracks,
+                x.queries, x.metadata_loads, x.atom)
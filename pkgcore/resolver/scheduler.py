@@ -0,0 +1,195 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+parallel execution of a resolved plan
+
+The resolver orders its plan so every op comes after what it depends on, but
+an op usually only depends on a few of the ops before it.  The scheduler
+works out which earlier ops have to be merged before an op can be built (its
+build deps) or merged (its runtime deps), and builds packages whose deps are
+satisfied concurrently; merging to the livefs is still done one op at a time.
+"""
+
+__all__ = ("plan_graph", "merge_scheduler")
+
+import sys
+import threading
+import Queue
+
+from snakeoil.demandload import demandload
+from snakeoil.sequences import iflatten_instance
+
+from pkgcore.ebuild.atom import atom
+
+demandload(
+    'pkgcore.util.thread_pool:reclaim_threads',
+)
+
+
+def _atoms(depset):
+    return [x for x in iflatten_instance(depset, atom) if not x.blocks]
+
+
+def plan_graph(ops):
+    """Derive the ordering constraints between the ops of a resolved plan.
+
+    Only ops earlier in the plan are considered as deps, so the plan order
+    remains a valid order for the graph.  Removals act as barriers: they're
+    merged after every op before them, and every op after them is merged
+    after them.
+
+    :param ops: sequence of plan ops, as returned by
+        :obj:`pkgcore.resolver.state.plan_state.ops`
+    :return: list of (build deps, merge deps) pairs of frozensets of op
+        indexes, one pair per op
+    """
+    graph = []
+    barrier = None
+    # earlier non-removal ops, by key and by (key, slot); deps only ever
+    # match pkgs of their own key, so they're only checked against those.
+    by_key = {}
+    by_slot = {}
+    for i, op in enumerate(ops):
+        if op.desc == 'remove':
+            graph.append((frozenset(), frozenset(xrange(i))))
+            barrier = i
+            continue
+        pkg = op.pkg
+        build_deps, merge_deps = set(), set()
+        if barrier is not None:
+            merge_deps.add(barrier)
+        for x in _atoms(pkg.depends):
+            build_deps.update(
+                j for j in by_key.get(x.key, ()) if x.match(ops[j].pkg))
+        for x in _atoms(pkg.rdepends):
+            merge_deps.update(
+                j for j in by_key.get(x.key, ())
+                if j not in build_deps and x.match(ops[j].pkg))
+        # ops touching the same slot keep their merges in plan order.
+        slot_key = (pkg.key, pkg.slot)
+        merge_deps.update(
+            j for j in by_slot.get(slot_key, ()) if j not in build_deps)
+        graph.append((frozenset(build_deps), frozenset(merge_deps)))
+        by_key.setdefault(pkg.key, []).append(i)
+        by_slot.setdefault(slot_key, []).append(i)
+    return graph
+
+
+class merge_scheduler(object):
+    """Build the ops of a plan in parallel, merging them one at a time.
+
+    :param ops: sequence of plan ops
+    :param build: callable taking an op and returning what to merge, or False
+        if the build failed; it's run in a worker thread and isn't invoked
+        for removals
+    :param merge: callable taking an op and what its build returned (None
+        for removals), returning False if the merge failed; it's run in the
+        thread calling :obj:`run`
+    :param jobs: maximum number of concurrent builds
+    """
+
+    def __init__(self, ops, build, merge, jobs=1):
+        self.ops = tuple(ops)
+        self.graph = plan_graph(self.ops)
+        self.jobs = max(jobs, 1)
+        self._build = build
+        self._merge = merge
+        # indexes of ops not yet started, being built, and built but unmerged
+        self._pending = []
+        self._running = {}
+        self._built = {}
+
+    @property
+    def running(self):
+        """Ops currently being built."""
+        return [self.ops[i] for i in sorted(self._running)]
+
+    @property
+    def queued(self):
+        """Ops waiting to be built or merged."""
+        return [self.ops[i] for i in sorted(self._pending + list(self._built))]
+
+    def _run_build(self, queue, i):
+        try:
+            result = (i, self._build(self.ops[i]), None)
+        except Exception:
+            # handed to the scheduling thread, which reraises it.
+            result = (i, False, sys.exc_info())
+        queue.put(result)
+
+    def _get(self, queue):
+        # a timeout keeps the wait interruptible
+        while True:
+            try:
+                return queue.get(True, 1)
+            except Queue.Empty:
+                continue
+
+    def _start_builds(self, queue, done, status):
+        for i in self._pending[:]:
+            if len(self._running) >= self.jobs:
+                break
+            if not done.issuperset(self.graph[i][0]):
+                continue
+            self._pending.remove(i)
+            if self.ops[i].desc == 'remove':
+                self._built[i] = None
+                continue
+            t = threading.Thread(target=self._run_build, args=(queue, i))
+            t.daemon = True
+            self._running[i] = t
+            t.start()
+            if status is not None:
+                status(self, self.ops[i])
+
+    def run(self, keep_going=False, status=None):
+        """Build and merge every op.
+
+        :param keep_going: if False, stop starting builds and merges after a
+            failure; otherwise ops depending on a failed op are still tried,
+            as sequential merging does
+        :param status: if given, invoked with the scheduler and the op
+            whenever a build starts
+        :return: True if every op was built and merged
+        """
+        self._pending = range(len(self.ops))
+        self._running = {}
+        self._built = {}
+        queue = Queue.Queue()
+        done = set()
+        failed = False
+        exc_info = None
+        try:
+            while True:
+                active = keep_going or not failed
+                if active:
+                    self._start_builds(queue, done, status)
+                    ready = sorted(
+                        i for i in self._built
+                        if done.issuperset(self.graph[i][1]))
+                    if ready:
+                        i = ready[0]
+                        if self._merge(self.ops[i], self._built.pop(i)) is False:
+                            failed = True
+                        done.add(i)
+                        continue
+                if not self._running:
+                    break
+                i, result, error = self._get(queue)
+                self._running.pop(i).join()
+                if error is not None:
+                    if exc_info is None:
+                        exc_info = error
+                    failed = True
+                    keep_going = False
+                elif result is False:
+                    failed = True
+                    done.add(i)
+                else:
+                    self._built[i] = result
+        finally:
+            reclaim_threads(self._running.values())
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return not (failed or self._pending or self._built)
@@ -23,6 +23,9 @@ class plan_state(object):
         self.match_atom = self.state.find_atom_matches
         self.vdb_filter = set()
         self.forced_restrictions = RefCountingSet()
+        # fingerprints of each plan prefix, computed lazily; see fingerprint
+        self._fingerprints = [0]
+        self._prefixes = {}
 
     def add_blocker(self, choices, blocker, key=None):
         """Adds blocker, returning any packages blocked.
@@ -62,6 +65,7 @@ class plan_state(object):
         finally:
             if reversion_count:
                 self.plan = self.plan[:-reversion_count]
+                del self._fingerprints[len(self.plan) + 1:]
 
     def iter_ops(self, return_livefs=False):
         iterable = (x for x in self.plan if not x.internal)
@@ -83,6 +87,20 @@ class plan_state(object):
     def current_state(self):
         return len(self.plan)
 
+    @property
+    def fingerprint(self):
+        """Identifier of the plan's current contents.
+
+        Plans built from the same sequence of ops get the same fingerprint,
+        regardless of backtracking that happened in between.
+        """
+        fingerprints = self._fingerprints
+        prefixes = self._prefixes
+        for op in self.plan[len(fingerprints) - 1:]:
+            fingerprints.append(prefixes.setdefault(
+                (fingerprints[-1], op.state_key), len(prefixes) + 1))
+        return fingerprints[-1]
+
 
 class ops_sequence(object):
 
@@ -137,6 +155,11 @@ class base_op_state(object):
             self.__class__.__name__, self.choices, self.pkg, self.force,
             id(self))
 
+    @property
+    def state_key(self):
+        """What the op changes in the plan state, for fingerprinting."""
+        return (self.__class__, self.pkg, self.force)
+
     def apply(self, plan):
         raise NotImplemented(self, 'apply')
 
@@ -173,6 +196,10 @@ class add_hardref_op(base_op_state):
     def __init__(self, restriction):
         self.restriction = restriction
 
+    @property
+    def state_key(self):
+        return (self.__class__, self.restriction)
+
     def apply(self, plan):
         plan.plan.append(self)
         plan.forced_restrictions.add(self.restriction)
@@ -300,6 +327,10 @@ class blocker_base_op(object):
             self.__class__.__name__, self.choices, self.blocker, self.key,
             id(self))
 
+    @property
+    def state_key(self):
+        return (self.__class__, self.blocker, self.key)
+
     def apply(self, plan):
         raise NotImplementedError(self, 'apply')
 
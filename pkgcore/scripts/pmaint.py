@@ -27,7 +27,7 @@ demandload(
     'snakeoil.fileutils:AtomicWriteFile',
     'snakeoil.osutils:pjoin,listdir_dirs',
     'snakeoil.sequences:iter_stable_unique',
-    'pkgcore.ebuild:processor,triggers',
+    'pkgcore.ebuild:eclass_func_cache,processor,triggers',
     'pkgcore.fs:contents,livefs',
     'pkgcore.merge:triggers@merge_triggers',
     'pkgcore.operations:observer',
@@ -261,6 +261,24 @@ regen_opts.add_argument(
 regen_opts.add_argument(
     "--force", action='store_true', default=False,
     help="force regeneration to occur regardless of staleness checks or repo settings")
+regen_opts.add_argument(
+    "-i", "--incremental", action='store_true', default=False,
+    help="only regenerate packages affected by changes since the last regen",
+    docs="""
+        Compare ebuilds and eclasses against the snapshot recorded by the
+        previous incremental regen and only regenerate packages whose ebuild
+        changed or that inherit a changed eclass. Falls back to a full regen
+        if no snapshot exists. Snapshots are stored in the user's pkgcore
+        cache dir; once one exists, regular regens keep it up to date.
+    """)
+regen_opts.add_argument(
+    "--git-range", metavar='RANGE',
+    help="use a git diff range to determine changes for --incremental",
+    docs="""
+        Determine changed ebuilds and eclasses from the files changed in the
+        given git diff range (e.g. ORIG_HEAD..HEAD after syncing a git repo)
+        instead of checking every file in the tree. Implies --incremental.
+    """)
 regen_opts.add_argument(
     "--rsync", action='store_true', default=False,
     help="perform actions necessary for rsync repos (update metadata/timestamp.chk)")
@@ -284,16 +302,22 @@ def regen_main(options, out, err):
             continue
 
         start_time = time.time()
-        repo.operations.regen_cache(
+        stats = repo.operations.regen_cache(
             threads=options.threads,
             observer=observer.formatter_output(out), force=options.force,
-            eclass_caching=(not options.disable_eclass_caching))
+            eclass_caching=(not options.disable_eclass_caching),
+            incremental=(options.incremental or options.git_range is not None),
+            git_range=options.git_range)
         end_time = time.time()
 
         if options.verbose:
             out.write(
                 "finished %d nodes in %.2f seconds" %
                 (len(repo), end_time - start_time))
+            for x in stats or ():
+                out.write(str(x))
+            if not options.disable_eclass_caching:
+                out.write(str(eclass_func_cache.get_cache().stats))
 
         if options.rsync:
             timestamp = pjoin(repo.location, "metadata", "timestamp.chk")
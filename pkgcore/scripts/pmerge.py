@@ -12,6 +12,7 @@ source or binary packages.
 # more should be doc'd...
 __all__ = ("AmbiguousQuery", "NoMatches")
 
+import argparse
 from functools import partial
 import sys
 from time import time
@@ -19,10 +20,14 @@ from time import time
 from snakeoil.sequences import iflatten_instance, stable_unique
 from snakeoil.strings import pluralism
 
-from pkgcore.ebuild import resolver, restricts
+from pkgcore.ebuild import const as ebuild_const, resolver, restricts
 from pkgcore.ebuild.atom import atom
+from pkgcore.fetch.prefetch import prefetcher
 from pkgcore.merge import errors as merge_errors
 from pkgcore.operations import observer, format
+from pkgcore.resolver.plan_cache import PlanCache, fingerprint as plan_fingerprint
+from pkgcore.resolver.profile import resolver_profile
+from pkgcore.resolver.scheduler import merge_scheduler
 from pkgcore.resolver.util import reduce_to_failures
 from pkgcore.restrictions import packages
 from pkgcore.restrictions.boolean import OrRestriction
@@ -116,6 +121,25 @@ merge_mode.add_argument(
         world file. Note that this is forcibly enabled if a package set is
         specified.
     """)
+merge_mode.add_argument(
+    '--fetch-jobs', type=int, default=2, metavar='JOBS',
+    help="number of distfiles to fetch in the background",
+    docs="""
+        Once the plan is final, fetch the distfiles of every package to be
+        merged in the background, up to JOBS at once, in the order they're
+        needed. Building a package only waits for its own distfiles.
+        Defaults to 2, use 0 to fetch each package's distfiles right before
+        building it.
+    """)
+merge_mode.add_argument(
+    '-j', '--jobs', type=int, default=1, metavar='JOBS',
+    help="number of packages to build in parallel",
+    docs="""
+        Build up to JOBS packages at once. Packages are only built once the
+        packages they depend on at build time are merged, and merging to the
+        livefs is still done one package at a time. Defaults to 1, building
+        and merging each package in turn.
+    """)
 
 resolution_options = argparser.add_argument_group("resolver options")
 resolution_options.add_argument(
@@ -144,6 +168,35 @@ resolution_options.add_argument(
         to conflict with already installed dependencies that aren't involved in
         the graph of the requested operation.
     """)
+resolution_options.add_argument(
+    '--resolver-cache-size', type=int, metavar='PKGS',
+    help="limit the pkgs the resolver keeps cached",
+    docs="""
+        The resolver caches the results of repo queries, holding every pkg
+        they returned in memory until resolution finishes. This bounds the
+        number of cached pkgs, dropping the least recently used queries that
+        don't return pkgs in the plan once it's exceeded; useful for large
+        resolutions on systems low on memory. Unbounded by default.
+    """)
+resolution_options.add_argument(
+    '--resolver-profile', type=argparse.FileType('w'), metavar='FILE',
+    help="profile resolution, writing the stats to FILE",
+    docs="""
+        Record, per atom resolved, the time spent resolving it (both
+        including and excluding its deps), the choices tried, the plan ops
+        backtracked over, and the repo queries and pkg metadata loads it
+        triggered. The stats are written to FILE as JSON, and the atoms taking
+        the most time are summarized afterwards. Implies --no-plan-cache.
+    """)
+resolution_options.add_argument(
+    '--no-plan-cache', action='store_false', dest='plan_cache',
+    help="always resolve, instead of reusing a cached plan",
+    docs="""
+        By default the resolved plan is cached, keyed by the targets, resolver
+        options, configuration, profile, and the state of the repos and the
+        vdb; later runs with nothing changed reuse it instead of resolving
+        again. This disables both using and storing cached plans.
+    """)
 resolution_options.add_argument(
     '-i', '--ignore-cycles', action='store_true',
     help="ignore unbreakable dep cycles",
@@ -429,6 +482,13 @@ def _validate(parser, namespace):
         parser.error('please specify at least one atom or nonempty set')
     if namespace.newuse:
         namespace.oneshot = True
+    if namespace.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if namespace.fetch_jobs < 0:
+        parser.error("--fetch-jobs can't be negative")
+    if namespace.resolver_cache_size is not None and \
+            namespace.resolver_cache_size < 1:
+        parser.error("--resolver-cache-size must be at least 1")
 
     # At some point, fix argparse so this isn't necessary...
     def f(val):
@@ -492,6 +552,131 @@ def load_world(namespace, attr):
     setattr(namespace, attr, value)
 
 
+def build_op(options, out, domain, op, build_obs, cleanup):
+    """Fetch, build, and localize the pkg of a plan op.
+
+    :param cleanup: list functions releasing the op's resources get added to
+    :return: the pkg to merge, None if only fetching, or False on failure
+    """
+    cleanup.append(op.pkg.release_cached_data)
+
+    if not options.fetchonly and options.debug:
+        out.write("Forcing a clean of workdir")
+
+    pkg_ops = domain.pkg_operations(op.pkg, observer=build_obs)
+    out.write("\n%i files required-" % len(op.pkg.fetchables))
+    if not pkg_ops.run_if_supported("fetch", or_return=True):
+        out.error("fetching failed for %s" % (op.pkg.cpvstr,))
+        return False
+    if options.fetchonly:
+        return None
+
+    buildop = pkg_ops.run_if_supported("build", or_return=None)
+    pkg = op.pkg
+    if buildop is not None:
+        out.write("building %s" % (op.pkg.cpvstr,))
+        result = buildop.finalize()
+        if result is False:
+            out.error("failed building %s" % (op.pkg.cpvstr,))
+            return False
+        pkg = result
+        cleanup.append(pkg.release_cached_data)
+        pkg_ops = domain.pkg_operations(pkg, observer=build_obs)
+        cleanup.append(buildop.cleanup)
+
+    cleanup.append(partial(pkg_ops.run_if_supported, "cleanup"))
+    return pkg_ops.run_if_supported("localize", or_return=pkg)
+
+
+def merge_op(out, domain, op, pkg, repo_obs, cleanup):
+    """Apply a plan op to the livefs.
+
+    :param pkg: the built pkg to merge, unused for removals
+    :return: True on success, False if the merge was blocked
+    """
+    if op.desc == "remove":
+        out.write(">>> Removing %s" % op.pkg.cpvstr)
+        i = domain.uninstall_pkg(op.pkg, repo_obs)
+    else:
+        out.write()
+        if op.desc == "replace":
+            if op.old_pkg == pkg:
+                out.write(">>> Reinstalling %s" % (pkg.cpvstr))
+            else:
+                out.write(">>> Replacing %s with %s" % (
+                    op.old_pkg.cpvstr, pkg.cpvstr))
+            i = domain.replace_pkg(op.old_pkg, pkg, repo_obs)
+            cleanup.append(op.old_pkg.release_cached_data)
+        else:
+            out.write(">>> Installing %s" % (pkg.cpvstr,))
+            i = domain.install_pkg(pkg, repo_obs)
+    try:
+        i.finish()
+    except merge_errors.BlockModification as e:
+        out.error("Failed to merge %s: %s" % (op.pkg, e))
+        return False
+    return True
+
+
+def _update_world(options, out, world_set, repo, atoms, op):
+    if world_set is None:
+        return
+    if op.desc == "remove":
+        out.write('>>> Removing %s from world file' % op.pkg.cpvstr)
+        removal_pkg = slotatom_if_slotted(repo, op.pkg.versioned_atom)
+        update_worldset(world_set, removal_pkg, remove=True)
+    elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
+        if not options.upgrade:
+            out.write('>>> Adding %s to world file' % op.pkg.cpvstr)
+            add_pkg = slotatom_if_slotted(repo, op.pkg.versioned_atom)
+            update_worldset(world_set, add_pkg)
+
+
+def merge_parallel(options, out, domain, changes, build_obs, repo_obs, update_world):
+    """Build up to --jobs pkgs at once, merging them as their deps allow."""
+    build_obs = observer.threadsafe_repo_observer(build_obs)
+    cleanups = {}
+
+    def build(op):
+        cleanup = cleanups[op] = []
+        return build_op(options, out, domain, op, build_obs, cleanup)
+
+    def merge(op, pkg):
+        cleanup = cleanups.pop(op, [])
+        try:
+            if not merge_op(out, domain, op, pkg, repo_obs, cleanup):
+                return False
+            update_world(op)
+        finally:
+            for func in cleanup:
+                func()
+        return True
+
+    def status(scheduler, op):
+        running = scheduler.running
+        queued = len(scheduler.queued)
+        out.write("\nBuilding %s::%s (%i running, %i queued)" % (
+            op.pkg.cpvstr, op.pkg.repo, len(running), queued))
+        out.title("%i running, %i queued: %s" % (
+            len(running), queued, ', '.join(x.pkg.cpvstr for x in running)))
+
+    scheduler = merge_scheduler(changes, build, merge, jobs=options.jobs)
+    try:
+        if not scheduler.run(keep_going=options.ignore_failures, status=status):
+            if not options.ignore_failures:
+                return 1
+    except format.errors:
+        return 1
+    finally:
+        # release whatever failed or unmerged builds left behind
+        for cleanup in cleanups.itervalues():
+            for func in cleanup:
+                func()
+
+    out.write("finished")
+    return 0
+
+
 @argparser.bind_main_func
 def main(options, out, err):
     config = options.config
@@ -600,6 +785,10 @@ def main(options, out, err):
         extra_kwargs['resolver_cls'] = resolver.empty_tree_merge_plan
     if options.debug:
         extra_kwargs['debug'] = True
+    if options.resolver_cache_size is not None:
+        extra_kwargs['max_cached_pkgs'] = options.resolver_cache_size
+    if options.resolver_profile is not None:
+        extra_kwargs['profile'] = resolver_profile()
 
     # XXX: This should recurse on deep
     if options.newuse:
@@ -622,100 +811,132 @@ def main(options, out, err):
 #    hp = hpy()
 #    hp.setrelheap()
 
-    resolver_inst = resolver_kls(
-        vdbs=installed_repos.repos, dbs=source_repos.repos,
-        verify_vdb=options.deep, nodeps=options.nodeps,
-        drop_cycles=options.ignore_cycles, force_replace=options.replace,
-        process_built_depends=options.with_bdeps, **extra_kwargs)
-
-    if options.preload_vdb_state:
-        out.write(out.bold, ' * ', out.reset, 'Preloading vdb... ')
-        vdb_time = time()
-        resolver_inst.load_vdb_state()
-        vdb_time = time() - vdb_time
-    else:
-        vdb_time = 0.0
-
-    failures = []
-    resolve_time = time()
-    if sys.stdout.isatty():
-        out.title('Resolving...')
-        out.write(out.bold, ' * ', out.reset, 'Resolving...')
-    ret = resolver_inst.add_atoms(atoms, finalize=True)
-    while ret:
-        out.error('resolution failed')
-        restrict = ret[0][0]
-        just_failures = reduce_to_failures(ret[1])
-        display_failures(out, just_failures, debug=options.debug)
-        failures.append(restrict)
-        if not options.ignore_failures:
-            break
-        out.write("restarting resolution")
-        atoms = [x for x in atoms if x != restrict]
-        resolver_inst.reset()
+    # reuse the plan of an earlier run if nothing it depends on changed
+    plan_cache = plan_key = changes = None
+    resolve_time = vdb_time = 0.0
+    if options.plan_cache and not (
+            options.clean or options.debug or options.ignore_failures or
+            options.resolver_profile is not None):
+        resolver_repos = list(source_repos.repos) + list(installed_repos.repos)
+        plan_cache = PlanCache(ebuild_const.PLAN_CACHE_PATH)
+        plan_key = plan_fingerprint(domain, resolver_repos, atoms, (
+            resolver_kls, extra_kwargs,
+            options.deep, options.nodeps, options.ignore_cycles,
+            options.replace, options.with_bdeps, options.preload_vdb_state))
+        changes = plan_cache.get(plan_key, resolver_repos)
+        if changes is not None:
+            out.write(out.bold, ' * ', out.reset, 'Using cached resolver plan')
+
+    if changes is None:
+        resolver_inst = resolver_kls(
+            vdbs=installed_repos.repos, dbs=source_repos.repos,
+            verify_vdb=options.deep, nodeps=options.nodeps,
+            drop_cycles=options.ignore_cycles, force_replace=options.replace,
+            process_built_depends=options.with_bdeps, **extra_kwargs)
+
+        if options.preload_vdb_state:
+            out.write(out.bold, ' * ', out.reset, 'Preloading vdb... ')
+            vdb_time = time()
+            resolver_inst.load_vdb_state()
+            vdb_time = time() - vdb_time
+
+        failures = []
+        resolve_time = time()
+        if sys.stdout.isatty():
+            out.title('Resolving...')
+            out.write(out.bold, ' * ', out.reset, 'Resolving...')
         ret = resolver_inst.add_atoms(atoms, finalize=True)
-    resolve_time = time() - resolve_time
-
-    if options.debug:
-        out.write(out.bold, " * ", out.reset, "resolution took %.2f seconds" % resolve_time)
-
-    if failures:
-        out.write()
-        out.write('Failures encountered:')
-        for restrict in failures:
-            out.error("failed '%s'" % (restrict,))
-            out.write('potentials:')
-            match_count = 0
-            for r in repo_utils.get_raw_repos(source_repos.repos):
-                l = r.match(restrict)
-                if l:
-                    out.write(
-                        "repo %s: [ %s ]" % (r, ", ".join(str(x) for x in l)))
-                    match_count += len(l)
-            if not match_count:
-                out.write("No matches found")
+        while ret:
+            out.error('resolution failed')
+            restrict = ret[0][0]
+            just_failures = reduce_to_failures(ret[1])
+            display_failures(out, just_failures, debug=options.debug)
+            failures.append(restrict)
             if not options.ignore_failures:
-                return 1
+                break
+            out.write("restarting resolution")
+            atoms = [x for x in atoms if x != restrict]
+            resolver_inst.reset()
+            ret = resolver_inst.add_atoms(atoms, finalize=True)
+        resolve_time = time() - resolve_time
+
+        if options.debug:
+            out.write(out.bold, " * ", out.reset, "resolution took %.2f seconds" % resolve_time)
+            out.write(
+                out.bold, " * ", out.reset,
+                "resolver failure cache: %s" % (resolver_inst.solution_cache_stats,))
+            out.write(
+                out.bold, " * ", out.reset,
+                "resolver query cache: %s" % (resolver_inst.query_cache_stats,))
+
+        if options.resolver_profile is not None:
+            profile = extra_kwargs['profile']
+            with options.resolver_profile as f:
+                profile.write(f)
+            out.write(out.bold, ' * ', out.reset,
+                      'resolver profile written to %s' % (f.name,))
+            for line in profile.summary():
+                out.write(line)
+
+        if failures:
             out.write()
+            out.write('Failures encountered:')
+            for restrict in failures:
+                out.error("failed '%s'" % (restrict,))
+                out.write('potentials:')
+                match_count = 0
+                for r in repo_utils.get_raw_repos(source_repos.repos):
+                    l = r.match(restrict)
+                    if l:
+                        out.write(
+                            "repo %s: [ %s ]" % (r, ", ".join(str(x) for x in l)))
+                        match_count += len(l)
+                if not match_count:
+                    out.write("No matches found")
+                if not options.ignore_failures:
+                    return 1
+                out.write()
 
-    resolver_inst.free_caches()
+        resolver_inst.free_caches()
 
-    if options.clean:
-        out.write(out.bold, ' * ', out.reset, 'Packages to be removed:')
-        vset = set(installed_repos.combined)
-        len_vset = len(vset)
-        vset.difference_update(x.pkg for x in resolver_inst.state.iter_ops(True))
-        wipes = sorted(x for x in vset if x.package_is_real)
-        for x in wipes:
-            out.write("Remove %s" % x)
-        out.write()
-        if wipes:
-            out.write("removing %i packages of %i installed, %0.2f%%." %
-                      (len(wipes), len_vset, 100*(len(wipes)/float(len_vset))))
-        else:
-            out.write("no packages to remove")
-        if options.pretend:
-            return 0
-        if options.ask:
-            if not formatter.ask("Do you wish to proceed?", default_answer=False):
-                return 1
+        if options.clean:
+            out.write(out.bold, ' * ', out.reset, 'Packages to be removed:')
+            vset = set(installed_repos.combined)
+            len_vset = len(vset)
+            vset.difference_update(x.pkg for x in resolver_inst.state.iter_ops(True))
+            wipes = sorted(x for x in vset if x.package_is_real)
+            for x in wipes:
+                out.write("Remove %s" % x)
             out.write()
-        repo_obs = observer.repo_observer(observer.formatter_output(out), not options.debug)
-        do_unmerge(options, out, err, installed_repos.combined, wipes, world_set, repo_obs)
-        return 0
+            if wipes:
+                out.write("removing %i packages of %i installed, %0.2f%%." %
+                          (len(wipes), len_vset, 100*(len(wipes)/float(len_vset))))
+            else:
+                out.write("no packages to remove")
+            if options.pretend:
+                return 0
+            if options.ask:
+                if not formatter.ask("Do you wish to proceed?", default_answer=False):
+                    return 1
+                out.write()
+            repo_obs = observer.repo_observer(observer.formatter_output(out), not options.debug)
+            do_unmerge(options, out, err, installed_repos.combined, wipes, world_set, repo_obs)
+            return 0
 
-    if options.debug:
-        out.write()
-        out.write(out.bold, ' * ', out.reset, 'debug: all ops')
-        out.first_prefix.append(" ")
-        plan_len = len(str(len(resolver_inst.state.plan)))
-        for pos, op in enumerate(resolver_inst.state.plan):
-            out.write(str(pos + 1).rjust(plan_len), ': ', str(op))
-        out.first_prefix.pop()
-        out.write(out.bold, ' * ', out.reset, 'debug: end all ops')
-        out.write()
+        if options.debug:
+            out.write()
+            out.write(out.bold, ' * ', out.reset, 'debug: all ops')
+            out.first_prefix.append(" ")
+            plan_len = len(str(len(resolver_inst.state.plan)))
+            for pos, op in enumerate(resolver_inst.state.plan):
+                out.write(str(pos + 1).rjust(plan_len), ': ', str(op))
+            out.first_prefix.pop()
+            out.write(out.bold, ' * ', out.reset, 'debug: end all ops')
+            out.write()
 
-    changes = resolver_inst.state.ops(only_real=True)
+        changes = resolver_inst.state.ops(only_real=True)
+        if plan_cache is not None:
+            plan_cache.store(plan_key, changes)
 
     build_obs = observer.build_observer(observer.formatter_output(out), not options.debug)
     repo_obs = observer.repo_observer(observer.formatter_output(out), not options.debug)
@@ -749,7 +970,7 @@ def main(options, out, err):
         return
 
     if options.pretend:
-        if options.verbose:
+        if options.verbose and resolve_time:
             out.write(
                 out.bold, ' * ', out.reset,
                 "resolver plan required %i ops (%.2f seconds)" %
@@ -764,10 +985,26 @@ def main(options, out, err):
         return
 
     change_count = len(changes)
+    update_world = partial(
+        _update_world, options, out, world_set, source_repos.combined, atoms)
+
+    # start fetching distfiles in the background; the build loop only
+    # blocks on those that aren't there yet by the time they're needed.
+    fetcher = None
+    if options.fetch_jobs:
+        fetcher = domain.fetcher
+        domain.fetcher = prefetcher(fetcher, threads=options.fetch_jobs)
+        domain.fetcher.queue(
+            fetchable for op in changes if op.desc != "remove"
+            for fetchable in op.pkg.fetchables)
 
     # left in place for ease of debugging.
     cleanup = []
     try:
+        if options.jobs > 1 and not options.fetchonly:
+            return merge_parallel(
+                options, out, domain, changes, build_obs, repo_obs, update_world)
+
         for count, op in enumerate(changes):
             for func in cleanup:
                 func()
@@ -776,72 +1013,20 @@ def main(options, out, err):
 
             out.write("\nProcessing %i of %i: %s::%s" % (count + 1, change_count, op.pkg.cpvstr, op.pkg.repo))
             out.title("%i/%i: %s" % (count + 1, change_count, op.pkg.cpvstr))
+            pkg = None
             if op.desc != "remove":
-                cleanup = [op.pkg.release_cached_data]
-
-                if not options.fetchonly and options.debug:
-                    out.write("Forcing a clean of workdir")
-
-                pkg_ops = domain.pkg_operations(op.pkg, observer=build_obs)
-                out.write("\n%i files required-" % len(op.pkg.fetchables))
-                if not pkg_ops.run_if_supported("fetch", or_return=True):
-                    out.error("fetching failed for %s" % (op.pkg.cpvstr,))
+                try:
+                    pkg = build_op(options, out, domain, op, build_obs, cleanup)
+                except format.errors as e:
+                    return 1
+                if pkg is False:
                     if not options.ignore_failures:
                         return 1
                     continue
                 if options.fetchonly:
                     continue
 
-                buildop = pkg_ops.run_if_supported("build", or_return=None)
-                pkg = op.pkg
-                if buildop is not None:
-                    out.write("building %s" % (op.pkg.cpvstr,))
-                    result = False
-                    try:
-                        result = buildop.finalize()
-                    except format.errors as e:
-                        return 1
-                    else:
-                        if result is False:
-                            out.error("failed building %s" % (op.pkg.cpvstr,))
-                    if result is False:
-                        if not options.ignore_failures:
-                            return 1
-                        continue
-                    pkg = result
-                    cleanup.append(pkg.release_cached_data)
-                    pkg_ops = domain.pkg_operations(pkg, observer=build_obs)
-                    cleanup.append(buildop.cleanup)
-
-                cleanup.append(partial(pkg_ops.run_if_supported, "cleanup"))
-                pkg = pkg_ops.run_if_supported("localize", or_return=pkg)
-                # wipe this to ensure we don't inadvertantly use it further down;
-                # we aren't resetting it after localizing, so could have the wrong
-                # set of ops.
-                del pkg_ops
-
-                out.write()
-                if op.desc == "replace":
-                    if op.old_pkg == pkg:
-                        out.write(">>> Reinstalling %s" % (pkg.cpvstr))
-                    else:
-                        out.write(">>> Replacing %s with %s" % (
-                            op.old_pkg.cpvstr, pkg.cpvstr))
-                    i = domain.replace_pkg(op.old_pkg, pkg, repo_obs)
-                    cleanup.append(op.old_pkg.release_cached_data)
-                else:
-                    out.write(">>> Installing %s" % (pkg.cpvstr,))
-                    i = domain.install_pkg(pkg, repo_obs)
-
-                # force this explicitly- can hold onto a helluva lot more
-                # then we would like.
-            else:
-                out.write(">>> Removing %s" % op.pkg.cpvstr)
-                i = domain.uninstall_pkg(op.pkg, repo_obs)
-            try:
-                ret = i.finish()
-            except merge_errors.BlockModification as e:
-                out.error("Failed to merge %s: %s" % (op.pkg, e))
+            if not merge_op(out, domain, op, pkg, repo_obs, cleanup):
                 if not options.ignore_failures:
                     return 1
                 continue
@@ -852,16 +1037,7 @@ def main(options, out, err):
             # mainly to protect against any code following triggering reloads
             # basically, be protective
 
-            if world_set is not None:
-                if op.desc == "remove":
-                    out.write('>>> Removing %s from world file' % op.pkg.cpvstr)
-                    removal_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
-                    update_worldset(world_set, removal_pkg, remove=True)
-                elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
-                    if not options.upgrade:
-                        out.write('>>> Adding %s to world file' % op.pkg.cpvstr)
-                        add_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
-                        update_worldset(world_set, add_pkg)
+            update_world(op)
 
 
 #    again... left in place for ease of debugging.
@@ -870,7 +1046,9 @@ def main(options, out, err):
 #    else:
 #        import pdb;pdb.set_trace()
     finally:
-        pass
+        if fetcher is not None:
+            domain.fetcher.shutdown()
+            domain.fetcher = fetcher
 
     # the final run from the loop above doesn't invoke cleanups;
     # we could ignore it, but better to run it to ensure nothing is
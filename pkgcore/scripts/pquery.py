@@ -24,6 +24,7 @@ from snakeoil.demandload import demandload
 from snakeoil.formatters import decorate_forced_wrapping
 
 from pkgcore.ebuild import conditionals, atom
+from pkgcore.ebuild.cpv import sorted_cpvs
 from pkgcore.restrictions import packages, values, boolean
 from pkgcore.util import (
     commandline, repo_utils, parserestrict, packages as pkgutils)
@@ -415,7 +416,7 @@ def print_packages_noversion(options, out, err, pkgs):
         out.write(out.bold, green, ' * ', out.fg(), pkgs[0].key)
         out.wrap = True
         out.later_prefix = ['                  ']
-        versions = ' '.join(pkg.fullver for pkg in sorted(pkgs))
+        versions = ' '.join(pkg.fullver for pkg in sorted_cpvs(pkgs))
         out.write(green, '     versions: ', out.fg(), versions)
         # If we are already matching on all repos we do not need to duplicate.
         if not options.all_repos:
@@ -837,7 +838,7 @@ def _add_all_if_needed(namespace, attr):
 def pkg_upgrade(_value, namespace):
     pkgs = []
     for pkg in namespace.domain.all_livefs_repos:
-        matches = sorted(namespace.domain.all_repos.match(pkg.slotted_atom))
+        matches = sorted_cpvs(namespace.domain.all_repos.match(pkg.slotted_atom))
         if matches and matches[-1] != pkg:
             pkgs.append(matches[-1].versioned_atom)
     return packages.OrRestriction(*pkgs)
@@ -974,6 +975,32 @@ def _validate_args(parser, namespace):
     namespace.attr = list(iter_stable_unique(attrs))
 
 
+def _owns_query(options, repo):
+    """Narrow a query down to the owners of the --owns paths.
+
+    Repos with an owner index resolve the paths without scanning every
+    package's contents; the query is still applied to what's found.
+
+    :return: restriction to use for the repo, None if nothing can match
+    """
+    owners = getattr(repo, 'owners', None)
+    if not options._owns or owners is None:
+        return options.query
+    cpvs = set()
+    for restrict in options._owns:
+        for obj in restrict.restriction.vals:
+            found = owners(obj.location)
+            if found is None:
+                return options.query
+            cpvs.update(found)
+    if not cpvs:
+        return None
+    return packages.AndRestriction(
+        packages.OrRestriction(
+            *[atom.atom('=%s' % cpv.cpvstr) for cpv in sorted_cpvs(cpvs)]),
+        options.query)
+
+
 @argparser.bind_main_func
 def main(options, out, err):
     """Run a query."""
@@ -986,8 +1013,11 @@ def main(options, out, err):
     if options.query is None:
         return 0
     for repo in options.repos:
+        query = _owns_query(options, repo)
+        if query is None:
+            continue
         try:
-            for pkgs in pkgutils.groupby_pkg(repo.itermatch(options.query, sorter=sorted)):
+            for pkgs in pkgutils.groupby_pkg(repo.itermatch(query, sorter=sorted_cpvs)):
                 pkgs = list(pkgs)
                 if options.noversion:
                     print_packages_noversion(options, out, err, pkgs)
@@ -0,0 +1,148 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.chksum import LazilyHashedPath
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.binpkg import remote
+from pkgcore.test import TestCase
+
+
+class TestPackagesCache(TempDirMixin, TestCase):
+
+    kls = remote.PackagesCacheV1
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.location = pjoin(self.dir, 'Packages')
+
+    def cache(self):
+        return self.kls(self.location)
+
+    def add(self, cache, cpv, **data):
+        data.setdefault('SLOT', '0')
+        data['_chf_'] = LazilyHashedPath(cpv, mtime=1)
+        cache[cpv] = data
+
+    def read(self):
+        with open(self.location) as f:
+            return f.read()
+
+    def test_lazy(self):
+        cache = self.cache()
+        for i in xrange(5):
+            self.add(cache, 'dev-util/foo-%i' % i, EAPI='5', KEYWORDS='x86')
+        cache.commit()
+        self.assertTrue(os.path.exists(self.location + '.index'))
+
+        cache = self.cache()
+        self.assertEqual(len(cache.data), 5)
+        self.assertIn('dev-util/foo-3', cache)
+        self.assertNotIn('dev-util/foo-5', cache)
+        self.assertEqual(cache['dev-util/foo-3']['KEYWORDS'], 'x86')
+        self.assertEqual(list(cache.data._entries), ['dev-util/foo-3'])
+        self.assertEqual(
+            sorted((k, v['EAPI'], v['SLOT']) for k, v in cache.data.iteritems()),
+            [('dev-util/foo-%i' % i, '5', '0') for i in xrange(5)])
+
+        # the index is rebuilt if the file changed under it.
+        os.unlink(self.location + '.index')
+        cache = self.cache()
+        self.assertEqual(sorted(cache), ['dev-util/foo-%i' % i for i in xrange(5)])
+        with open(self.location + '.index') as f:
+            index = f.read()
+        with open(self.location, 'a') as f:
+            f.write('CPV: dev-util/bar-1\nSLOT: 1\n\n')
+        with open(self.location) as f:
+            data = f.read().replace('PACKAGES: 5', 'PACKAGES: 6')
+        with open(self.location, 'w') as f:
+            f.write(data)
+        cache = self.cache()
+        self.assertEqual(cache['dev-util/bar-1']['SLOT'], '1')
+        with open(self.location + '.index') as f:
+            self.assertNotEqual(f.read(), index)
+
+    def test_append(self):
+        cache = self.cache()
+        for i in xrange(3):
+            self.add(cache, 'dev-util/foo-%i' % i, EAPI='5')
+        cache.commit()
+        original = self.read()
+
+        cache = self.cache()
+        self.assertEqual(cache['dev-util/foo-1']['EAPI'], '5')
+        self.add(cache, 'dev-util/bar-1', EAPI='4', SLOT='2')
+        cache.commit()
+        data = self.read()
+        # only the header counts were touched, the record was appended.
+        self.assertTrue(data.startswith(
+            original.split('PACKAGES')[0] + 'PACKAGES: 4\n'))
+        self.assertTrue(data.endswith(original.split('\n\n', 1)[1] + (
+            'CPV:dev-util/bar-1\nEAPI:4\nSLOT:2\n_mtime_:1\n\n')))
+        self.add(cache, 'dev-util/bar-2')
+        cache.commit()
+
+        cache = self.cache()
+        self.assertEqual(len(cache.data), 5)
+        self.assertEqual(
+            (cache['dev-util/bar-1']['EAPI'], cache['dev-util/bar-1']['SLOT']),
+            ('4', '2'))
+        self.assertEqual(cache['dev-util/bar-2']['EAPI'], '5')
+        self.assertEqual(cache['dev-util/foo-2']['EAPI'], '5')
+
+        # replacing or removing entries rewrites the file.
+        self.add(cache, 'dev-util/foo-0', EAPI='4')
+        del cache['dev-util/bar-2']
+        cache.commit()
+        cache = self.cache()
+        self.assertEqual(sorted(cache), [
+            'dev-util/bar-1', 'dev-util/foo-0', 'dev-util/foo-1', 'dev-util/foo-2'])
+        self.assertEqual(cache['dev-util/foo-0']['EAPI'], '4')
+        self.assertIn('PACKAGES: 4\n', self.read())
+
+    def test_interrupted_append(self):
+        cache = self.cache()
+        for i in xrange(3):
+            self.add(cache, 'dev-util/foo-%i' % i)
+        cache.commit()
+        os.unlink(self.location + '.index')
+        # records were written, but the header wasn't updated and the last
+        # record is incomplete.
+        with open(self.location, 'a') as f:
+            f.write('CPV:dev-util/bar-1\nSLOT:1\n\nCPV:dev-util/bar-2\nSLO')
+
+        cache = self.cache()
+        self.assertEqual(sorted(cache), [
+            'dev-util/bar-1', 'dev-util/foo-0', 'dev-util/foo-1',
+            'dev-util/foo-2'])
+        self.assertEqual(cache['dev-util/bar-1']['SLOT'], '1')
+        self.assertFalse(os.path.exists(self.location + '.index'))
+
+        # the next update rewrites the file rather than appending to it.
+        self.add(cache, 'dev-util/bar-3')
+        cache.commit()
+        data = self.read()
+        self.assertIn('PACKAGES: 5\n', data)
+        self.assertNotIn('SLO\n', data)
+        cache = self.cache()
+        self.assertEqual(len(cache.data), 5)
+        self.assertEqual(cache['dev-util/bar-3']['SLOT'], '0')
+
+        # interrupted partway through its only record, the header count is
+        # still right; the fragment mustn't be appended after.
+        with open(self.location, 'a') as f:
+            f.write('CPV:dev-util/bar-4\nSLOT:7\nEA')
+        cache = self.cache()
+        self.assertEqual(len(cache.data), 5)
+        self.assertNotIn('dev-util/bar-4', cache)
+        self.add(cache, 'dev-util/baz-1')
+        cache.commit()
+        self.assertNotIn('SLOT:7', self.read())
+        cache = self.cache()
+        self.assertEqual(sorted(cache), [
+            'dev-util/bar-1', 'dev-util/bar-3', 'dev-util/baz-1',
+            'dev-util/foo-0', 'dev-util/foo-1', 'dev-util/foo-2'])
+        self.assertEqual(cache['dev-util/baz-1']['SLOT'], '0')
@@ -0,0 +1,31 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.chksum import get_chksums
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.binpkg import repo_ops, xpak
+from pkgcore.fs import livefs, tar
+from pkgcore.test import TestCase
+
+
+class TestWriteBinpkg(TempDirMixin, TestCase):
+
+    def test_write_binpkg(self):
+        root = pjoin(self.dir, 'root')
+        os.makedirs(pjoin(root, 'etc'))
+        with open(pjoin(root, 'etc', 'foo'), 'w') as f:
+            f.write('bar\n')
+        path = pjoin(self.dir, 'foo-1.tbz2')
+        data = {'CATEGORY': 'dev-util', 'PF': 'foo-1', 'SLOT': '0'}
+        chksums = repo_ops.write_binpkg(
+            path, livefs.scan(root, offset=root), data, parallelize=False)
+        self.assertEqual(chksums, dict(zip(
+            ('size', 'sha1', 'md5'), get_chksums(path, 'size', 'sha1', 'md5'))))
+        self.assertEqual(dict(xpak.Xpak(path).iteritems()), data)
+        self.assertEqual(
+            sorted(x.location for x in tar.generate_contents(path)),
+            ['/etc', '/etc/foo'])
@@ -0,0 +1,70 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.chksum import get_chksums
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.binpkg import repository, xpak
+from pkgcore.binpkg.repo_ops import write_binpkg
+from pkgcore.test import TestCase
+
+
+class TestScanBinpkgs(TempDirMixin, TestCase):
+
+    def write(self, cpv, **data):
+        category, pf = cpv.split('/')
+        data.update(CATEGORY=category, PF=pf)
+        path = pjoin(self.dir, category, pf + '.tbz2')
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        write_binpkg(path, (), data, parallelize=False)
+        return path
+
+    def test_scan(self):
+        path = self.write('dev-util/foo-1', SLOT='0', EAPI='5')
+        data, chksums, st = xpak.scan_binpkg(
+            path, keys=('SLOT', 'EAPI', 'KEYWORDS'), chfs=('size', 'sha1'))
+        self.assertEqual(data, {'SLOT': '0', 'EAPI': '5'})
+        self.assertEqual(chksums, dict(zip(
+            ('size', 'sha1'), get_chksums(path, 'size', 'sha1'))))
+        self.assertEqual(st.st_size, chksums['size'])
+        self.assertEqual(xpak.scan_binpkg(path, blocksize=7)[:2], (
+            dict(xpak.Xpak(path).iteritems()), {}))
+
+        bad = pjoin(self.dir, 'bad.tbz2')
+        with open(bad, 'w') as f:
+            f.write('not a binpkg\n' * 4)
+        short = pjoin(self.dir, 'short.tbz2')
+        with open(short, 'w') as f:
+            f.write('short')
+        open(pjoin(self.dir, 'empty.tbz2'), 'w').close()
+        paths = [path, bad, short, pjoin(self.dir, 'empty.tbz2'),
+                 pjoin(self.dir, 'missing')]
+        for threads in (1, 2):
+            results, errors = xpak.scan_binpkgs(paths, threads=threads)
+            self.assertEqual(list(results), [path])
+            self.assertEqual(sorted(errors), sorted(paths[1:]))
+            for x in (bad, short):
+                self.assertIsInstance(errors[x], xpak.MalformedXpak)
+                self.assertIn(repr(x), str(errors[x]))
+                self.assertNotIn('mmap', str(errors[x]))
+            self.assertIsInstance(errors[paths[-1]], EnvironmentError)
+
+    def test_update_cache(self):
+        paths = [self.write('dev-util/foo-%i' % i, SLOT='0', EAPI='5')
+                 for i in xrange(3)]
+        repo = repository.tree(self.dir)
+        repo._update_cache(threads=2)
+        with open(pjoin(self.dir, 'Packages')) as f:
+            data = f.read()
+        self.assertEqual(data.count('CPV: dev-util/foo-'), 3)
+        sha1 = '%x' % get_chksums(paths[0], 'sha1')[0]
+        self.assertIn('SHA1: %s\n' % sha1, data)
+
+        # fresh entries aren't rescanned.
+        repo = repository.tree(self.dir)
+        repo.cache.update_from_binpkgs = None
+        repo._update_cache()
@@ -0,0 +1,119 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import indexed
+from pkgcore.test.cache import util, test_base
+
+
+class db(indexed.database):
+
+    def __setitem__(self, cpv, data):
+        data['_chf_'] = test_base._chf_obj
+        return indexed.database.__setitem__(self, cpv, data)
+
+    def __getitem__(self, cpv):
+        d = dict(indexed.database.__getitem__(self, cpv).iteritems())
+        d.pop('_%s_' % self.chf_type, None)
+        return d
+
+
+class TestIndexed(util.GenericCacheMixin, TempDirMixin):
+
+    def get_db(self, readonly=False):
+        return db(self.dir,
+            auxdbkeys=self.cache_keys, readonly=readonly)
+
+    def test_roundtrip(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0', 'EAPI': '5'}
+        cache['dev-util/bar-2'] = {'SLOT': '2', 'KEYWORDS': 'x86'}
+        # uncommitted entries are visible to the instance that wrote them
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '0', 'EAPI': '5'})
+        self.assertFalse(os.path.exists(pjoin(self.dir, cache.data_filename)))
+        cache.commit()
+
+        cache = self.get_db(True)
+        self.assertEqual(sorted(cache), ['dev-util/bar-2', 'dev-util/foo-1'])
+        self.assertIn('dev-util/foo-1', cache)
+        self.assertNotIn('dev-util/foo-2', cache)
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '0', 'EAPI': '5'})
+        self.assertEqual(cache['dev-util/bar-2'], {'SLOT': '2', 'KEYWORDS': 'x86'})
+        self.assertRaises(KeyError, cache.__getitem__, 'dev-util/foo-2')
+
+    def test_update_and_delete(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0'}
+        cache['dev-util/bar-1'] = {'SLOT': '0'}
+        cache.commit()
+        cache['dev-util/foo-1'] = {'SLOT': '1'}
+        del cache['dev-util/bar-1']
+        self.assertNotIn('dev-util/bar-1', cache)
+        self.assertRaises(KeyError, cache.__delitem__, 'dev-util/bar-1')
+        cache.commit()
+
+        cache = self.get_db()
+        self.assertEqual(list(cache), ['dev-util/foo-1'])
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '1'})
+
+    def test_stale_index(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0'}
+        cache.commit()
+        index_path = pjoin(self.dir, cache.index_filename)
+        with open(index_path) as f:
+            index = f.read()
+
+        cache['dev-util/bar-1'] = {'SLOT': '1'}
+        cache.commit()
+        # an outdated index is caught up by scanning the appended records
+        with open(index_path, 'w') as f:
+            f.write(index)
+        cache = self.get_db()
+        self.assertEqual(sorted(cache), ['dev-util/bar-1', 'dev-util/foo-1'])
+        self.assertEqual(cache['dev-util/bar-1'], {'SLOT': '1'})
+
+        # a missing or garbage index is rebuilt from the data file
+        with open(index_path, 'w') as f:
+            f.write('garbage\n')
+        cache = self.get_db()
+        self.assertEqual(sorted(cache), ['dev-util/bar-1', 'dev-util/foo-1'])
+        os.unlink(index_path)
+        cache = self.get_db()
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '0'})
+
+    def test_compaction(self):
+        cache = self.get_db()
+        cache.set_sync_rate(1)
+        for x in xrange(10):
+            cache['dev-util/foo-1'] = {'SLOT': str(x)}
+        data_path = pjoin(self.dir, cache.data_filename)
+        # overwritten records are dropped once they dominate the file
+        self.assertTrue(os.stat(data_path).st_size < 10 * 37)
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '9'})
+
+        cache.set_sync_rate(100)
+        cache['dev-util/bar-1'] = {'SLOT': '0'}
+        del cache['dev-util/foo-1']
+        cache.compact()
+        cache = self.get_db()
+        self.assertEqual(list(cache), ['dev-util/bar-1'])
+        self.assertEqual(cache['dev-util/bar-1'], {'SLOT': '0'})
+
+    def test_commit(self):
+        data_path = pjoin(self.dir, indexed.database.data_filename)
+        # nothing to write, and read-only caches are never written to
+        self.get_db().commit(force=True)
+        self.get_db(True).commit(force=True)
+        self.assertFalse(os.path.exists(data_path))
+
+        # entries still pending at exit are committed then
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0'}
+        self.assertFalse(os.path.exists(data_path))
+        indexed._commit_pending()
+        self.assertEqual(self.get_db(True)['dev-util/foo-1'], {'SLOT': '0'})
@@ -200,6 +200,9 @@ class native_CpvTest(TestCase):
         # swap the ordering, so that it's no longer obj1.__cmp__, but obj2s
         self.assertTrue(obj2 < obj1, '%r must be < %r' % (obj2, obj1))
 
+        self.assertTrue(cpv.sort_key(obj1) > cpv.sort_key(obj2),
+            'sort key of %r must be > %r' % (obj1, obj2))
+
         if self.run_cpy_ver_cmp and obj1.fullver and obj2.fullver:
             self.assertTrue(cpv.cpy_ver_cmp(obj1.version, obj1.revision,
                 obj2.version, obj2.revision) > 0,
@@ -292,6 +295,29 @@ class native_CpvTest(TestCase):
         self.assertEqual(DummySubclass("da/ba-6.0", versioned=True),
             DummySubclass("da/ba-6.0-r0", versioned=True))
 
+    def test_version_key(self):
+        vkls = self.vkls
+        for v1, v2 in (("6.0_alpha", "6.0_alpha0"), ("6.01.0", "6.010.0"),
+                       ("6.0", "6.0-r0"), ("1.00", "1.0")):
+            self.assertEqual(vkls("da/ba-%s" % v1).version_key,
+                             vkls("da/ba-%s" % v2).version_key)
+        self.assertEqual(self.ukls("da/ba").version_key, None)
+        # the key is computed once
+        obj = vkls("da/ba-1.2_rc3-r1")
+        self.assertIdentical(obj.version_key, obj.version_key)
+        self.assertEqual(obj.version_key, cpv.native_version_key("1.2_rc3", 1))
+
+        versions = ["1.0_alpha", "1.0_beta2", "1.0_pre", "1.0_rc1", "1.0",
+                    "1.0-r1", "1.0_p1", "1.00.1", "1.01", "1.1", "1.1a",
+                    "1.1.0", "1.2", "2", "10"]
+        pkgs = [vkls("da/ba-%s" % v) for v in reversed(versions)]
+        self.assertEqual([x.fullver for x in cpv.sorted_cpvs(pkgs)], versions)
+        pkgs.append(vkls("da/aa-20"))
+        self.assertEqual(cpv.sorted_cpvs(pkgs), sorted(pkgs))
+        # repos sort category and package names with it too
+        self.assertEqual(cpv.sorted_cpvs(['dev-util', 'app-misc']),
+                         ['app-misc', 'dev-util'])
+
     def test_no_init(self):
         """Test if the cpv is in a somewhat sane state if __init__ fails.
 
@@ -4,14 +4,21 @@
 from functools import partial
 import os
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
 from snakeoil.currying import post_curry
-from snakeoil.osutils import pjoin
-from snakeoil.test.mixins import tempdir_decorator
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test.mixins import TempDirMixin, tempdir_decorator
 
 from pkgcore import fetch
-from pkgcore.ebuild import ebuild_src, digest, repo_objs
+from pkgcore.ebuild import (
+    ebuild_src, digest, eclass_cache, processor, repo_objs, repository)
 from pkgcore.ebuild.eapi import get_eapi
 from pkgcore.package import errors
+from pkgcore.restrictions.packages import AlwaysTrue
 from pkgcore.test import TestCase, malleable_obj
 from pkgcore.test.ebuild.test_eclass_cache import FakeEclassCache
 
@@ -448,3 +455,65 @@ class test_package_factory(TestCase):
         pass
 
     test_required_use.skip = "TODO"
+
+
+class TestMetadataBatch(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        for path, data in (
+                ('profiles/repo_name', 'batch\n'),
+                ('metadata/layout.conf', 'masters =\n'),
+                ('eclass/good.eclass', 'good_func() { :; }\n')):
+            self.write(path, data)
+        # b inherits a missing eclass, failing midway through the batch
+        for pn, eclass in (('a', 'good'), ('b', 'missing'), ('c', 'good')):
+            self.write('cat/%s/%s-1.ebuild' % (pn, pn),
+                       'EAPI=5\ninherit %s\nDESCRIPTION="%s"\nSLOT=0\n' % (
+                           eclass, pn))
+        self.repo = repository._UnconfiguredTree(
+            self.dir, eclass_cache=eclass_cache.cache(pjoin(self.dir, 'eclass')))
+        self.pkgs = sorted(self.repo.itermatch(AlwaysTrue))
+
+    def write(self, path, data):
+        path = pjoin(self.dir, path)
+        ensure_dirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(data)
+
+    def check(self, results):
+        self.assertEqual([x['DESCRIPTION'] for x in results[::2]], ['a', 'c'])
+        self.assertIsInstance(results[1], Exception)
+        self.assertIn('missing cannot be found', str(results[1]))
+
+    def test_failure(self):
+        ebp = processor.request_ebuild_processor()
+        try:
+            self.check(self.repo.package_class._get_metadata_batch(
+                self.pkgs, ebp=ebp))
+            # the processor is still in sync for the next request
+            results = ebp.get_keys_batch(self.pkgs[:1], self.repo.eclass_cache)
+            self.assertEqual(results[0]['DESCRIPTION'], 'a')
+        finally:
+            processor.release_ebuild_processor(ebp)
+
+    def test_aborted_batch(self):
+        calls = []
+
+        def inherit_handler(*args, **kwds):
+            calls.append(args)
+            if len(calls) == 1:
+                raise ValueError('aborting the batch')
+            return real_inherit_handler(*args, **kwds)
+        real_inherit_handler = processor.inherit_handler
+
+        ebp = processor.request_ebuild_processor()
+        try:
+            with mock.patch.object(processor, 'inherit_handler', inherit_handler):
+                results = self.repo.package_class._get_metadata_batch(
+                    self.pkgs, ebp=ebp)
+            # the batch's processor was discarded, and every package retried
+            self.assertIdentical(ebp.pid, None)
+            self.check(results)
+        finally:
+            processor.release_ebuild_processor(ebp)
@@ -0,0 +1,68 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.osutils import pjoin, ensure_dirs, listdir_files
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild import eclass_cache
+from pkgcore.ebuild.eclass_func_cache import EclassFuncCache
+from pkgcore.test import TestCase
+
+
+class TestEclassFuncCache(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.eclass_dir = pjoin(self.dir, 'eclass')
+        self.cache_dir = pjoin(self.dir, 'cache')
+        ensure_dirs(self.eclass_dir)
+        self.write('foo', 'foo_src_compile() { :; }')
+        self.write('bar', 'IUSE="bar"')
+
+    def write(self, eclass, data):
+        with open(pjoin(self.eclass_dir, eclass + '.eclass'), 'w') as f:
+            f.write(data + '\n')
+
+    def eclasses(self):
+        return eclass_cache.cache(self.eclass_dir).eclasses.items()
+
+    def test_bundle(self):
+        cache = EclassFuncCache(self.cache_dir)
+        path = cache.bundle(self.eclasses())
+        self.assertTrue(path.startswith(self.cache_dir))
+        with open(path) as f:
+            data = f.read()
+        self.assertIn('__preloaded_eclass_foo() {\nfoo_src_compile', data)
+        self.assertIn('PKGCORE_PRELOADED_ECLASSES[bar]=__preloaded_eclass_bar', data)
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (0, 1))
+
+        # ordering doesn't matter, and other instances share the bundles
+        other = EclassFuncCache(self.cache_dir)
+        self.assertEqual(other.bundle(reversed(self.eclasses())), path)
+        self.assertEqual((other.stats.hits, other.stats.misses), (1, 0))
+        self.assertTrue(other.stats.time_saved > 0)
+
+        # modified eclasses get a new bundle
+        self.write('bar', 'IUSE="modified"')
+        self.assertNotEqual(cache.bundle(self.eclasses()), path)
+        self.assertEqual(cache.stats.misses, 2)
+
+    def test_invalid(self):
+        cache = EclassFuncCache(self.cache_dir)
+        self.write('bar', 'bar() {')
+        self.assertIdentical(cache.bundle(self.eclasses()), None)
+        self.assertEqual(listdir_files(self.cache_dir), [])
+
+    def test_prune(self):
+        cache = EclassFuncCache(self.cache_dir)
+        cache.max_bundles = 2
+        paths = []
+        for i in xrange(3):
+            self.write('bar', 'IUSE="%i"' % i)
+            path = cache.bundle(self.eclasses())
+            os.utime(path, (i, i))
+            paths.append(path)
+        self.assertEqual(sorted(listdir_files(self.cache_dir)),
+                         sorted(os.path.basename(x) for x in paths[1:]))
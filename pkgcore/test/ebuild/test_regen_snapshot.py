@@ -0,0 +1,138 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+import subprocess
+
+from snakeoil.osutils import pjoin, ensure_dirs
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild import eclass_cache, regen_snapshot
+from pkgcore.test import SkipTest, TestCase
+
+
+class FakePkg(object):
+
+    def __init__(self, location, cpvstr):
+        self.cpvstr = cpvstr
+        cat, pv = cpvstr.split('/')
+        self.path = pjoin(location, cat, 'pkg', pv + '.ebuild')
+
+
+class FakeRepo(object):
+
+    def __init__(self, location, cpvs):
+        self.location = location
+        self.eclass_cache = eclass_cache.cache(pjoin(location, 'eclass'))
+        self.pkgs = [FakePkg(location, x) for x in cpvs]
+
+    def __iter__(self):
+        return iter(self.pkgs)
+
+
+class TestIncrementalRegen(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.repo_dir = pjoin(self.dir, 'repo')
+        self.snapshot = pjoin(self.dir, 'snapshot')
+        self.inherits = {'cat/pkg-1': ('foo',), 'cat/pkg-2': ('bar', 'foo'),
+                         'cat/pkg-3': ()}
+        ensure_dirs(pjoin(self.repo_dir, 'eclass'))
+        ensure_dirs(pjoin(self.repo_dir, 'cat', 'pkg'))
+        for eclass in ('foo', 'bar'):
+            self.write(pjoin('eclass', eclass + '.eclass'), eclass, mtime=100)
+        for cpv in self.inherits:
+            self.write_ebuild(cpv, cpv)
+
+    def write(self, path, data, mtime=None):
+        path = pjoin(self.repo_dir, path)
+        with open(path, 'w') as f:
+            f.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def write_ebuild(self, cpv, data, mtime=100):
+        cat, pv = cpv.split('/')
+        self.write(pjoin(cat, 'pkg', pv + '.ebuild'), data, mtime=mtime)
+
+    def regen(self, **kwds):
+        """Run a fake regen, returning the cpvs it visited."""
+        repo = FakeRepo(self.repo_dir, sorted(self.inherits))
+        tracker = regen_snapshot.IncrementalRegen(repo, self.snapshot, **kwds)
+        visited = []
+        for pkg in tracker:
+            state = tracker.ebuild_state(pkg)
+            data = {'_eclasses_': dict.fromkeys(self.inherits[pkg.cpvstr])}
+            tracker.record(pkg, state, data)
+            visited.append(pkg.cpvstr)
+        tracker.finish()
+        return visited
+
+    def test_no_snapshot(self):
+        self.assertEqual(self.regen(), sorted(self.inherits))
+        snapshot = regen_snapshot.Snapshot.load(self.snapshot)
+        self.assertEqual(sorted(snapshot.eclasses), ['bar', 'foo'])
+        self.assertEqual(snapshot.ebuilds['cat/pkg-2'][3], ('bar', 'foo'))
+        # non-incremental runs visit everything but still record a snapshot
+        self.assertEqual(self.regen(incremental=False), sorted(self.inherits))
+        self.assertEqual(self.regen(), [])
+
+    def test_changes(self):
+        self.regen()
+        self.assertEqual(self.regen(), [])
+
+        # touched but unmodified files don't count as changes
+        self.write_ebuild('cat/pkg-3', 'cat/pkg-3', mtime=200)
+        self.write(pjoin('eclass', 'bar.eclass'), 'bar', mtime=200)
+        self.assertEqual(self.regen(), [])
+
+        self.write_ebuild('cat/pkg-3', 'modified', mtime=300)
+        self.assertEqual(self.regen(), ['cat/pkg-3'])
+        self.assertEqual(self.regen(), [])
+
+        # eclass changes expand to every ebuild inheriting them
+        self.write(pjoin('eclass', 'foo.eclass'), 'modified', mtime=300)
+        self.assertEqual(self.regen(), ['cat/pkg-1', 'cat/pkg-2'])
+        self.write(pjoin('eclass', 'bar.eclass'), 'modified', mtime=300)
+        self.assertEqual(self.regen(), ['cat/pkg-2'])
+        os.unlink(pjoin(self.repo_dir, 'eclass', 'bar.eclass'))
+        self.assertEqual(self.regen(), ['cat/pkg-2'])
+
+        # new packages are always visited; failed ones are retried
+        self.inherits['cat/pkg-4'] = ()
+        self.write_ebuild('cat/pkg-4', 'cat/pkg-4')
+        repo = FakeRepo(self.repo_dir, sorted(self.inherits))
+        tracker = regen_snapshot.IncrementalRegen(repo, self.snapshot)
+        self.assertEqual([x.cpvstr for x in tracker], ['cat/pkg-4'])
+        tracker.finish()
+        self.assertEqual(self.regen(), ['cat/pkg-4'])
+        self.assertEqual(self.regen(), [])
+
+    def git(self, *args):
+        with open(os.devnull, 'w') as null:
+            subprocess.check_call(
+                ['git', '-c', 'user.name=test', '-c', 'user.email=test@test',
+                 '-C', self.dir] + list(args), stdout=null, stderr=null)
+
+    def test_git_subdir(self):
+        # the repo lives in a subdirectory of the git checkout
+        try:
+            self.git('init', '-q')
+        except EnvironmentError:
+            raise SkipTest("git isn't available")
+        self.git('add', 'repo')
+        self.git('commit', '-q', '-m', 'initial')
+        self.assertEqual(self.regen(), sorted(self.inherits))
+
+        self.write_ebuild('cat/pkg-3', 'modified')
+        self.write(pjoin('eclass', 'bar.eclass'), 'modified', mtime=100)
+        self.git('commit', '-q', '-a', '-m', 'changes')
+        self.assertEqual(
+            self.regen(git_range='HEAD~1..HEAD'), ['cat/pkg-2', 'cat/pkg-3'])
+        self.assertEqual(self.regen(git_range='HEAD..HEAD'), [])
+
+    def test_invalid_snapshot(self):
+        with open(self.snapshot, 'w') as f:
+            f.write('garbage\n')
+        self.assertEqual(self.regen(), sorted(self.inherits))
@@ -201,6 +201,24 @@ class UnconfiguredTreeTest(TempDirMixin):
             atom('<just/newer-than-42')]),
             sorted(repo.default_visibility_limiters))
 
+    def test_regen_tracker(self):
+        snapshots = pjoin(self.dir, 'snapshots')
+        cache = mock.Mock(
+            readonly=False, location=pjoin(self.dir, 'metadata', 'md5-cache'))
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        with mock.patch('pkgcore.ebuild.const.REGEN_SNAPSHOT_PATH', snapshots):
+            # plain regens don't bother recording a snapshot
+            self.assertIdentical(repo._regen_tracker(), None)
+            tracker = repo._regen_tracker(incremental=True)
+            self.assertTrue(tracker.path.startswith(snapshots + os.sep))
+            tracker.finish()
+            self.assertTrue(os.path.exists(tracker.path))
+            self.assertFalse(os.path.exists(cache.location + '.regen-snapshot'))
+            # but keep an existing one current
+            tracker = repo._regen_tracker(force=True)
+            self.assertTrue(tracker.path.startswith(snapshots + os.sep))
+            self.assertIdentical(tracker._old, None)
+
 
 class SlavedTreeTest(UnconfiguredTreeTest):
 
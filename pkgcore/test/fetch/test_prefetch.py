@@ -0,0 +1,81 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import threading
+
+from pkgcore.fetch import base, errors, fetchable
+from pkgcore.fetch.prefetch import prefetcher
+from pkgcore.test import TestCase
+
+
+class FakeFetcher(base.fetcher):
+
+    distdir = '/distfiles'
+
+    def __init__(self):
+        self.fetched = []
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+
+    def fetch(self, target):
+        self.release.wait()
+        with self.lock:
+            self.fetched.append(target.filename)
+        if target.filename == 'bad' or (
+                target.filename == 'flaky' and self.fetched.count('flaky') == 1):
+            raise errors.FetchFailed(target.filename, 'no such file')
+        return '%s/%s' % (self.distdir, target.filename)
+
+    def get_storage_path(self):
+        return self.distdir
+
+
+class TestPrefetcher(TestCase):
+
+    def setUp(self):
+        self.fetcher = FakeFetcher()
+        self.prefetch = prefetcher(self.fetcher, threads=2)
+
+    def tearDown(self):
+        self.fetcher.release.set()
+        self.prefetch.shutdown()
+
+    def mk(self, filename):
+        return fetchable(filename, uri=('http://example.com/' + filename,))
+
+    def test_queue(self):
+        files = [self.mk(x) for x in ('a', 'b', 'bad', 'a')]
+        self.prefetch.queue(files)
+        self.assertEqual(self.fetcher.fetched, [])
+        self.fetcher.release.set()
+        self.assertEqual(self.prefetch(files[1]), '/distfiles/b')
+        self.assertRaises(errors.FetchFailed, self.prefetch, files[2])
+        self.assertEqual(self.prefetch(files[0]), '/distfiles/a')
+        self.assertEqual(self.prefetch(files[3]), '/distfiles/a')
+        # each file is fetched once; failures are retried in the foreground
+        self.assertEqual(sorted(self.fetcher.fetched), ['a', 'b', 'bad', 'bad'])
+
+        # files that weren't queued are fetched directly
+        self.assertEqual(self.prefetch(self.mk('c')), '/distfiles/c')
+        self.assertEqual(self.fetcher.fetched.count('c'), 1)
+        self.assertEqual(self.prefetch.distdir, '/distfiles')
+        self.assertEqual(self.prefetch.get_storage_path(), '/distfiles')
+
+    def test_shutdown(self):
+        files = [self.mk(str(x)) for x in xrange(10)]
+        self.prefetch.queue(files)
+        self.fetcher.release.set()
+        self.prefetch.shutdown()
+        # dropped files are fetched on demand
+        for x in files:
+            self.assertEqual(self.prefetch(x), '/distfiles/' + x.filename)
+        self.assertEqual(sorted(self.fetcher.fetched), sorted(x.filename for x in files))
+
+    def test_transient_failure(self):
+        flaky = self.mk('flaky')
+        self.prefetch.queue([flaky])
+        self.fetcher.release.set()
+        # the background fetch failed, the foreground retry doesn't
+        self.assertEqual(self.prefetch(flaky), '/distfiles/flaky')
+        self.assertEqual(self.prefetch(flaky), '/distfiles/flaky')
+        self.assertEqual(self.fetcher.fetched, ['flaky', 'flaky'])
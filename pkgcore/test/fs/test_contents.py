@@ -309,6 +309,114 @@ class TestContentsSet(TestCase):
         check_it({(1,1):[f1, f4], (1,2):[f2], (2,1):[f3]})
 
 
+class TestPackedContentsSet(TestCase):
+
+    def setUp(self):
+        self.parsed = []
+        self.entries = [
+            ("/usr/bin/foo", "obj", ""), ("/usr/bin", "dir", ""),
+            ("/usr", "dir", ""), ("/usr/bin/bar", "sym", "foo"),
+            ("/run/fifo", "fif", ""),
+        ]
+
+    def parse(self, location, kind, data):
+        self.parsed.append(location)
+        if kind == "obj":
+            return mk_file(location)
+        elif kind == "dir":
+            return mk_dir(location)
+        elif kind == "sym":
+            return mk_link(location, data)
+        return mk_fifo(location)
+
+    def mk_cset(self, entries=None, mutable=True):
+        if entries is None:
+            entries = self.entries
+        return contents.PackedContentsSet(entries, self.parse, mutable=mutable)
+
+    def test_lookups(self):
+        cs = self.mk_cset()
+        self.assertEqual(len(cs), 5)
+        self.assertTrue("/usr/bin/" in cs)
+        self.assertTrue(mk_dir("/usr") in cs)
+        self.assertFalse("/usr/b" in cs)
+        self.assertFalse("/" in cs)
+        self.assertFalse("/zzz" in cs)
+        self.assertEqual(sorted(cs.iterlocations()), sorted(x[0] for x in self.entries))
+        self.assertEqual(self.parsed, [])
+        self.assertEqual(cs["/usr/bin/bar"], mk_link("/usr/bin/bar", "foo"))
+        self.assertRaises(KeyError, cs.__getitem__, "/usr/b")
+        self.assertEqual(
+            cs, contents.contentsSet(self.parse(*x) for x in self.entries))
+        self.assertEqual(
+            self.mk_cset([("/a", "dir", ""), ("/a", "obj", "")])["/a"],
+            mk_file("/a"))
+
+    def test_kinds(self):
+        cs = self.mk_cset()
+        cs.add(mk_file("/usr/bin/baz"))
+        self.assertEqual(sorted(x.location for x in cs.iterfiles()),
+                         ["/usr/bin/baz", "/usr/bin/foo"])
+        self.assertEqual(self.parsed, ["/usr/bin/foo"])
+        self.assertEqual(sorted(x.location for x in cs.iterdirs(invert=True)),
+                         ["/run/fifo", "/usr/bin/bar", "/usr/bin/baz",
+                          "/usr/bin/foo"])
+        self.assertEqual([x.location for x in cs.links()], ["/usr/bin/bar"])
+        self.assertEqual([x.location for x in cs.fifos()], ["/run/fifo"])
+        self.assertEqual(cs.devs(), [])
+
+    def test_modifications(self):
+        cs = self.mk_cset()
+        cs.add(mk_file("/usr/bin/baz"))
+        # replacing an entry shadows the packed version
+        cs.add(mk_file("/usr/bin"))
+        self.assertEqual(len(cs), 6)
+        self.assertTrue(cs["/usr/bin"].is_reg)
+        cs.remove("/usr/bin")
+        self.assertNotIn("/usr/bin", cs)
+        self.assertRaises(KeyError, cs.remove, "/usr/bin")
+        cs.discard("/usr/bin")
+        cs.discard(mk_dir("/usr"))
+        cs.remove(mk_file("/usr/bin/baz"))
+        self.assertEqual(sorted(cs.iterlocations()),
+                         ["/run/fifo", "/usr/bin/bar", "/usr/bin/foo"])
+        self.assertEqual(len(cs), 3)
+        cs.clear()
+        self.assertEqual(len(cs), 0)
+        self.assertEqual(list(cs), [])
+
+        cs = self.mk_cset(mutable=False)
+        self.assertRaises(AttributeError, cs.add, mk_file("/foo"))
+
+    def test_clone(self):
+        cs = self.mk_cset(mutable=False)
+        cs2 = cs.clone()
+        self.assertTrue(cs2.mutable)
+        cs2.remove("/usr")
+        cs2.add(mk_dir("/etc"))
+        self.assertIn("/usr", cs)
+        self.assertNotIn("/etc", cs)
+        self.assertEqual(len(cs.clone(empty=True)), 0)
+
+    def test_difference(self):
+        cs = self.mk_cset()
+        cs.add(mk_dir("/etc"))
+        small = contents.contentsSet([mk_dir("/usr"), mk_dir("/etc")])
+        large = contents.contentsSet(
+            mk_dir(x) for x in ("/a", "/b", "/c", "/d", "/e", "/f", "/usr/bin"))
+        self.assertEqual(
+            sorted(cs.difference(small).iterlocations()),
+            ["/run/fifo", "/usr/bin", "/usr/bin/bar", "/usr/bin/foo"])
+        self.assertEqual(
+            sorted(cs.difference(large).iterlocations()),
+            ["/etc", "/run/fifo", "/usr", "/usr/bin/bar", "/usr/bin/foo"])
+        self.assertEqual(
+            sorted(cs.difference(["/usr/bin/bar/"]).iterlocations()),
+            ["/etc", "/run/fifo", "/usr", "/usr/bin", "/usr/bin/foo"])
+        self.assertEqual(len(cs), 6)
+        self.assertEqual(self.parsed, [])
+
+
 class Test_offset_rewriting(TestCase):
 
     change_offset = staticmethod(contents.change_offset_rewriter)
@@ -222,6 +222,59 @@ class Test_merge_contents(ContentsMixin):
         cset = contents.contentsSet([d])
         self.assertRaises(ops.CannotOverwrite, ops.merge_contents, cset)
 
+    def gen_files(self, count):
+        src = self.gen_dir("src")
+        os.mkdir(pjoin(src, "dir"))
+        for x in xrange(count):
+            with open(pjoin(src, "dir", str(x)), "w") as f:
+                f.write("%i\n" % (x,) * x)
+        os.link(pjoin(src, "dir", "1"), pjoin(src, "dir", "link"))
+        return src, livefs.scan(src, offset=src)
+
+    def test_threads(self):
+        src, cset = self.gen_files(ops._listdir_min * 2)
+        for threads in (1, 4):
+            dest = self.gen_dir("dest")
+            os.mkdir(pjoin(dest, "dir"))
+            for x in xrange(0, ops._listdir_min * 2, 3):
+                with open(pjoin(dest, "dir", str(x)), "w") as f:
+                    f.write("replaced" * 100)
+            self.assertTrue(ops.merge_contents(cset, offset=dest, threads=threads))
+            self.assertEqual(livefs.scan(src, offset=src),
+                             livefs.scan(dest, offset=dest))
+            for x in os.listdir(pjoin(src, "dir")):
+                with open(pjoin(src, "dir", x)) as f1, \
+                        open(pjoin(dest, "dir", x)) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+            self.assertEqual(os.stat(pjoin(dest, "dir", "1")).st_ino,
+                             os.stat(pjoin(dest, "dir", "link")).st_ino)
+
+    def test_file_over_dir(self):
+        src, cset = self.gen_files(3)
+        dest = self.gen_dir("dest")
+        os.makedirs(pjoin(dest, "dir", "2"))
+        self.assertRaises(ops.CannotOverwrite, ops.merge_contents,
+                          cset, offset=dest)
+
+    def test_link_sources(self):
+        src, cset = self.gen_files(3)
+        dest = self.gen_dir("dest")
+        self.assertTrue(ops.merge_contents(cset, offset=dest, link_sources=True))
+        self.assertEqual(os.stat(pjoin(src, "dir", "2")).st_ino,
+                         os.stat(pjoin(dest, "dir", "2")).st_ino)
+
+    def test_copy_fallback(self):
+        src, cset = self.gen_files(3)
+        dest = self.gen_dir("dest")
+        orig = ops._copy_file_range
+        try:
+            ops._copy_file_range = None
+            self.assertTrue(ops.merge_contents(cset, offset=dest))
+        finally:
+            ops._copy_file_range = orig
+        with open(pjoin(dest, "dir", "2")) as f:
+            self.assertEqual(f.read(), "2\n2\n")
+
 
 class Test_unmerge_contents(ContentsMixin):
 
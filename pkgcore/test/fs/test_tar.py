@@ -0,0 +1,143 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+from StringIO import StringIO
+
+from snakeoil import process
+from snakeoil.osutils import pjoin
+from snakeoil.tar import tarfile
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.fs import livefs, tar
+from pkgcore.test import TestCase, SkipTest
+
+
+class TestWriteStream(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.root = pjoin(self.dir, 'root')
+        os.makedirs(pjoin(self.root, 'usr', 'bin'))
+        with open(pjoin(self.root, 'usr', 'bin', 'foo'), 'w') as f:
+            f.write('foo\n' * 1024)
+        os.link(pjoin(self.root, 'usr', 'bin', 'foo'),
+                pjoin(self.root, 'usr', 'bin', 'bar'))
+        os.symlink('foo', pjoin(self.root, 'usr', 'bin', 'baz'))
+
+    def write(self, source, **kwargs):
+        path = pjoin(self.dir, 'out.tar')
+        with open(path, 'wb') as f:
+            tar.write_stream(source, f, **kwargs)
+        return path
+
+    def assertArchive(self, path, mode):
+        with tarfile.open(path, mode) as t:
+            members = {x.name: x for x in t.getmembers()}
+            self.assertEqual(
+                sorted(members),
+                ['./usr', './usr/bin', './usr/bin/bar', './usr/bin/baz',
+                 './usr/bin/foo'])
+            self.assertTrue(members['./usr/bin/baz'].issym())
+            # one of the hardlinked pair is stored, the other links to it
+            links = [x for x in members.itervalues() if x.islnk()]
+            self.assertEqual(len(links), 1)
+            regular = [x for x in members.itervalues() if x.isreg()]
+            self.assertEqual(len(regular), 1)
+            self.assertEqual(t.extractfile(regular[0]).read(), 'foo\n' * 1024)
+
+    def test_compressors(self):
+        source = livefs.scan(self.root, offset=self.root)
+        for compressor, mode in (('bzip2', 'r:bz2'), ('bz2', 'r:bz2'),
+                                 ('gzip', 'r:gz'), (None, 'r:')):
+            self.assertArchive(self.write(source, compressor=compressor), mode)
+
+    def test_iterable(self):
+        source = livefs.iter_scan(self.root, offset=self.root)
+        self.assertArchive(self.write(source), 'r:bz2')
+
+    def test_process_compressor(self):
+        try:
+            binary = process.find_binary('bzip2')
+        except process.CommandNotFound:
+            raise SkipTest('bzip2 binary is unavailable')
+        source = livefs.scan(self.root, offset=self.root)
+        compressor = lambda handle, level, parallelize: \
+            tar._process_compressor(handle, [binary, '-%ic' % level])
+        self.assertArchive(self.write(source, compressor=compressor), 'r:bz2')
+
+        compressor = lambda handle, level, parallelize: \
+            tar._process_compressor(handle, [binary, '-%ic' % level, '--bogus'])
+        self.assertRaises(EnvironmentError, self.write, source, compressor=compressor)
+
+
+class TestConvertArchive(TempDirMixin, TestCase):
+
+    def archive(self, *members):
+        path = pjoin(self.dir, 'test.tar')
+        with tarfile.open(path, 'w') as t:
+            for name, kind, extra in members:
+                info = tarfile.TarInfo(name)
+                info.type = kind
+                if kind in (tarfile.SYMTYPE, tarfile.LNKTYPE):
+                    info.linkname = extra
+                    t.addfile(info)
+                elif kind == tarfile.REGTYPE:
+                    info.size = len(extra)
+                    t.addfile(info, StringIO(extra))
+                else:
+                    t.addfile(info)
+        return path
+
+    def convert(self, path):
+        return tar.convert_archive(tarfile.open(path, 'r'))
+
+    def test_symlinks(self):
+        path = self.archive(
+            ('./usr/lib/b', tarfile.REGTYPE, 'b'),
+            ('./lib/a', tarfile.REGTYPE, 'a'),
+            ('./lib', tarfile.SYMTYPE, 'usr/lib'),
+            ('./lib/x', tarfile.SYMTYPE, '../opt'),
+            ('./lib/x/c', tarfile.REGTYPE, 'c'),
+            ('./usr/lib/d', tarfile.LNKTYPE, './lib/a'),
+            ('./usr', tarfile.DIRTYPE, None),
+        )
+        cset = self.convert(path)
+        self.assertEqual(
+            [(x.location, x.is_dir, x.is_sym) for x in cset],
+            [('/usr', True, False), ('/usr/lib', True, False),
+             ('/usr/opt', True, False), ('/lib', False, True),
+             ('/usr/lib/x', False, True), ('/usr/lib/b', False, False),
+             ('/usr/lib/a', False, False), ('/usr/opt/c', False, False),
+             ('/usr/lib/d', False, False)])
+        self.assertEqual(cset['/usr/lib/x'].resolved_target, '/usr/opt')
+        self.assertEqual(cset['/usr/lib/d'].data.bytes_fileobj().read(), 'a')
+        self.assertEqual(cset['/usr/lib/d'].inode, cset['/usr/lib/a'].inode)
+
+    def test_symlink_loop(self):
+        path = self.archive(
+            ('./a', tarfile.SYMTYPE, 'b'),
+            ('./b', tarfile.SYMTYPE, 'a'),
+            ('./a/c', tarfile.REGTYPE, 'c'),
+        )
+        self.assertEqual(
+            sorted(x.location for x in self.convert(path)), ['/a', '/a/c', '/b'])
+
+
+class TestExtractFiles(TestWriteStream):
+
+    def test_extract_files(self):
+        path = pjoin(self.dir, 'out.tbz2')
+        tar.write_set(livefs.scan(self.root, offset=self.root), path)
+        cset = tar.generate_contents(path)
+        image = pjoin(self.dir, 'image')
+        os.makedirs(pjoin(image, 'usr', 'bin'))
+        seen = []
+        written = tar.extract_files(
+            cset.iterfiles(), image, ensure_perms=seen.append)
+        self.assertEqual(sorted(x.location for x in written),
+                         [pjoin(image, 'usr', 'bin', x) for x in ('bar', 'foo')])
+        self.assertEqual(seen, written)
+        for name in ('bar', 'foo'):
+            with open(pjoin(image, 'usr', 'bin', name)) as f:
+                self.assertEqual(f.read(), 'foo\n' * 1024)
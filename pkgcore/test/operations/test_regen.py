@@ -0,0 +1,98 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import threading
+
+from pkgcore.operations import observer, regen
+from pkgcore.test import TestCase
+
+
+class FakeHelper(object):
+
+    def __init__(self, seen, fail=()):
+        self.seen = seen
+        self.fail = fail
+        self.finished = False
+
+    def __call__(self, pkg):
+        if pkg in self.fail:
+            raise ValueError(pkg)
+        self.seen.append((threading.current_thread().ident, pkg))
+
+    def finish(self):
+        self.finished = True
+
+
+class FakeRepo(object):
+
+    def __init__(self, pkgs, fail=()):
+        self.pkgs = list(pkgs)
+        self.fail = fail
+        self.seen = []
+        self.helpers = []
+
+    def __iter__(self):
+        return iter(self.pkgs)
+
+    def _regen_operation_helper(self, **kwds):
+        helper = FakeHelper(self.seen, self.fail)
+        self.helpers.append(helper)
+        return helper
+
+
+class TestWorkQueues(TestCase):
+
+    def test_split(self):
+        queues = regen._WorkQueues(range(10), 3)
+        self.assertEqual(len(queues), 3)
+        self.assertEqual([list(x) for x in queues.queues],
+                         [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]])
+        # never more workers than items
+        self.assertEqual(len(regen._WorkQueues(range(2), 8)), 2)
+        self.assertEqual(len(regen._WorkQueues([], 8)), 1)
+
+    def test_stealing(self):
+        queues = regen._WorkQueues(range(10), 3)
+        # worker 1 drains its own run first, then steals from the tails
+        # of the longest remaining queues.
+        self.assertEqual(list(queues.iter_worker(1)),
+                         [4, 5, 6, 3, 2, 9, 1, 8, 0, 7])
+        self.assertEqual(list(queues.iter_worker(0)), [])
+
+
+class TestRegenRepository(TestCase):
+
+    def test_serial(self):
+        repo = FakeRepo(range(5), fail=(3,))
+        stats = regen.regen_repository(repo, observer.null_output())
+        self.assertEqual(len(stats), 1)
+        self.assertEqual((stats[0].count, stats[0].errors), (5, 1))
+        self.assertEqual([x[1] for x in repo.seen], [0, 1, 2, 4])
+        self.assertTrue(all(x.finished for x in repo.helpers))
+
+    def test_threaded(self):
+        repo = FakeRepo(range(100))
+        stats = regen.regen_repository(repo, observer.null_output(), threads=4)
+        self.assertEqual(len(stats), 4)
+        self.assertEqual(len(repo.helpers), 4)
+        self.assertEqual(sum(x.count for x in stats), 100)
+        self.assertEqual(sorted(x[1] for x in repo.seen), range(100))
+        self.assertTrue(all(x.finished for x in repo.helpers))
+
+    def test_batched(self):
+        class BatchHelper(FakeHelper):
+            batch_size = 3
+
+            def __init__(self, *args, **kwds):
+                FakeHelper.__init__(self, *args, **kwds)
+                self.batches = []
+
+            def regen_batch(self, pkgs):
+                self.batches.append(list(pkgs))
+                return [ValueError(x) if x in self.fail else x for x in pkgs]
+
+        helper = BatchHelper([], fail=(4,))
+        stats = regen.RegenStats(0)
+        regen.regen_iter(range(8), helper, observer.null_output(), stats=stats)
+        self.assertEqual(helper.batches, [[0, 1, 2], [3, 4, 5], [6, 7]])
+        self.assertEqual((stats.count, stats.errors), (8, 1))
@@ -0,0 +1,70 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.repository.misc import caching_repo
+from pkgcore.test import TestCase
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+
+class TestCachingRepo(TestCase):
+
+    def setUp(self):
+        self.raw = FakeRepo()
+        self.raw.pkgs = [FakePkg('dev-libs/%s-%i' % (x, y), repo=self.raw)
+                         for x in 'abcd' for y in (1, 2)]
+
+    def query(self, repo, name):
+        l = repo.match(atom('dev-libs/%s' % (name,)))
+        return list(l)
+
+    def test_unbounded(self):
+        repo = caching_repo(self.raw, iter)
+        # no recency tracking without limits
+        self.assertIdentical(type(repo.__cache__), dict)
+        a = repo.match(atom('dev-libs/a'))
+        self.assertIdentical(repo.match(atom('dev-libs/a')), a)
+        self.assertEqual([x.cpvstr for x in a], ['dev-libs/a-1', 'dev-libs/a-2'])
+        for x in 'bcd':
+            self.query(repo, x)
+        self.assertEqual((repo.stats.hits, repo.stats.misses, repo.stats.evictions),
+                         (1, 4, 0))
+        repo.clear()
+        self.assertNotIdentical(repo.match(atom('dev-libs/a')), a)
+
+    def test_max_entries(self):
+        repo = caching_repo(self.raw, iter, max_entries=2)
+        a = repo.match(atom('dev-libs/a'))
+        self.query(repo, 'b')
+        self.assertIdentical(repo.match(atom('dev-libs/a')), a)
+        # b is the least recently used
+        self.query(repo, 'c')
+        self.assertEqual(repo.stats.evictions, 1)
+        self.assertIdentical(repo.match(atom('dev-libs/a')), a)
+        self.query(repo, 'b')
+        self.assertEqual(repo.stats.misses, 4)
+        self.assertEqual(repo.stats.evictions, 2)
+
+    def test_max_pkgs(self):
+        repo = caching_repo(self.raw, iter, max_pkgs=3)
+        a = repo.match(atom('dev-libs/a'))
+        self.query(repo, 'a')
+        # results are sized as far as they were consumed
+        self.query(repo, 'b')
+        self.assertEqual(repo.stats.evictions, 0)
+        self.query(repo, 'b')
+        self.assertEqual(repo.stats.evictions, 0)
+        self.query(repo, 'c')
+        self.assertEqual(repo.stats.evictions, 1)
+        self.assertNotIdentical(repo.match(atom('dev-libs/a')), a)
+
+    def test_pinned(self):
+        pinned = set()
+        repo = caching_repo(self.raw, iter, max_entries=1, pinned=pinned.__contains__)
+        a = repo.match(atom('dev-libs/a'))
+        pinned.add(list(a)[1])
+        self.query(repo, 'b')
+        self.query(repo, 'c')
+        self.assertIdentical(repo.match(atom('dev-libs/a')), a)
+        self.assertEqual(repo.stats.evictions, 1)
+        self.assertEqual(str(repo.stats), '1 hits, 3 misses (25.0% hit rate), 1 evictions')
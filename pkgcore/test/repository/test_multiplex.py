@@ -4,7 +4,7 @@
 from collections import OrderedDict
 from functools import partial
 
-from pkgcore.repository.multiplex import tree
+from pkgcore.repository.multiplex import tree, key_sorter, merge_sorted
 from pkgcore.repository.util import SimpleTree
 from pkgcore.restrictions import packages, values
 from pkgcore.test import TestCase
@@ -63,6 +63,31 @@ class TestMultiplex(TestCase):
         self.assertEqual(
             list(x.cpvstr for x in self.ctree.itermatch(packages.AlwaysTrue, sorter=rev_sorted)),
             rev_sorted(self.tree1_list + self.tree2_list))
+        expected = sorted(self.tree1_list + self.tree2_list)
+        for sorter in (sorted, key_sorter(), lambda l: sorted(l)):
+            self.assertEqual(
+                list(x.cpvstr for x in self.ctree.itermatch(packages.AlwaysTrue, sorter=sorter)),
+                expected)
+        self.assertEqual(
+            list(x.cpvstr for x in self.ctree.itermatch(
+                packages.AlwaysTrue, sorter=key_sorter(reverse=True))),
+            expected[::-1])
+
+    def test_merge_sorted(self):
+        self.assertEqual(list(merge_sorted([])), [])
+        self.assertEqual(
+            list(merge_sorted([[1, 4, 7], [], [2, 5, 8], [3, 6, 9, 10]])),
+            range(1, 11))
+        self.assertEqual(
+            list(merge_sorted([[7, 4, 1], [8, 5, 2]], reverse=True)),
+            [8, 7, 5, 4, 2, 1])
+        # equal items keep the order of their streams
+        self.assertEqual(
+            list(merge_sorted([["b1", "a1"], ["c2", "a2"]], key=len, reverse=True)),
+            ["b1", "a1", "c2", "a2"])
+        self.assertEqual(
+            list(merge_sorted([["a", "bb"], ["c", "dd"]], key=len)),
+            ["a", "c", "bb", "dd"])
 
     def test_install(self):
         raise Exception()
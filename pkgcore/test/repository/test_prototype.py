@@ -10,6 +10,7 @@ from pkgcore.ebuild.atom import atom
 from pkgcore.ebuild.cpv import versioned_CPV
 from pkgcore.operations.repo import operations
 from pkgcore.package.mutated import MutatedPkg
+from pkgcore.repository.prototype import NameIndex, regex_prefix
 from pkgcore.repository.util import SimpleTree
 from pkgcore.restrictions import packages, values, boolean
 from pkgcore.test import TestCase, malleable_obj
@@ -208,6 +209,44 @@ class TestPrototype(TestCase):
         self.repo.notify_add_package(pkg)
         self.assertIn((pkg.category, pkg.package), self.repo.versions)
 
+    def test_name_index_queries(self):
+        def cps(restrict):
+            return sorted(set(
+                "%s/%s" % (x.category, x.package) for x in self.repo.itermatch(restrict)))
+
+        self.assertEqual(
+            cps(packages.PackageRestriction(
+                "category", values.StrGlobMatch("dev-u"))),
+            ["dev-util/bsdiff", "dev-util/diffball"])
+        self.assertEqual(
+            cps(packages.AndRestriction(
+                packages.PackageRestriction(
+                    "category", values.StrRegex(r"^dev\-.*$", match=True)),
+                packages.PackageRestriction(
+                    "package", values.StrRegex(r"^.*f.*$", match=True)))),
+            ["dev-lib/fake", "dev-util/bsdiff", "dev-util/diffball"])
+        # exact names mixed with other restrictions
+        self.assertEqual(
+            cps(packages.OrRestriction(
+                packages.PackageRestriction(
+                    "package", values.StrExactMatch("diff")),
+                packages.PackageRestriction(
+                    "package", values.StrExactMatch("fake")),
+                packages.PackageRestriction(
+                    "package", values.StrGlobMatch("bs")))),
+            ["dev-lib/fake", "dev-util/bsdiff"])
+        self.assertEqual(
+            cps(packages.PackageRestriction(
+                "package", values.StrGlobMatch("diff", negate=True))),
+            ["dev-lib/fake", "dev-util/bsdiff"])
+
+        # the index follows additions
+        self.repo.notify_add_package(versioned_CPV("dev-util/diffstat-1.0"))
+        self.assertEqual(
+            cps(packages.PackageRestriction(
+                "package", values.StrGlobMatch("diff"))),
+            ["dev-util/diffball", "dev-util/diffstat"])
+
     def _simple_redirect_test(self, attr, arg1='=dev-util/diffball-1.0', arg2=None):
         l = []
         uniq_obj = object()
@@ -246,3 +285,32 @@ class TestPrototype(TestCase):
     test_replace = post_curry(_simple_redirect_test, 'replace', arg2='dev-util/diffball-1.1')
     test_uninstall = post_curry(_simple_redirect_test, 'uninstall')
     test_install = post_curry(_simple_redirect_test, 'install')
+
+
+class TestNameIndex(TestCase):
+
+    def test_regex_prefix(self):
+        for regex, prefix in (
+                (r"^dev\-.*$", "dev-"), (r"foo", "foo"), (r"^.*foo", ""),
+                (r"^fooa?", "foo"), (r"^fooa*", "foo"), (r"^foo+", "foo"),
+                (r"^ab{1,2}", "a"), (r"^foo|bar", ""), (r"^a\dz", "a"),
+                (r"^a[bc]", "a"), (r"(?i)foo", "")):
+            self.assertEqual(regex_prefix(regex), prefix, regex)
+
+    def test_match(self):
+        index = NameIndex(["foo", "bar", "foobar", "fo", "baz"])
+        self.assertEqual(index.names, ("bar", "baz", "fo", "foo", "foobar"))
+        self.assertEqual(index.match(values.StrExactMatch("foo")), ["foo"])
+        self.assertEqual(index.match(values.StrExactMatch("fooo")), [])
+        self.assertEqual(index.match(values.StrExactMatch("FOO", case_sensitive=False)), ["foo"])
+        self.assertEqual(index.match(values.StrGlobMatch("foo")), ["foo", "foobar"])
+        self.assertEqual(index.match(values.StrGlobMatch("ba", prefix=False)), [])
+        self.assertEqual(index.match(values.StrGlobMatch("ar", prefix=False)), ["bar", "foobar"])
+        self.assertEqual(index.match(values.StrRegex("^fo.$", match=True)), ["foo"])
+        self.assertEqual(index.match(values.StrRegex("o.a")), ["foobar"])
+        self.assertEqual(
+            index.match(values.StrExactMatch("foo", negate=True)),
+            ["bar", "baz", "fo", "foobar"])
+        self.assertEqual(
+            index.match_any([values.StrGlobMatch("ba"), values.StrExactMatch("fo")]),
+            ["bar", "baz", "fo"])
@@ -0,0 +1,95 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import benchmark
+from pkgcore.test import TestCase
+
+
+class TestBenchmark(TempDirMixin, TestCase):
+
+    def write(self, path, data):
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(path, 'w') as f:
+            f.write(data)
+
+    def test_synthetic(self):
+        repo, vdb, atoms = benchmark.synthetic_metadata(
+            chains=2, depth=3, fanout=3, blockers=2, slot_conflicts=2)
+        # two versions of each pkg, and three of each slot of the libraries
+        self.assertEqual(len(repo), 2 * (6 + 5 + 2 * 2 + 2 * 3) + 2 * 2 * 3)
+        self.assertEqual(len(vdb), len(atoms))
+        self.assertIn(atom('bench-chain/chain1_2'), atoms)
+        results = {x.name: x for x in benchmark.run(repo, vdb, atoms, runs=2)}
+        self.assertEqual(sorted(results), sorted(benchmark.scenarios))
+        for result in results.itervalues():
+            self.assertFalse(result.failed, msg=str(result))
+            self.assertEqual(result.runs, 2)
+        # every pkg is upgraded, along with slot 2 of the libraries
+        self.assertEqual(results['upgrade'].ops, len(vdb) + 2)
+        self.assertEqual(results['min-install'].ops, 2)
+        self.assertEqual(results['fresh-install'].ops, len(vdb) + 2)
+
+        baseline = {k: v.to_dict() for k, v in results.iteritems()}
+        self.assertEqual(list(benchmark.compare(baseline, results.values())), [])
+        baseline['upgrade']['best'] /= 2
+        baseline['min-install']['peak_rss'] = 0
+        results['min-install'].peak_rss = 2048
+        self.assertEqual(
+            sorted((x[0].name, x[1])
+                   for x in benchmark.compare(baseline, results.values())),
+            [('min-install', 'peak_rss'), ('upgrade', 'best')])
+        # baselines predating rss tracking only have their times checked
+        del baseline['min-install']['peak_rss']
+        self.assertEqual(
+            [x[0].name for x in benchmark.compare(baseline, results.values())],
+            ['upgrade'])
+
+    def test_snapshot(self):
+        cache = pjoin(self.dir, 'repo', 'metadata', 'md5-cache')
+        self.write(pjoin(cache, 'dev-libs', 'a-1'),
+                   'EAPI=5\nSLOT=0\nRDEPEND=foo? ( dev-libs/b )\nIUSE=+foo\n'
+                   '_md5_=0123\n')
+        self.write(pjoin(cache, 'dev-libs', 'b-1'), 'SLOT=0\n')
+        self.write(pjoin(cache, 'dev-libs', 'c-1'), 'EAPI=9000\nSLOT=0\n')
+        self.write(pjoin(cache, 'dev-libs', 'not-a-pkg'), '')
+        repo = benchmark.load_md5_cache(pjoin(self.dir, 'repo'))
+        self.assertEqual(repo, {
+            'dev-libs/a-1': {'EAPI': '5', 'SLOT': '0', 'IUSE': '+foo',
+                             'RDEPEND': 'foo? ( dev-libs/b )'},
+            'dev-libs/b-1': {'SLOT': '0'}})
+        self.assertEqual(benchmark.load_md5_cache(cache), repo)
+
+        vdb_dir = pjoin(self.dir, 'vdb')
+        self.write(pjoin(vdb_dir, 'dev-libs', 'a-1', 'SLOT'), '0\n')
+        self.write(pjoin(vdb_dir, 'dev-libs', 'a-1', 'USE'), '\n')
+        self.write(pjoin(vdb_dir, 'dev-libs', 'a-1', 'CONTENTS'), '')
+        vdb = benchmark.load_vdb(vdb_dir)
+        self.assertEqual(vdb, {'dev-libs/a-1': {'SLOT': '0', 'USE': ''}})
+        subset = benchmark.installed_subset(repo, 0.5)
+        self.assertEqual(len(subset), 1)
+        self.assertEqual(subset, benchmark.installed_subset(repo, 0.5))
+
+        pkg = benchmark.metadata_repo(repo).match(atom('dev-libs/a'))[0]
+        self.assertEqual([str(x) for x in pkg.rdepends], ['dev-libs/b'])
+        self.assertFalse(pkg.built)
+        pkg = benchmark.metadata_repo(vdb, livefs=True).match(atom('dev-libs/a'))[0]
+        self.assertEqual(pkg.use, frozenset())
+        self.assertTrue(pkg.built)
+        for fork in (True, False):
+            result = benchmark.run_scenario(
+                'fresh-install', repo, vdb, [atom('dev-libs/a')], fork=fork)
+            self.assertEqual((result.ops, result.failed), (2, False))
+            self.assertTrue(result.peak_rss >= 0)
+
+    def test_child_failure(self):
+        self.assertRaises(
+            RuntimeError, benchmark.run_scenario, 'fresh-install', {}, {},
+            [atom('dev-libs/a')], bogus_option=True)
@@ -1,9 +1,11 @@
 # Copyright: 2006-2007 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD
 
+from pkgcore.ebuild.atom import atom
 from pkgcore.resolver.pigeonholes import PigeonHoledSlots
 from pkgcore.restrictions import restriction
 from pkgcore.test import TestCase
+from pkgcore.test.misc import FakePkg
 from pkgcore.test.resolver.test_choice_point import fake_package
 
 
@@ -62,3 +64,33 @@ class SlotTesting(TestCase):
         self.assertFalse([], c.fill_slotting(p2))
         c.remove_slotting(p)
         c.remove_slotting(p2)
+
+    def test_slotted_limiters(self):
+        c = PigeonHoledSlots()
+        p1 = FakePkg('dev-lang/perl-5.18', slot='0')
+        p2 = FakePkg('dev-lang/python-2.7', slot='2.7')
+        p3 = FakePkg('dev-lang/python-3.4', slot='3.4')
+        for p in (p1, p2, p3):
+            self.assertEqual(c.fill_slotting(p), [])
+        self.assertEqual(c.fill_slotting(FakePkg('dev-lang/python-2.7.9', slot='2.7')), [p2])
+        self.assertEqual(c.get_conflicting_slot(FakePkg('dev-lang/python-3.3', slot='3.4')), p3)
+        self.assertEqual(c.find_atom_matches(atom('dev-lang/python')), [p2, p3])
+        self.assertEqual(c.find_atom_matches(atom('dev-lang/python:3.4')), [p3])
+
+        slotted, unslotted = atom('!dev-lang/python:2.7'), atom('!<dev-lang/python-3')
+        self.assertEqual(c.add_limiter(slotted), [p2])
+        self.assertEqual(c.add_limiter(unslotted), [p2])
+        self.assertIn(slotted, c)
+        self.assertEqual(c.check_limiters(p3), [])
+        c.remove_slotting(p2)
+        self.assertEqual(sorted(c.fill_slotting(p2)), sorted([slotted, unslotted]))
+        c.remove_limiter(slotted)
+        self.assertNotIn(slotted, c)
+        self.assertEqual(c.fill_slotting(p2), [unslotted])
+        c.remove_limiter(unslotted)
+        self.assertEqual(c.fill_slotting(p2), [])
+        self.assertIn(p2, c)
+        self.assertEqual(c.limiters, {})
+        for p in (p1, p2, p3):
+            c.remove_slotting(p)
+        self.assertEqual((c.slot_dict, c.slots), ({}, {}))
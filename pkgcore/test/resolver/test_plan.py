@@ -3,9 +3,11 @@
 
 from snakeoil.currying import post_curry
 
-from pkgcore.resolver import plan
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.resolver import min_install_resolver
+from pkgcore.resolver import plan, state
 from pkgcore.test import TestCase
-from pkgcore.test.misc import FakePkg
+from pkgcore.test.misc import FakePkg, FakeRepo
 
 
 class TestPkgSorting(TestCase):
@@ -30,3 +32,78 @@ class TestPkgSorting(TestCase):
 
     test_pkg_sort_lowest = post_curry(check_it, plan.pkg_sort_lowest,
         [11,9,1,6], [1,6,9,11])
+
+
+class TestSolutionCache(TestCase):
+
+    def mk_pkg(self, repo, cpv, depend=''):
+        return FakePkg(cpv, repo=repo, data={'DEPEND': depend})
+
+    def test_failure_reuse(self):
+        repo = FakeRepo(repo_id='gentoo', livefs=False)
+        vdb = FakeRepo(repo_id='vdb', livefs=True)
+        repo.pkgs = [
+            self.mk_pkg(repo, 'app-misc/top-1', '|| ( dev-libs/a dev-libs/b dev-libs/c )'),
+            self.mk_pkg(repo, 'dev-libs/a-1', 'dev-libs/common dev-libs/broken'),
+            self.mk_pkg(repo, 'dev-libs/b-1', 'dev-libs/common dev-libs/broken'),
+            self.mk_pkg(repo, 'dev-libs/c-1', 'dev-libs/common'),
+            self.mk_pkg(repo, 'dev-libs/common-1'),
+            self.mk_pkg(repo, 'dev-libs/broken-1', 'dev-libs/x'),
+            self.mk_pkg(repo, 'dev-libs/x-1', 'dev-libs/missing'),
+        ]
+        resolver = min_install_resolver([vdb], [repo])
+        self.assertEqual(resolver.add_atoms([atom('app-misc/top')]), ())
+        self.assertEqual(
+            [x.pkg.cpvstr for x in resolver.state.iter_ops()],
+            ['dev-libs/common-1', 'dev-libs/c-1', 'app-misc/top-1'])
+        # b's attempt at dev-libs/broken starts from the same plan state a's
+        # did, so the failure is reused instead of walking its deps again.
+        stats = resolver.solution_cache_stats
+        self.assertEqual(stats.hits, 1)
+        self.assertTrue(stats.stored)
+        resolver.free_caches()
+        self.assertEqual(resolver.solution_cache, {})
+
+    def test_fingerprint(self):
+        pkgs = [FakePkg('dev-libs/%s-1' % x) for x in 'abc']
+        s = state.plan_state()
+        empty = s.fingerprint
+        state.add_op(None, pkgs[0]).apply(s)
+        first = s.fingerprint
+        state.add_op(None, pkgs[1]).apply(s)
+        second = s.fingerprint
+        self.assertNotEqual(second, first)
+        s.backtrack(1)
+        self.assertEqual(s.fingerprint, first)
+        state.add_op(None, pkgs[2]).apply(s)
+        other = s.fingerprint
+        s.backtrack(1)
+        state.add_op(None, pkgs[1]).apply(s)
+        self.assertNotEqual(s.fingerprint, other)
+        # same contents as before, same fingerprint
+        self.assertEqual(s.fingerprint, second)
+        s.backtrack(0)
+        self.assertEqual(s.fingerprint, empty)
+
+
+class TestVdbPreload(TestCase):
+
+    def test_load_vdb_state(self):
+        repo = FakeRepo(repo_id='gentoo', livefs=False)
+        vdb = FakeRepo(repo_id='vdb', livefs=True)
+        vdb.pkgs = [
+            FakePkg('dev-libs/a-1', repo=vdb, data={'RDEPEND': 'dev-libs/b'}),
+            FakePkg('dev-libs/b-1', repo=vdb),
+            FakePkg('dev-libs/c-1', repo=vdb, slot='1'),
+            FakePkg('dev-libs/c-2', repo=vdb, slot='2'),
+        ]
+        for threads in (1, 2):
+            resolver = min_install_resolver([vdb], [repo])
+            resolver.load_vdb_state(threads=threads)
+            self.assertTrue(resolver.vdb_preloaded)
+            self.assertEqual(
+                sorted(x.cpvstr for x in resolver.state.pkg_choices),
+                [x.cpvstr for x in vdb.pkgs])
+            # installed pkgs are already in the plan, nothing to do
+            self.assertEqual(resolver.add_atoms([atom('dev-libs/a')]), ())
+            self.assertEqual(list(resolver.state.iter_ops()), [])
@@ -0,0 +1,111 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import state
+from pkgcore.resolver.plan_cache import PlanCache, fingerprint
+from pkgcore.test import TestCase
+from pkgcore.test.misc import FakePkg, FakeRepo, Options
+from pkgcore.vdb import ondisk
+
+
+class TestPlanCache(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.repo = FakeRepo(repo_id='gentoo')
+        self.vdb = FakeRepo(repo_id='vdb')
+        self.repo.pkgs = [
+            FakePkg(x, repo=self.repo)
+            for x in ('dev-libs/a-1', 'dev-libs/a-2', 'dev-util/b-1')]
+        self.vdb.pkgs = [
+            FakePkg(x, repo=self.vdb) for x in ('dev-libs/a-1', 'dev-util/c-1')]
+        self.cache = PlanCache(pjoin(self.dir, 'plans'))
+
+    def mk_ops(self):
+        a2, b1 = self.repo.pkgs[1:]
+        replace = state.replace_op(None, a2)
+        replace.old_pkg = self.vdb.pkgs[0]
+        return [replace, state.add_op(None, b1),
+                state.remove_op(None, self.vdb.pkgs[1])]
+
+    def test_roundtrip(self):
+        repos = [self.repo, self.vdb]
+        self.assertIdentical(self.cache.get('key', repos), None)
+        self.assertTrue(self.cache.store('key', self.mk_ops()))
+        ops = self.cache.get('key', repos)
+        self.assertEqual(
+            [(op.desc, op.pkg.cpvstr, op.pkg.repo.repo_id) for op in ops],
+            [(op.desc, op.pkg.cpvstr, op.pkg.repo.repo_id) for op in self.mk_ops()])
+        self.assertIdentical(ops[0].old_pkg, self.vdb.pkgs[0])
+        self.assertIdentical(ops[1].pkg, self.repo.pkgs[2])
+
+        # plans referring to pkgs that are gone aren't used
+        self.assertIdentical(self.cache.get('key', [self.repo]), None)
+        self.vdb.pkgs = self.vdb.pkgs[:1]
+        self.assertIdentical(self.cache.get('key', repos), None)
+
+    def test_invalid(self):
+        os.mkdir(self.cache.location)
+        with open(pjoin(self.cache.location, 'key'), 'w') as f:
+            f.write('pkgcore-plan 0\nadd\tdev-util/b-1\tgentoo\n')
+        self.assertIdentical(self.cache.get('key', [self.repo]), None)
+        with open(pjoin(self.cache.location, 'key'), 'w') as f:
+            f.write('pkgcore-plan 1\nfoo\tdev-util/b-1\tgentoo\n')
+        self.assertIdentical(self.cache.get('key', [self.repo]), None)
+
+    def test_prune(self):
+        self.cache.max_plans = 2
+        for x in xrange(4):
+            self.cache.store(str(x), self.mk_ops())
+            path = pjoin(self.cache.location, str(x))
+            os.utime(path, (x, x))
+        self.assertEqual(sorted(os.listdir(self.cache.location)), ['2', '3'])
+
+    def test_fingerprint(self):
+        location = pjoin(self.dir, 'repo')
+        os.makedirs(pjoin(location, 'dev-libs', 'a'))
+        repo = FakeRepo(repo_id='gentoo', location=location)
+        domain = Options(
+            settings={'USE': frozenset(['x', 'y'])},
+            profile=Options(stack=[Options(path=pjoin(self.dir, 'profile'))]),
+            config_files=[])
+        atoms = [atom('dev-libs/a')]
+        key = fingerprint(domain, [repo], atoms)
+        self.assertEqual(key, fingerprint(domain, [repo], atoms))
+        self.assertNotEqual(key, fingerprint(domain, [repo], atoms, (True,)))
+        self.assertNotEqual(key, fingerprint(domain, [repo], [atom('dev-libs/b')]))
+        domain.settings['ARCH'] = 'amd64'
+        key2 = fingerprint(domain, [repo], atoms)
+        self.assertNotEqual(key, key2)
+
+        # adding a package to the repo changes the category's dir
+        os.makedirs(pjoin(location, 'dev-libs', 'b'))
+        os.utime(pjoin(location, 'dev-libs'), (0, 0))
+        self.assertNotEqual(key2, fingerprint(domain, [repo], atoms))
+
+        # the options' values are part of the key, not just their names
+        key = fingerprint(domain, [repo], atoms, ({'resolver_cls': FakeRepo},))
+        self.assertEqual(
+            key, fingerprint(domain, [repo], atoms, ({'resolver_cls': FakeRepo},)))
+        self.assertNotEqual(
+            key, fingerprint(domain, [repo], atoms, ({'resolver_cls': FakePkg},)))
+
+    def test_fingerprint_vdb(self):
+        location = pjoin(self.dir, 'vdb')
+        os.makedirs(pjoin(location, 'dev-libs', 'a-1'))
+        vdb = ondisk.ConfiguredTree(
+            ondisk.tree(location, disable_cache=True), None, {})
+        domain = Options(settings={}, profile=Options(stack=[]), config_files=[])
+        atoms = [atom('dev-libs/a')]
+        key = fingerprint(domain, [vdb], atoms)
+        self.assertEqual(key, fingerprint(domain, [vdb], atoms))
+        # merging a pkg changes the category's dir
+        os.makedirs(pjoin(location, 'dev-libs', 'b-1'))
+        os.utime(pjoin(location, 'dev-libs'), (0, 0))
+        self.assertNotEqual(key, fingerprint(domain, [vdb], atoms))
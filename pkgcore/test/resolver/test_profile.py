@@ -0,0 +1,75 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import json
+from StringIO import StringIO
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.resolver import min_install_resolver
+from pkgcore.resolver.profile import resolver_profile
+from pkgcore.test import TestCase
+from pkgcore.test.misc import FakePkg, FakeRepo
+
+
+class TestResolverProfile(TestCase):
+
+    def test_accounting(self):
+        now = [0.0]
+        profile = resolver_profile(clock=lambda: now[0])
+        profile.enter('dev-libs/a', 0)
+        profile.choice()
+        now[0] = 1.0
+        profile.enter('dev-libs/b', 1)
+        profile.choice()
+        profile.choice()
+        profile.backtrack(3)
+        now[0] = 3.0
+        # resolving b again while it's being resolved
+        profile.enter('dev-libs/b', 4)
+        now[0] = 4.0
+        profile.exit(4)
+        profile.exit(5)
+        now[0] = 6.0
+        profile.exit(5)
+
+        a, b = profile.atoms['dev-libs/a'], profile.atoms['dev-libs/b']
+        self.assertEqual(profile.total_time, 6.0)
+        self.assertEqual((a.calls, a.time, a.self_time, a.choices, a.queries),
+                         (1, 6.0, 3.0, 1, 1))
+        self.assertEqual(
+            (b.calls, b.time, b.self_time, b.choices, b.backtracks, b.queries),
+            (2, 3.0, 3.0, 2, 3, 4))
+        self.assertEqual([x.atom for x in profile.sorted_stats('time')],
+                         ['dev-libs/a', 'dev-libs/b'])
+
+        f = StringIO()
+        profile.write(f)
+        data = json.loads(f.getvalue())
+        self.assertEqual(data['total_time'], 6.0)
+        self.assertEqual(data['atoms'][0]['atom'], 'dev-libs/a')
+        lines = list(profile.summary(limit=1))
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[-1].endswith('dev-libs/a'))
+
+    def test_resolver(self):
+        repo = FakeRepo(repo_id='gentoo', livefs=False)
+        vdb = FakeRepo(repo_id='vdb', livefs=True)
+        repo.pkgs = [
+            FakePkg('app-misc/top-1', repo=repo,
+                    data={'DEPEND': '|| ( dev-libs/a dev-libs/b )'}),
+            FakePkg('dev-libs/a-1', repo=repo, data={'DEPEND': 'dev-libs/missing'}),
+            FakePkg('dev-libs/b-1', repo=repo),
+        ]
+        profile = resolver_profile()
+        resolver = min_install_resolver([vdb], [repo], profile=profile)
+        self.assertEqual(resolver.add_atoms([atom('app-misc/top')]), ())
+        self.assertEqual(
+            sorted(profile.atoms),
+            ['app-misc/top', 'dev-libs/a', 'dev-libs/b', 'dev-libs/missing'])
+        top = profile.atoms['app-misc/top']
+        self.assertEqual(top.calls, 1)
+        self.assertEqual(top.choices, 1)
+        self.assertEqual(profile.atoms['dev-libs/missing'].choices, 0)
+        self.assertEqual(sum(x.queries for x in profile.atoms.itervalues()),
+                         resolver.query_cache_stats.misses)
+        self.assertTrue(profile.total_time >= top.self_time)
@@ -0,0 +1,141 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import sys
+import threading
+import traceback
+
+from pkgcore.ebuild import processor
+from pkgcore.resolver import state
+from pkgcore.resolver.scheduler import merge_scheduler, plan_graph
+from pkgcore.test import TestCase
+from pkgcore.test.misc import FakePkg
+
+
+def op(cpv, depend='', rdepend='', desc='add', **kwds):
+    pkg = FakePkg(cpv, data={'DEPEND': depend, 'RDEPEND': rdepend}, **kwds)
+    if desc == 'remove':
+        return state.remove_op(None, pkg)
+    return state.add_op(None, pkg)
+
+
+class TestPlanGraph(TestCase):
+
+    def test_graph(self):
+        ops = [
+            op('dev-libs/a-1'),
+            op('dev-libs/b-1', rdepend='dev-libs/a'),
+            op('dev-util/c-1', depend='dev-libs/b !dev-util/d'),
+            op('dev-util/d-1', desc='remove'),
+            op('app-misc/e-1', depend='|| ( dev-libs/x dev-libs/a )'),
+            op('dev-libs/a-2', slot='0'),
+        ]
+        self.assertEqual(plan_graph(ops), [
+            (frozenset(), frozenset()),
+            (frozenset(), frozenset([0])),
+            (frozenset([1]), frozenset()),
+            (frozenset(), frozenset([0, 1, 2])),
+            (frozenset([0]), frozenset([3])),
+            (frozenset(), frozenset([0, 3])),
+        ])
+
+
+class TestMergeScheduler(TestCase):
+
+    def setUp(self):
+        self.ops = [
+            op('dev-libs/a-1'),
+            op('dev-libs/b-1'),
+            op('dev-util/c-1', depend='dev-libs/a'),
+            op('dev-util/d-1', rdepend='dev-util/c'),
+        ]
+        self.events = []
+        self.lock = threading.Lock()
+
+    def build(self, op):
+        with self.lock:
+            self.events.append(('build', op.pkg.package))
+        if op.pkg.package == 'b':
+            return False
+        return op.pkg
+
+    def merge(self, op, pkg):
+        self.assertIdentical(pkg, op.pkg)
+        self.events.append(('merge', op.pkg.package))
+        return True
+
+    def check_order(self):
+        events = self.events
+        for first, second in ((('merge', 'a'), ('build', 'c')),
+                              (('merge', 'c'), ('merge', 'd')),
+                              (('build', 'd'), ('merge', 'd'))):
+            self.assertTrue(events.index(first) < events.index(second), events)
+
+    def test_parallel(self):
+        started = []
+        scheduler = merge_scheduler(self.ops, self.build, self.merge, jobs=4)
+        self.assertFalse(scheduler.run(
+            keep_going=True,
+            status=lambda s, op: started.append(op.pkg.package)))
+        self.assertEqual(sorted(started), ['a', 'b', 'c', 'd'])
+        self.assertEqual(
+            sorted(x[1] for x in self.events if x[0] == 'merge'), ['a', 'c', 'd'])
+        self.check_order()
+
+    def test_sequential(self):
+        scheduler = merge_scheduler(self.ops, self.build, self.merge)
+        self.assertFalse(scheduler.run(keep_going=True))
+        # the next build can start while the last one is being merged
+        self.assertEqual(
+            [x[1] for x in self.events if x[0] == 'build'], ['a', 'b', 'c', 'd'])
+        self.assertEqual(
+            [x[1] for x in self.events if x[0] == 'merge'], ['a', 'c', 'd'])
+        self.check_order()
+
+    def test_failure(self):
+        scheduler = merge_scheduler(self.ops, self.build, self.merge)
+        self.assertFalse(scheduler.run())
+        self.assertEqual(sorted(self.events), [
+            ('build', 'a'), ('build', 'b'), ('merge', 'a')])
+        self.assertEqual(len(scheduler.queued), 2)
+
+        del self.ops[1]
+        self.events = []
+        scheduler = merge_scheduler(self.ops, self.build, self.merge, jobs=2)
+        self.assertTrue(scheduler.run())
+        self.check_order()
+
+    def test_exception(self):
+        def build(op):
+            raise KeyError(op.pkg.package)
+        scheduler = merge_scheduler(self.ops, build, self.merge, jobs=2)
+        self.assertRaises(KeyError, scheduler.run, keep_going=True)
+        self.assertEqual(scheduler.running, [])
+
+    def test_traceback(self):
+        def build(op):
+            raise KeyError(op.pkg.package)
+        scheduler = merge_scheduler(self.ops, build, self.merge)
+        try:
+            scheduler.run()
+        except KeyError:
+            frames = traceback.extract_tb(sys.exc_info()[2])
+        self.assertEqual(frames[-1][2], 'build')
+
+    def test_ebuild_processor(self):
+        # worker threads can't install signal handlers; the liveness check run
+        # when reusing an idle processor must cope with that.
+        def build(op):
+            ebp = processor.request_ebuild_processor()
+            try:
+                alive = ebp.is_alive
+            finally:
+                processor.release_ebuild_processor(ebp)
+            return alive and op.pkg
+        processor.release_ebuild_processor(
+            processor.request_ebuild_processor())
+        del self.ops[1]
+        scheduler = merge_scheduler(self.ops, build, self.merge, jobs=2)
+        self.assertTrue(scheduler.run())
+        self.assertEqual(
+            [x[1] for x in self.events if x[0] == 'merge'], ['a', 'c', 'd'])
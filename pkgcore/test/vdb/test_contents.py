@@ -0,0 +1,60 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.fs import fs
+from pkgcore.test import TestCase
+from pkgcore.vdb.contents import ContentsFile
+
+
+class TestContentsFile(TempDirMixin, TestCase):
+
+    lines = [
+        'dir /usr',
+        'dir /usr/bin',
+        'obj /usr/bin/foo bar 0123456789abcdef0123456789abcdef 100',
+        'sym /usr/bin/link -> foo bar 200',
+        'fif /run/fifo',
+    ]
+
+    def write(self, lines):
+        path = pjoin(self.dir, 'CONTENTS')
+        with open(path, 'w') as f:
+            f.write(''.join(x + '\n' for x in lines))
+        return path
+
+    def test_parsing(self):
+        cset = ContentsFile(self.write(self.lines))
+        self.assertEqual(len(cset), 5)
+        obj = cset['/usr/bin/foo bar']
+        self.assertTrue(obj.is_reg)
+        self.assertEqual(obj.chksums, {'md5': 0x0123456789abcdef0123456789abcdef})
+        self.assertEqual(obj.mtime, 100)
+        obj = cset['/usr/bin/link']
+        self.assertEqual((obj.target, obj.mtime), ('foo bar', 200))
+        self.assertTrue(cset['/usr/bin'].is_dir)
+        self.assertTrue(cset['/run/fifo'].is_fifo)
+        self.assertEqual([x.location for x in cset.iterfiles()], ['/usr/bin/foo bar'])
+        self.assertRaises(Exception, ContentsFile, self.write(['foo /usr']))
+
+    def test_flush(self):
+        path = self.write(self.lines)
+        cset = ContentsFile(path, mutable=True)
+        cset.remove('/run/fifo')
+        cset.add(fs.fsDir('/etc', strict=False))
+        cset.flush()
+        with open(path) as f:
+            self.assertEqual(
+                f.read().splitlines(),
+                sorted(self.lines[:-1] + ['dir /etc']))
+        self.assertEqual(ContentsFile(path), cset)
+
+    def test_clone(self):
+        cset = ContentsFile(self.write(self.lines))
+        clone = cset.clone()
+        clone.remove('/usr')
+        self.assertTrue('/usr' in cset)
+        self.assertEqual(len(clone), 4)
+        self.assertEqual(len(cset.clone(empty=True)), 0)
@@ -0,0 +1,121 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+import shutil
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.test import TestCase
+from pkgcore.vdb import ondisk
+from pkgcore.vdb.index import VdbIndex
+
+
+class TestVdbIndex(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = pjoin(self.dir, 'vdb')
+        self.cache = pjoin(self.dir, 'cache')
+        self.add_pkg('dev-util', 'diffball-1.0', SLOT='0\n', USE='foo bar\n')
+        self.add_pkg('dev-util', 'bsdiff-2.0', SLOT='2\n', DESCRIPTION='a\\b\nc')
+        self.add_pkg('app-misc', 'foo-1', SLOT='0\n')
+
+    def add_pkg(self, category, pf, **metadata):
+        path = pjoin(self.vdb, category, pf)
+        ensure_dirs(path)
+        for key, value in metadata.iteritems():
+            with open(pjoin(path, key), 'w') as f:
+                f.write(value)
+        # bump dir mtimes past what the filesystem granularity may hide
+        for p in (path, os.path.dirname(path)):
+            st = os.stat(p)
+            os.utime(p, (st.st_atime, st.st_mtime + 10))
+
+    def get_tree(self):
+        return ondisk.tree(self.vdb, cache_location=self.cache)
+
+    def test_tree(self):
+        repo = self.get_tree()
+        self.assertEqual(sorted(x.cpvstr for x in repo), [
+            'app-misc/foo-1', 'dev-util/bsdiff-2.0', 'dev-util/diffball-1.0'])
+        pkg = repo.match(atom('=dev-util/diffball-1.0'))[0]
+        self.assertEqual(pkg.slot, '0')
+        self.assertEqual(sorted(pkg.use), ['bar', 'foo'])
+        self.assertTrue(os.path.exists(pjoin(self.cache, 'pkgcore-vdb-index')))
+
+        # the next instance is served from the index
+        with mock.patch.object(VdbIndex, '_read_package') as read_package:
+            repo = self.get_tree()
+            pkgs = {x.cpvstr: x for x in repo}
+            self.assertEqual(pkgs['dev-util/bsdiff-2.0'].slot, '2')
+            self.assertEqual(pkgs['dev-util/bsdiff-2.0'].description, 'a\\b\nc')
+            self.assertFalse(read_package.called)
+
+    def test_update(self):
+        index = VdbIndex(self.vdb, pjoin(self.cache, 'index'))
+        self.assertEqual(sorted(index.categories()), ['app-misc', 'dev-util'])
+        self.assertFalse(index.update())
+
+        self.add_pkg('dev-util', 'diffball-1.1', SLOT='0\n')
+        shutil.rmtree(pjoin(self.vdb, 'app-misc'))
+        index = VdbIndex(self.vdb, pjoin(self.cache, 'index'))
+        with mock.patch.object(
+                VdbIndex, '_read_package', autospec=True,
+                side_effect=VdbIndex._read_package.im_func) as read_package:
+            self.assertTrue(index.update())
+            # only the new package is read
+            self.assertEqual(read_package.call_count, 1)
+        self.assertEqual(index.categories(), ('dev-util',))
+        self.assertEqual(sorted(index.package_dirs('dev-util')),
+                         ['bsdiff-2.0', 'diffball-1.0', 'diffball-1.1'])
+        self.assertEqual(index.get('dev-util', 'diffball-1.1', 'SLOT'), '0\n')
+        self.assertIdentical(index.get('dev-util', 'diffball-1.1', 'USE'), None)
+        self.assertRaises(KeyError, index.get, 'dev-util', 'diffball-1.1', 'CONTENTS')
+
+    def test_invalid(self):
+        path = pjoin(self.cache, 'index')
+        ensure_dirs(self.cache)
+        with open(path, 'w') as f:
+            f.write('pkgcore-vdb-index 1\npackage\tfoo\n')
+        index = VdbIndex(self.vdb, path)
+        self.assertEqual(sorted(index.categories()), ['app-misc', 'dev-util'])
+
+    def test_package_update(self):
+        index = VdbIndex(self.vdb, pjoin(self.cache, 'index'))
+        self.assertEqual(index.get('dev-util', 'diffball-1.0', 'USE'), 'foo bar\n')
+        # replace USE the way a merge does, leaving the category dir alone
+        path = pjoin(self.vdb, 'dev-util', 'diffball-1.0')
+        with open(pjoin(path, 'USE.new'), 'w') as f:
+            f.write('baz\n')
+        os.rename(pjoin(path, 'USE.new'), pjoin(path, 'USE'))
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+
+        self.assertTrue(index.update())
+        self.assertEqual(index.get('dev-util', 'diffball-1.0', 'USE'), 'baz\n')
+        pkg = self.get_tree().match(atom('=dev-util/diffball-1.0'))[0]
+        self.assertEqual(list(pkg.use), ['baz'])
+
+    def test_readonly(self):
+        with mock.patch.object(VdbIndex, '_writable', return_value=False), \
+                mock.patch.object(VdbIndex, '_read_package') as read_package:
+            repo = self.get_tree()
+            pkg = repo.match(atom('=dev-util/diffball-1.0'))[0]
+            self.assertEqual(sorted(pkg.use), ['bar', 'foo'])
+            self.assertEqual(pkg.slot, '0')
+            self.assertFalse(read_package.called)
+            self.assertRaises(
+                KeyError, repo._index.get, 'dev-util', 'diffball-1.0', 'SLOT')
+        self.assertFalse(os.path.exists(pjoin(self.cache, 'pkgcore-vdb-index')))
+
+        # once writable, the metadata is read and indexed
+        index = VdbIndex(self.vdb, pjoin(self.cache, 'index'))
+        self.assertEqual(index.get('dev-util', 'diffball-1.0', 'SLOT'), '0\n')
@@ -0,0 +1,75 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+import os
+import shutil
+
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.test import TestCase
+from pkgcore.vdb import ondisk
+from pkgcore.vdb.owners import OwnerIndex, contents_paths
+
+
+class TestOwnerIndex(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = pjoin(self.dir, 'vdb')
+        self.cache = pjoin(self.dir, 'cache')
+        self.add_pkg('dev-util', 'diffball-1.0', [
+            'dir /usr', 'dir /usr/bin',
+            'obj /usr/bin/diff ball 0123456789abcdef0123456789abcdef 100',
+            'sym /usr/bin/diffball -> diff ball 100'])
+        self.add_pkg('sys-apps', 'baselayout-2', [
+            'dir /usr', 'obj /usr/bin 0123456789abcdef0123456789abcdef 100',
+            'fif /run/initctl'])
+
+    def add_pkg(self, category, pf, contents):
+        path = pjoin(self.vdb, category, pf)
+        ensure_dirs(path)
+        with open(pjoin(path, 'CONTENTS'), 'w') as f:
+            f.write(''.join(x + '\n' for x in contents))
+        for p in (path, os.path.dirname(path)):
+            st = os.stat(p)
+            os.utime(p, (st.st_atime, st.st_mtime + 10))
+
+    def test_contents_paths(self):
+        self.assertEqual(
+            list(contents_paths(pjoin(self.vdb, 'dev-util', 'diffball-1.0', 'CONTENTS'))),
+            ['/usr', '/usr/bin', '/usr/bin/diff ball', '/usr/bin/diffball'])
+        self.assertEqual(list(contents_paths(pjoin(self.dir, 'missing'))), [])
+
+    def test_owners(self):
+        index = OwnerIndex(self.vdb, pjoin(self.cache, 'owners'))
+        pkgs = {'dev-util/diffball-1.0': 1.0, 'sys-apps/baselayout-2': 1.0}
+        self.assertTrue(index.update(pkgs))
+        self.assertFalse(index.update(pkgs))
+        self.assertEqual(index.owners('/usr'),
+                         ('dev-util/diffball-1.0', 'sys-apps/baselayout-2'))
+        self.assertEqual(index.owners('/usr/bin/diff ball'), ('dev-util/diffball-1.0',))
+        self.assertEqual(index.owners('/run/initctl'), ('sys-apps/baselayout-2',))
+        self.assertEqual(index.owners('/'), ())
+        self.assertEqual(index.owners('/usr/b'), ())
+        self.assertEqual(index.owners('/zzz'), ())
+
+        # a new instance uses what was written, and only rereads changed packages
+        shutil.rmtree(pjoin(self.vdb, 'dev-util'))
+        index = OwnerIndex(self.vdb, pjoin(self.cache, 'owners'))
+        self.assertTrue(index.update({'dev-util/diffball-1.0': 1.0}))
+        self.assertEqual(index.owners('/usr/bin'), ('dev-util/diffball-1.0',))
+        self.assertTrue(index.update({}))
+        self.assertEqual(index.owners('/usr'), ())
+
+    def test_tree(self):
+        repo = ondisk.tree(self.vdb, cache_location=self.cache)
+        self.assertEqual(
+            sorted(x.cpvstr for x in repo.owners('/usr/bin/')),
+            ['dev-util/diffball-1.0', 'sys-apps/baselayout-2'])
+        self.add_pkg('app-misc', 'foo-1', ['dir /usr/bin'])
+        self.assertEqual(
+            sorted(x.cpvstr for x in repo.owners('/usr/bin')),
+            ['app-misc/foo-1', 'dev-util/diffball-1.0', 'sys-apps/baselayout-2'])
+        repo = ondisk.tree(self.vdb, disable_cache=True)
+        self.assertIdentical(repo.owners('/usr'), None)
@@ -7,8 +7,10 @@ from snakeoil import data_source
 from snakeoil.demandload import demandload
 from snakeoil.fileutils import AtomicWriteFile
 
+from snakeoil.osutils import normpath
+
 from pkgcore.fs import fs
-from pkgcore.fs.contents import contentsSet
+from pkgcore.fs.contents import PackedContentsSet, contentsSet
 
 demandload(
     'errno',
@@ -43,27 +45,64 @@ class LookupFsDev(fs.fsDev):
         fs.fsDev.__init__(self, path, **kwds)
 
 
-class ContentsFile(contentsSet):
-    """class wrapping a contents file"""
+def parse_entry(location, kind, data):
+    """Create the fs object for a parsed CONTENTS entry."""
+    if kind == "obj":
+        chksum, mtime = data.split(" ")
+        return fs.fsFile(
+            location, chksums={"md5": long(chksum, 16)}, mtime=long(mtime),
+            strict=False)
+    elif kind == "sym":
+        target, mtime = data.rsplit(" ", 1)
+        return fs.fsLink(location, target, mtime=long(mtime), strict=False)
+    elif kind == "dir":
+        return fs.fsDir(location, strict=False)
+    elif kind == "dev":
+        return LookupFsDev(location, strict=False)
+    return fs.fsFifo(location, strict=False)
+
+
+def parse_line(line):
+    """Split a CONTENTS line into a (location, kind, data) tuple.
+
+    data is what :obj:`parse_entry` needs beyond the location- the md5 and
+    mtime for files, the target and mtime for symlinks.
+    """
+    kind, _, rest = line.rstrip("\n").partition(" ")
+    if kind in ("dir", "dev", "fif"):
+        return normpath(rest), kind, ""
+    elif kind == "obj":
+        location, chksum, mtime = rest.rsplit(" ", 2)
+        return normpath(location), kind, "%s %s" % (chksum, mtime)
+    elif kind == "sym":
+        # XXX throw a corruption error if there's no target
+        location, target = rest.split(" -> ", 1)
+        return normpath(location), kind, target
+    raise Exception("unknown entry type %r" % (line,))
+
+
+class ContentsFile(PackedContentsSet):
+    """class wrapping a contents file
+
+    Entries are only turned into fs objects as they're accessed, see
+    :obj:`pkgcore.fs.contents.PackedContentsSet`.
+    """
 
     def __init__(self, source, mutable=False, create=False):
 
         if not isinstance(source, (data_source.base, basestring)):
             raise TypeError("source must be either data_source, or a filepath")
-        contentsSet.__init__(self, mutable=True)
+        entries = ()
         self._source = source
-
         if not create:
-            self.update(self._iter_contents())
-
-        self.mutable = mutable
+            entries = self._iter_entries()
+        PackedContentsSet.__init__(self, entries, parse_entry, mutable=mutable)
 
     def clone(self, empty=False):
-        # create is used to block it from reading.
-        cset = self.__class__(self._source, mutable=True, create=True)
-        if not empty:
-            cset.update(self)
-        return cset
+        if empty:
+            # create is used to block it from reading.
+            return self.__class__(self._source, mutable=True, create=True)
+        return PackedContentsSet.clone(self)
 
     def add(self, obj):
         if obj.is_reg:
@@ -88,39 +127,15 @@ class ContentsFile(contentsSet):
     def flush(self):
         return self._write()
 
-    def _iter_contents(self):
-        self.clear()
+    def _iter_entries(self):
         for line in self._get_fd():
-            if not line:
-                continue
-            s = line.split(" ")
-            if s[0] in ("dir", "dev", "fif"):
-                path = ' '.join(s[1:])
-                if s[0] == 'dir':
-                    obj = fs.fsDir(path, strict=False)
-                elif s[0] == 'dev':
-                    obj = LookupFsDev(path, strict=False)
-                else:
-                    obj = fs.fsFifo(path, strict=False)
-            elif s[0] == "obj":
-                path = ' '.join(s[1:-2])
-                obj = fs.fsFile(
-                    path, chksums={"md5":long(s[-2], 16)},
-                        mtime=long(s[-1]), strict=False)
-            elif s[0] == "sym":
-                try:
-                    p = s.index("->")
-                    obj = fs.fsLink(' '.join(s[1:p]), ' '.join(s[p+1:-1]),
-                        mtime=long(s[-1]), strict=False)
-
-                except ValueError:
-                    # XXX throw a corruption error
-                    raise
-            else:
-                raise Exception(
-                    "unknown entry type %r" % (line,))
+            if line and line != "\n":
+                yield parse_line(line)
 
-            yield obj
+    def _iter_contents(self):
+        self.clear()
+        for entry in self._iter_entries():
+            yield parse_entry(*entry)
 
     def _write(self):
         md5_handler = get_handler('md5')
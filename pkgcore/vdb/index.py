@@ -0,0 +1,268 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+consolidated index of a vdb's packages and their commonly used metadata
+
+Listing a vdb and pulling package metadata from it means stating each
+category and package dir and reading a file per metadata key per package.
+The index keeps the package dirs and the contents of the small metadata files
+in a single file; it's validated against the mtimes of the vdb, category and
+package dirs, so only the parts of the vdb that changed since the index was
+written get reread.
+
+Package dirs are stated on every update since they can be modified without
+touching their category dir.  Metadata files are expected to be replaced
+(written elsewhere and renamed into place, or removed and recreated) as the
+merge code does; rewriting an existing file in place doesn't change the
+package dir mtime and isn't noticed.
+
+If the index can't be written, metadata isn't cached at all and is read from
+the vdb on demand as it would be without an index.
+"""
+
+__all__ = ("VdbIndex",)
+
+import errno
+import os
+import threading
+
+from snakeoil.demandload import demandload
+from snakeoil.fileutils import AtomicWriteFile, readfile
+from snakeoil.osutils import ensure_dirs, listdir_dirs, pjoin
+
+demandload(
+    'pkgcore.log:logger',
+)
+
+
+def _escape(s):
+    return s.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _unescape(s):
+    if '\\' not in s:
+        return s
+    return s.replace('\\\\', '\0').replace('\\n', '\n').replace('\0', '\\')
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except EnvironmentError as e:
+        if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+            raise
+        return None
+
+
+def _ignored_dir(name):
+    """Check if a package dir is an in progress merge, or otherwise bogus."""
+    return (name.startswith('.') or name.endswith('.lockfile') or
+            name.startswith('-MERGING-'))
+
+
+class VdbIndex(object):
+    """Index of the categories, package dirs, and metadata of a vdb.
+
+    :param location: vdb location
+    :param path: index file location
+    """
+
+    magic = 'pkgcore-vdb-index'
+    version = 1
+
+    # vdb metadata files small and commonly used enough to be worth indexing;
+    # CONTENTS and environment are deliberately left on disk.
+    indexed_keys = frozenset([
+        'CBUILD', 'CFLAGS', 'CHOST', 'CTARGET', 'CXXFLAGS', 'DEFINED_PHASES',
+        'DEPEND', 'DESCRIPTION', 'EAPI', 'HOMEPAGE', 'INHERITED', 'IUSE',
+        'IUSE_EFFECTIVE', 'KEYWORDS', 'LDFLAGS', 'LICENSE', 'PDEPEND',
+        'PROPERTIES', 'PROVIDE', 'RDEPEND', 'REPOSITORY', 'REQUIRED_USE',
+        'RESTRICT', 'SLOT', 'USE', 'repository',
+    ])
+
+    def __init__(self, location, path):
+        self.location = location
+        self.path = path
+        # category -> mtime
+        self._categories = {}
+        # category -> {package dir: (mtime, {key: value})}
+        self._packages = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self):
+        categories, packages = {}, {}
+        try:
+            with open(self.path, 'r') as f:
+                header = f.readline().split()
+                if header != [self.magic, str(self.version)]:
+                    return
+                metadata = None
+                for line in f:
+                    l = line.rstrip('\n').split('\t', 2)
+                    if l[0] == 'key':
+                        metadata[l[1]] = _unescape(l[2])
+                    elif l[0] == 'package':
+                        category, pf = l[1].split('/')
+                        metadata = {}
+                        packages[category][pf] = (float(l[2]), metadata)
+                    elif l[0] == 'category':
+                        categories[l[1]] = float(l[2])
+                        packages[l[1]] = {}
+                    else:
+                        raise ValueError(line)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("failed reading vdb index %r: %s", self.path, e)
+            return
+        except (IndexError, KeyError, TypeError, ValueError) as e:
+            logger.warning("ignoring invalid vdb index %r: %s", self.path, e)
+            return
+        self._categories, self._packages = categories, packages
+
+    def write(self):
+        """Write the index out, returning False if that wasn't possible."""
+        try:
+            if not ensure_dirs(os.path.dirname(self.path), mode=0755):
+                return False
+            f = AtomicWriteFile(self.path)
+        except EnvironmentError as e:
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+                logger.warning("failed writing vdb index %r: %s", self.path, e)
+            return False
+        try:
+            f.write('%s %i\n' % (self.magic, self.version))
+            for category, mtime in sorted(self._categories.iteritems()):
+                f.write('category\t%s\t%r\n' % (category, mtime))
+                for pf, (mtime, metadata) in sorted(
+                        self._packages[category].iteritems()):
+                    if metadata is None:
+                        # not loaded; leave it to be read on the next update.
+                        continue
+                    f.write('package\t%s/%s\t%r\n' % (category, pf, mtime))
+                    for item in sorted(metadata.iteritems()):
+                        f.write('key\t%s\t%s\n' % (item[0], _escape(item[1])))
+        except:
+            f.discard()
+            raise
+        f.close()
+        return True
+
+    def _writable(self):
+        """Check if the index file could be written."""
+        path = os.path.dirname(self.path)
+        while not os.path.exists(path):
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+        return os.access(path, os.W_OK)
+
+    def _read_package(self, path):
+        metadata = {}
+        for key in self.indexed_keys:
+            data = readfile(pjoin(path, key), True)
+            if data is not None:
+                metadata[key] = data
+        return metadata
+
+    def _refresh_category(self, category, mtime, lazy=False):
+        """Update a category's package dirs, returning True if any changed.
+
+        :param lazy: if True, don't read the metadata of changed packages
+        """
+        old = self._packages.get(category, {})
+        cpath = pjoin(self.location, category)
+        changed = self._categories.get(category) != mtime
+        if changed:
+            pfs = [x for x in listdir_dirs(cpath) if not _ignored_dir(x)]
+        else:
+            # no package dirs were added or removed
+            pfs = old
+        packages = {}
+        for pf in pfs:
+            path = pjoin(cpath, pf)
+            pkg_mtime = _mtime(path)
+            if pkg_mtime is None:
+                # raced an unmerge.
+                changed = True
+                continue
+            entry = old.get(pf)
+            if (entry is None or entry[0] != pkg_mtime or
+                    (entry[1] is None and not lazy)):
+                entry = (pkg_mtime, None if lazy else self._read_package(path))
+                changed = True
+            packages[pf] = entry
+        self._categories[category] = mtime
+        self._packages[category] = packages
+        return changed
+
+    def update(self, write=True):
+        """Bring the index in line with the vdb, rereading changed packages.
+
+        :param write: if True, write the index out if anything changed
+        :return: True if anything changed
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+            changed = False
+            lazy = not self._writable()
+            try:
+                current = [x for x in listdir_dirs(self.location)
+                           if not x.startswith('.')]
+            except EnvironmentError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                current = []
+            for category in frozenset(self._categories).difference(current):
+                del self._categories[category]
+                del self._packages[category]
+                changed = True
+            for category in current:
+                mtime = _mtime(pjoin(self.location, category))
+                if mtime is None:
+                    continue
+                if self._refresh_category(category, mtime, lazy):
+                    changed = True
+            if changed and write and not lazy:
+                self.write()
+            return changed
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.update()
+
+    def categories(self):
+        """Return the vdb's categories."""
+        self._ensure_loaded()
+        return tuple(self._categories)
+
+    def package_dirs(self, category):
+        """Return the package dirs for a category."""
+        self._ensure_loaded()
+        return tuple(self._packages[category])
+
+    def package_mtimes(self):
+        """Return a mapping of each package's cpv to its package dir mtime."""
+        self._ensure_loaded()
+        return dict(
+            ('%s/%s' % (category, pf), entry[0])
+            for category, packages in self._packages.iteritems()
+            for pf, entry in packages.iteritems())
+
+    def get(self, category, pf, key):
+        """Get an indexed metadata value.
+
+        :return: the value, or None if the package doesn't have it
+        :raise KeyError: if the package or key isn't indexed
+        """
+        if key not in self.indexed_keys:
+            raise KeyError(key)
+        self._ensure_loaded()
+        metadata = self._packages[category][pf][1]
+        if metadata is None:
+            raise KeyError(key)
+        return metadata.get(key)
@@ -12,7 +12,7 @@ from snakeoil import compatibility, data_source, klass
 from snakeoil.demandload import demandload
 from snakeoil.fileutils import readfile
 from snakeoil.mappings import IndeterminantDict
-from snakeoil.osutils import listdir_dirs, pjoin
+from snakeoil.osutils import listdir_dirs, normpath, pjoin
 
 from pkgcore.config import ConfigHint
 from pkgcore.ebuild import ebuild_built
@@ -22,7 +22,8 @@ from pkgcore.repository import errors, multiplex, prototype
 
 demandload(
     'pkgcore.log:logger',
-    'pkgcore.vdb:repo_ops',
+    'pkgcore.vdb:index@vdb_index,repo_ops',
+    'pkgcore.vdb.owners:OwnerIndex',
     'pkgcore.vdb.contents:ContentsFile',
 )
 
@@ -52,6 +53,12 @@ class tree(prototype.tree):
             cache_location = pjoin("/var/cache/edb/dep", location.lstrip("/"))
         self.cache_location = cache_location
         self._versions_tmp_cache = {}
+        self._index = self._owner_index = None
+        if cache_location is not None:
+            self._index = vdb_index.VdbIndex(
+                location, pjoin(cache_location, "pkgcore-vdb-index"))
+            self._owner_index = OwnerIndex(
+                location, pjoin(cache_location, "pkgcore-vdb-owners"))
         try:
             st = os.stat(self.location)
             if not stat.S_ISDIR(st.st_mode):
@@ -74,6 +81,8 @@ class tree(prototype.tree):
             return {}
         try:
             try:
+                if self._index is not None:
+                    return self._index.categories()
                 return tuple(x for x in listdir_dirs(self.location) if not
                              x.startswith('.'))
             except EnvironmentError as e:
@@ -88,7 +97,11 @@ class tree(prototype.tree):
         d = {}
         bad = False
         try:
-            for x in listdir_dirs(cpath):
+            if self._index is not None:
+                dirs = self._index.package_dirs(category)
+            else:
+                dirs = listdir_dirs(cpath)
+            for x in dirs:
                 if x.startswith(".tmp.") or x.endswith(".lockfile") \
                         or x.startswith("-MERGING-"):
                     continue
@@ -120,7 +133,7 @@ class tree(prototype.tree):
                         "not standard." % (category, x, bad))
                 l.add(pkg.package)
                 d.setdefault((category, pkg.package), []).append(pkg.fullver)
-        except EnvironmentError as e:
+        except (EnvironmentError, KeyError) as e:
             compatibility.raise_from(KeyError(
                 "failed fetching packages for category %s: %s" %
                 (pjoin(self.location, category.lstrip(os.path.sep)), str(e))))
@@ -175,11 +188,45 @@ class tree(prototype.tree):
                 if data is None:
                     raise KeyError(key)
         else:
-            data = readfile(pjoin(path, key), True)
+            data = self._indexed_key(path, key)
+            if data is False:
+                data = readfile(pjoin(path, key), True)
             if data is None:
                 raise KeyError((path, key))
         return data
 
+    def _indexed_key(self, path, key):
+        """Pull a key from the vdb index, returning False if it's not indexed."""
+        if self._index is None:
+            return False
+        path, pf = os.path.split(path.rstrip(os.path.sep))
+        try:
+            return self._index.get(os.path.basename(path), pf, key)
+        except KeyError:
+            return False
+
+    def _update_index(self):
+        """Bring the vdb indexes up to date after modifying the vdb."""
+        if self._index is not None:
+            self._index.update()
+            # only maintain the owner index once something has used it
+            if os.path.exists(self._owner_index.path):
+                self._owner_index.update(self._index.package_mtimes())
+
+    def owners(self, path):
+        """Find the installed packages owning a path, via the owner index.
+
+        :param path: absolute path to look up
+        :return: tuple of :obj:`pkgcore.ebuild.cpv.versioned_CPV` instances,
+            or None if the vdb has no indexes enabled
+        """
+        if self._owner_index is None:
+            return None
+        self._index.update()
+        self._owner_index.update(self._index.package_mtimes())
+        return tuple(versioned_CPV(x) for x in self._owner_index.owners(
+            normpath(path)))
+
     def notify_remove_package(self, pkg):
         remove_it = len(self.packages[pkg.category]) == 1
         prototype.tree.notify_remove_package(self, pkg)
@@ -212,5 +259,6 @@ class ConfiguredTree(multiplex.tree):
         multiplex.tree.__init__(self, raw_vdb)
 
     frozen = klass.alias_attr("raw_vdb.frozen")
+    owners = klass.alias_attr("raw_vdb.owners")
 
 tree.configure = ConfiguredTree
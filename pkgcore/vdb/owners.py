@@ -0,0 +1,191 @@
+# Copyright: 2026 pkgcore contributors
+# License: GPL2/BSD
+
+"""
+persistent index of which installed packages own which paths
+
+Answering ownership queries otherwise means parsing the CONTENTS of every
+installed package.  The index stores every (path, owner) pair sorted by path,
+so a lookup is a binary search of the mmapped index; it's validated against
+the package dir mtimes tracked by :obj:`pkgcore.vdb.index.VdbIndex`, and
+only the CONTENTS of added or changed packages are parsed when updating it.
+"""
+
+__all__ = ("OwnerIndex", "contents_paths")
+
+import errno
+import mmap
+import os
+import threading
+
+from snakeoil.demandload import demandload
+from snakeoil.fileutils import AtomicWriteFile, readlines_ascii
+from snakeoil.osutils import ensure_dirs, pjoin
+
+demandload(
+    'pkgcore.log:logger',
+)
+
+
+def contents_paths(path):
+    """Yield the paths listed in a CONTENTS file, without creating fs objects."""
+    for line in readlines_ascii(path, True, True):
+        if not line:
+            continue
+        kind, _, rest = line.partition(' ')
+        if kind == 'obj':
+            # strip the md5 and mtime
+            yield rest.rsplit(' ', 2)[0]
+        elif kind == 'sym':
+            yield rest.split(' -> ', 1)[0]
+        else:
+            yield rest
+
+
+class OwnerIndex(object):
+    """Sorted path to owning package index of a vdb.
+
+    :param location: vdb location
+    :param path: index file location
+    """
+
+    magic = 'pkgcore-vdb-owners'
+    version = 1
+
+    def __init__(self, location, path):
+        self.location = location
+        self.path = path
+        # cpv -> package dir mtime, for what the index was built from
+        self._packages = None
+        self._data = None
+        self._entries_start = 0
+        self._lock = threading.Lock()
+
+    def _close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = None
+
+    def _load(self):
+        self._close()
+        self._packages = {}
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.readline().split()
+                if header[:2] != [self.magic, str(self.version)] or len(header) != 3:
+                    return
+                packages = {}
+                for i in xrange(int(header[2])):
+                    cpv, mtime = f.readline().rstrip('\n').split('\t')
+                    packages[cpv] = float(mtime)
+                start = f.tell()
+                if os.fstat(f.fileno()).st_size > start:
+                    self._data = mmap.mmap(
+                        f.fileno(), 0, access=mmap.ACCESS_READ)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("failed reading vdb owner index %r: %s",
+                               self.path, e)
+            return
+        except ValueError as e:
+            logger.warning("ignoring invalid vdb owner index %r: %s",
+                           self.path, e)
+            return
+        self._packages = packages
+        self._entries_start = start
+
+    def _iter_entries(self):
+        """Yield the (path, cpv) pairs of the current index."""
+        if self._data is None:
+            return
+        data = self._data[self._entries_start:]
+        for line in data.splitlines():
+            path, cpv = line.split('\0')
+            yield path, cpv
+
+    def update(self, packages):
+        """Bring the index in line with the installed packages.
+
+        :param packages: mapping of cpv string to package dir mtime
+        :return: True if the index was rebuilt
+        """
+        with self._lock:
+            if self._packages is None:
+                self._load()
+            if self._packages == packages:
+                return False
+            changed = frozenset(
+                cpv for cpv, mtime in packages.iteritems()
+                if self._packages.get(cpv) != mtime)
+            entries = [(path, cpv) for path, cpv in self._iter_entries()
+                       if cpv in packages and cpv not in changed]
+            for cpv in changed:
+                entries.extend(
+                    (path, cpv) for path in
+                    contents_paths(pjoin(self.location, cpv, 'CONTENTS')))
+            entries.sort()
+            self._write(packages, entries)
+            self._load()
+            if self._packages != packages:
+                # couldn't be written; serve from memory instead.
+                self._packages = dict(packages)
+                self._close()
+                self._entries_start = 0
+                self._data = ''.join(
+                    '%s\0%s\n' % x for x in entries) or None
+            return True
+
+    def _write(self, packages, entries):
+        try:
+            if not ensure_dirs(os.path.dirname(self.path), mode=0755):
+                return False
+            f = AtomicWriteFile(self.path, binary=True)
+        except EnvironmentError as e:
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+                logger.warning("failed writing vdb owner index %r: %s",
+                               self.path, e)
+            return False
+        try:
+            f.write('%s %i %i\n' % (self.magic, self.version, len(packages)))
+            for item in sorted(packages.iteritems()):
+                f.write('%s\t%r\n' % item)
+            for item in entries:
+                f.write('%s\0%s\n' % item)
+        except:
+            f.discard()
+            raise
+        f.close()
+        return True
+
+    def owners(self, path):
+        """Return the cpvs of the packages owning a path.
+
+        :param path: absolute path, as listed in CONTENTS
+        :return: tuple of cpv strings
+        """
+        with self._lock:
+            if self._packages is None:
+                self._load()
+            data = self._data
+            if data is None:
+                return ()
+            key = path + '\0'
+            lo, hi = self._entries_start, len(data)
+            # lo is always a line start; lines before it sort before key.
+            while lo < hi:
+                mid = (lo + hi) // 2
+                start = data.rfind('\n', lo, mid) + 1 or lo
+                end = data.find('\n', start)
+                if data[start:end] < key:
+                    lo = end + 1
+                else:
+                    hi = start
+            l = []
+            while lo < len(data):
+                end = data.find('\n', lo)
+                line = data[lo:end]
+                if not line.startswith(key):
+                    break
+                l.append(line[len(key):])
+                lo = end + 1
+            return tuple(l)
@@ -117,6 +117,7 @@ class install(repo_ops.install):
     def finalize_data(self):
         os.rename(self.tmp_write_path, self.install_path)
         update_mtime(self.repo.location)
+        self.repo._update_index()
         return True
 
 
@@ -134,6 +135,7 @@ class uninstall(repo_ops.uninstall):
         update_mtime(self.repo.location)
         shutil.rmtree(self.remove_path)
         update_mtime(self.repo.location)
+        self.repo._update_index()
         return True
 
 
@@ -60,6 +60,7 @@ typedef struct {
 	PyObject *fullver;
 	PyObject *version;
 	PyObject *revision;
+	PyObject *version_key;
 	Py_ssize_t *suffixes;
 	long hash_val;
 } pkgcore_cpv;
@@ -92,8 +93,100 @@ pkgcore_cpv_get_cpvstr(pkgcore_cpv *self, void *closure)
 }
 
 
+/* append a length prefixed number, so longer numbers sort higher */
+static char *
+pkgcore_cpv_key_int(char *p, const char *digits, Py_ssize_t len)
+{
+	*p++ = (char)((len >> 8) & 0xff);
+	*p++ = (char)(len & 0xff);
+	memcpy(p, digits, len);
+	return p + len;
+}
+
+/*
+ * string sorting like the version and revision compare; identical to the
+ * keys generated by pkgcore.ebuild.cpv.native_version_key.
+ */
+static PyObject *
+pkgcore_cpv_get_version_key(pkgcore_cpv *self, void *closure)
+{
+	char *buf, *p, *s;
+	char num[32];
+	Py_ssize_t suffix_count = 0, x, len;
+	PyObject *rev;
+
+	if (self->version_key) {
+		Py_INCREF(self->version_key);
+		return self->version_key;
+	}
+	if (!self->version) {
+		Py_RETURN_NONE;
+	}
+	if (!(s = PyString_AsString(self->version)))
+		return NULL;
+	while (PKGCORE_EBUILD_SUFFIX_DEFAULT_SUF != self->suffixes[suffix_count * 2])
+		suffix_count++;
+
+	// each version component grows by 3 bytes at most; suffixes and the
+	// revision take a type byte, a length, and their digits.
+	if (self->revision && Py_None != self->revision)
+		rev = PyObject_Str(self->revision);
+	else
+		rev = PyString_FromString("0");
+	if (!rev)
+		return NULL;
+	buf = PyMem_Malloc(PyString_GET_SIZE(self->version) * 4 + 3 +
+		suffix_count * 32 + PyString_GET_SIZE(rev) + 2);
+	if (!buf) {
+		Py_DECREF(rev);
+		return PyErr_NoMemory();
+	}
+	p = buf;
+
+	while ('\0' != *s && '_' != *s && !isalpha(*s)) {
+		char *start = s;
+		while (isdigit(*s))
+			s++;
+		if ('0' == *start) {
+			// float comparison rules; trailing zeros don't matter.
+			char *end = s;
+			while (end > start && '0' == end[-1])
+				end--;
+			*p++ = '\x01';
+			memcpy(p, start, end - start);
+			p += end - start;
+			*p++ = '\0';
+		} else {
+			*p++ = '\x02';
+			p = pkgcore_cpv_key_int(p, start, s - start);
+		}
+		if ('.' == *s)
+			s++;
+	}
+	*p++ = '\0';
+	*p++ = isalpha(*s) ? *s : '\0';
+
+	for (x = 0; x < suffix_count * 2; x += 2) {
+		*p++ = (char)(self->suffixes[x] + 1);
+		len = PyOS_snprintf(num, sizeof(num), "%ld", (long)self->suffixes[x + 1]);
+		p = pkgcore_cpv_key_int(p, num, len);
+	}
+	*p++ = (char)(PKGCORE_EBUILD_SUFFIX_DEFAULT_SUF + 1);
+	p = pkgcore_cpv_key_int(p, PyString_AS_STRING(rev), PyString_GET_SIZE(rev));
+	Py_DECREF(rev);
+
+	self->version_key = PyString_FromStringAndSize(buf, p - buf);
+	PyMem_Free(buf);
+	if (!self->version_key)
+		return NULL;
+	Py_INCREF(self->version_key);
+	return self->version_key;
+}
+
+
 static PyGetSetDef pkgcore_cpv_getsetters[] = {
 snakeoil_GETSET(pkgcore_cpv, "cpvstr", cpvstr),
+	{"version_key", (getter)pkgcore_cpv_get_version_key, NULL, NULL},
 	{NULL}
 };
 
@@ -582,6 +675,7 @@ pkgcore_cpv_init(pkgcore_cpv *self, PyObject *args, PyObject *kwds)
 
 	if(!PyArg_UnpackTuple(args, "CPV", 1, 3, &category, &package, &fullver))
 		return -1;
+	Py_CLEAR(self->version_key);
 
 	if(!kwds) {
 		versioned = -1;
@@ -696,6 +790,7 @@ cleanup:
 	Py_CLEAR(self->version);
 	Py_CLEAR(self->revision);
 	Py_CLEAR(self->fullver);
+	Py_CLEAR(self->version_key);
 
 	if(NULL != self->suffixes) {
 		// if we're not using the communal val...
@@ -717,6 +812,7 @@ pkgcore_cpv_dealloc(pkgcore_cpv *self)
 	Py_CLEAR(self->version);
 	Py_CLEAR(self->revision);
 	Py_CLEAR(self->fullver);
+	Py_CLEAR(self->version_key);
 
 	if(NULL != self->suffixes) {
 		if(PKGCORE_EBUILD_SUFFIX_DEFAULT_SUF != self->suffixes[0]) {